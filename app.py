@@ -1,10 +1,17 @@
+import hashlib
+import json
 import os
 import uuid
+from urllib.parse import quote
 from flask import Flask, request, jsonify, send_file, render_template, redirect
 from flask_cors import CORS
+from werkzeug.utils import secure_filename, send_file as werkzeug_send_file
 from config import Config
-from tasks import process_video_task, get_task_status, task_status_storage, cancel_task
-from celery.result import AsyncResult
+# Only the thin client: the ML / download stack is loaded by the Celery worker (tasks.py)
+from task_client import (submit_video_task, submit_playlist_expansion, get_task_status, get_task_status_blobs, cancel_task,
+                         update_task_status, redis_client, storage_manager, batch_manager, start_batch,
+                         count_ready_workers, get_autoscaler_metrics, NOT_FOUND_STATUS, JOB_MODES, SUBTITLE_FORMATS)
+from upload_manager import UploadManager, UploadError, SESSION_TTL
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -14,6 +21,9 @@ CORS(app)
 # Track active connections for each task
 active_connections = {}
 
+# Resumable uploads are written straight into each task's temp directory
+upload_manager = UploadManager(redis_client, Config.UPLOAD_FOLDER, Config.MAX_CONTENT_LENGTH)
+
 
 # Add no-cache headers to all responses
 @app.after_request
@@ -47,7 +57,7 @@ def simple_interface():
         task_id = str(uuid.uuid4())
         
         # Start processing
-        process_video_task.delay(video_url, task_id)
+        submit_video_task(video_url, task_id)
         
         # Redirect to status page
         return redirect(f'/simple/status/{task_id}')
@@ -68,6 +78,37 @@ def simple_status(task_id):
                          output_file=status.get('output_file'))
 
 
+def parse_job_options(data: dict):
+    """Validate job mode and subtitle formats; returns (mode, formats, error)"""
+    # Job mode: 'video' (burned-in subtitles) or 'subtitles' (subtitle files only)
+    mode = data.get('mode', 'video')
+    if mode not in JOB_MODES:
+        return None, None, f'حالت پردازش نامعتبر است (Invalid mode, expected one of: {", ".join(JOB_MODES)})'
+    
+    formats = data.get('formats') or list(SUBTITLE_FORMATS)
+    if not isinstance(formats, list) or any(fmt not in SUBTITLE_FORMATS for fmt in formats):
+        return None, None, f'فرمت زیرنویس نامعتبر است (Invalid formats, expected: {", ".join(SUBTITLE_FORMATS)})'
+    
+    return mode, formats, None
+
+
+def parse_languages(data: dict):
+    """Validate target languages ('languages': [...] or 'language': 'xx'); returns (languages, error)"""
+    languages = data.get('languages') or data.get('language') or [Config.DEFAULT_TARGET_LANGUAGE]
+    if isinstance(languages, str):
+        languages = [languages]
+    
+    if not isinstance(languages, list) or any(code not in Config.SUPPORTED_LANGUAGES for code in languages):
+        return None, f'زبان نامعتبر است (Invalid language, expected: {", ".join(Config.SUPPORTED_LANGUAGES)})'
+    
+    # Keep order, drop duplicates
+    languages = list(dict.fromkeys(languages))
+    if len(languages) > Config.MAX_TARGET_LANGUAGES:
+        return None, f'حداکثر {Config.MAX_TARGET_LANGUAGES} زبان (Too many languages)'
+    
+    return languages, None
+
+
 @app.route('/api/process', methods=['POST'])
 def process_video():
     """Start video processing"""
@@ -88,15 +129,26 @@ def process_video():
                 'error': 'آدرس ویدئو نامعتبر است (Invalid video URL)'
             }), 400
         
+        mode, formats, error = parse_job_options(data)
+        if not error:
+            languages, error = parse_languages(data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
         # Generate unique task ID
         task_id = str(uuid.uuid4())
         
-        # Start background task
-        process_video_task.delay(url, task_id)
+        # Start background task (download and transcription run once for all languages)
+        if mode == 'subtitles':
+            submit_video_task(url, task_id, mode, formats, languages=languages)
+        else:
+            submit_video_task(url, task_id, languages=languages)
         
         return jsonify({
             'success': True,
             'task_id': task_id,
+            'mode': mode,
+            'languages': languages,
             'message': 'پردازش شروع شد (Processing started)'
         })
     
@@ -107,15 +159,292 @@ def process_video():
         }), 500
 
 
+@app.route('/api/batch', methods=['POST'])
+def process_batch():
+    """Start a batch from a list of URLs or a playlist URL, with a concurrency cap"""
+    try:
+        data = request.get_json() or {}
+        urls = data.get('urls')
+        playlist_url = data.get('playlist_url')
+        
+        if not urls and not playlist_url:
+            return jsonify({
+                'success': False,
+                'error': 'لطفاً فهرست آدرس‌ها یا آدرس پلی‌لیست را وارد کنید (Provide urls or playlist_url)'
+            }), 400
+        
+        candidates = urls if urls else [playlist_url]
+        if not isinstance(candidates, list) or not all(
+                isinstance(url, str) and url.startswith(('http://', 'https://')) for url in candidates):
+            return jsonify({
+                'success': False,
+                'error': 'آدرس ویدئو نامعتبر است (Invalid video URL)'
+            }), 400
+        
+        if urls and len(urls) > Config.BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'حداکثر {Config.BATCH_MAX_ITEMS} ویدئو در هر دسته (Too many URLs)'
+            }), 400
+        
+        mode, formats, error = parse_job_options(data)
+        if not error:
+            languages, error = parse_languages(data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        try:
+            max_concurrency = int(data.get('max_concurrency', Config.BATCH_DEFAULT_CONCURRENCY))
+        except (TypeError, ValueError):
+            max_concurrency = Config.BATCH_DEFAULT_CONCURRENCY
+        max_concurrency = max(1, min(max_concurrency, Config.BATCH_MAX_CONCURRENCY))
+        
+        batch_id = batch_manager.create(
+            max_concurrency,
+            mode=mode,
+            formats=formats if mode == 'subtitles' else None,
+            source=playlist_url,
+            languages=languages
+        )
+        
+        if urls:
+            task_ids = start_batch(batch_id, urls)
+        else:
+            # Playlist expansion talks to the site, so it runs on a worker
+            batch_manager.set_state(batch_id, 'expanding')
+            submit_playlist_expansion(batch_id, playlist_url)
+            task_ids = []
+        
+        return jsonify({
+            'success': True,
+            'batch_id': batch_id,
+            'task_ids': task_ids,
+            'max_concurrency': max_concurrency,
+            'message': 'پردازش دسته‌ای شروع شد (Batch started)'
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'خطای سیستمی: {str(e)}'
+        }), 500
+
+
+@app.route('/api/batch/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Aggregate status of a batch: done, failed, in progress and ETA"""
+    try:
+        status = batch_manager.status(batch_id)
+        
+        if not status:
+            return jsonify({
+                'state': 'not_found',
+                'message': 'Batch not found'
+            }), 404
+        
+        return jsonify(status)
+    
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'خطا در دریافت وضعیت: {str(e)}'
+        }), 500
+
+
+@app.route('/api/upload', methods=['POST'])
+def create_upload():
+    """Start a resumable upload of a local video file"""
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            size = int(data.get('size', 0))
+        except (TypeError, ValueError):
+            size = 0
+        
+        mode, formats, error = parse_job_options(data)
+        if not error:
+            languages, error = parse_languages(data)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        
+        task_id = str(uuid.uuid4())
+        session = upload_manager.create(
+            task_id,
+            data.get('filename'),
+            size,
+            mode=mode,
+            formats=','.join(formats),
+            languages=','.join(languages)
+        )
+        # Index the temp dir now so an abandoned upload is cleaned up with its session
+        storage_manager.register(os.path.dirname(session['path']), task_id,
+                                 retention_seconds=SESSION_TTL, enforce_quota=False)
+        update_task_status(task_id, 'uploading', 'در حال آپلود فایل...', 0, mode=mode)
+        
+        return jsonify({
+            'success': True,
+            'task_id': task_id,
+            'upload_url': f'/api/upload/{task_id}',
+            'offset': 0,
+            'size': size
+        })
+    
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status_code
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'خطای سیستمی: {str(e)}'
+        }), 500
+
+
+@app.route('/api/upload/<task_id>', methods=['GET', 'HEAD'])
+def upload_offset(task_id):
+    """Return how many bytes of an upload have been received (resume point)"""
+    session = upload_manager.get(task_id)
+    
+    if not session:
+        return jsonify({
+            'success': False,
+            'error': 'آپلود یافت نشد (Upload not found)'
+        }), 404
+    
+    response = jsonify({
+        'success': True,
+        'task_id': task_id,
+        'offset': session['offset'],
+        'size': session['size'],
+        'complete': session['complete']
+    })
+    response.headers['Upload-Offset'] = str(session['offset'])
+    return response
+
+
+@app.route('/api/upload/<task_id>', methods=['PUT', 'PATCH'])
+def upload_chunk(task_id):
+    """Append one chunk at the given offset (?offset=N or Upload-Offset header)"""
+    try:
+        offset = request.args.get('offset', request.headers.get('Upload-Offset'))
+        if offset is None or not str(offset).isdigit():
+            return jsonify({
+                'success': False,
+                'error': 'Missing or invalid upload offset'
+            }), 400
+        
+        # Streamed in fixed-size reads; the body is never buffered in memory
+        session = upload_manager.write_chunk(
+            task_id,
+            int(offset),
+            request.stream,
+            request.content_length
+        )
+        
+        if session['complete']:
+            # Whole file received: process it, skipping the download stage
+            formats = session.get('formats', '').split(',') if session.get('formats') else None
+            languages = session.get('languages', '').split(',') if session.get('languages') else None
+            submit_video_task(None, task_id, session.get('mode', 'video'), formats, session['path'],
+                              languages=languages)
+            update_task_status(task_id, 'started', 'آپلود کامل شد، در صف پردازش', 0, mode=session.get('mode', 'video'))
+        else:
+            progress = int(session['offset'] * 100 / session['size'])
+            update_task_status(task_id, 'uploading', f'در حال آپلود فایل... {progress}%', 0, mode=session.get('mode', 'video'))
+        
+        response = jsonify({
+            'success': True,
+            'task_id': task_id,
+            'offset': session['offset'],
+            'size': session['size'],
+            'complete': session['complete']
+        })
+        response.headers['Upload-Offset'] = str(session['offset'])
+        return response
+    
+    except UploadError as e:
+        response = jsonify({'success': False, 'error': str(e), 'offset': e.offset})
+        if e.offset is not None:
+            response.headers['Upload-Offset'] = str(e.offset)
+        return response, e.status_code
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'خطا در آپلود فایل: {str(e)}'
+        }), 500
+
+
+def parse_field_list(value: str) -> list:
+    """'a, b,c' -> ['a', 'b', 'c']"""
+    return [field.strip() for field in (value or '').split(',') if field.strip()]
+
+
+def select_fields(status: dict, fields: list, exclude: list) -> dict:
+    """Keep only `fields` (all when empty), then drop `exclude`"""
+    if fields:
+        status = {key: value for key, value in status.items() if key in fields}
+    return {key: value for key, value in status.items() if key not in exclude}
+
+
+def conditional_status_response(task_ids: list, build):
+    """JSON of the statuses of task_ids, or 304 when If-None-Match still matches
+
+    The ETag hashes the raw Redis values together with the field selection, so an
+    unchanged poll costs one MGET and no JSON parsing or serialisation.
+    build turns the list of (selected) statuses into the response body.
+    """
+    fields = parse_field_list(request.args.get('fields'))
+    exclude = parse_field_list(request.args.get('exclude'))
+    blobs = get_task_status_blobs(task_ids)
+
+    digest = hashlib.sha1()
+    for part in [','.join(fields), ','.join(exclude), *task_ids, *(blob or '' for blob in blobs)]:
+        digest.update(part.encode('utf-8') + b'\0')
+    etag = digest.hexdigest()
+
+    # Track that these connections are still alive
+    for task_id in task_ids:
+        active_connections[task_id] = True
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        statuses = [select_fields(json.loads(blob) if blob else dict(NOT_FOUND_STATUS), fields, exclude)
+                    for blob in blobs]
+        response = jsonify(build(statuses))
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/api/status', methods=['GET'])
+def check_statuses():
+    """Status of many tasks at once (?ids=a,b,c), with ETag and field selection"""
+    task_ids = list(dict.fromkeys(parse_field_list(','.join(request.args.getlist('ids')))))
+    if not task_ids:
+        return jsonify({'success': False, 'error': 'شناسه تسک ارسال نشده است (ids is required)'}), 400
+    if len(task_ids) > Config.STATUS_MAX_IDS:
+        return jsonify({
+            'success': False,
+            'error': f'حداکثر {Config.STATUS_MAX_IDS} تسک در هر درخواست (Too many ids, max {Config.STATUS_MAX_IDS})'
+        }), 400
+    
+    try:
+        return conditional_status_response(
+            task_ids, lambda statuses: {'success': True, 'statuses': dict(zip(task_ids, statuses))})
+    
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'خطا در دریافت وضعیت: {str(e)}'
+        }), 500
+
+
 @app.route('/api/status/<task_id>', methods=['GET'])
 def check_status(task_id):
     """Check processing status"""
     try:
-        # Track that this connection is still alive
-        active_connections[task_id] = True
-        
-        status = get_task_status(task_id)
-        return jsonify(status)
+        return conditional_status_response([task_id], lambda statuses: statuses[0])
     
     except Exception as e:
         return jsonify({
@@ -132,7 +461,16 @@ def cancel_video_task(task_id):
         active_connections.pop(task_id, None)
         
         # Cancel the task
-        result = cancel_task(task_id)
+        if not cancel_task(task_id):
+            if get_task_status(task_id).get('status') == 'not_found':
+                return jsonify({
+                    'success': False,
+                    'error': 'تسک یافت نشد (Task not found)'
+                }), 404
+            return jsonify({
+                'success': False,
+                'error': 'تسک قابل لغو نیست (Task already finished or not started)'
+            }), 409
         
         return jsonify({
             'success': True,
@@ -146,6 +484,27 @@ def cancel_video_task(task_id):
         }), 500
 
 
+def send_output_file(file_path: str, **kwargs):
+    """send_file for a file under OUTPUT_FOLDER, offloaded to the front proxy when configured
+    
+    Under gunicorn a plain send_file response goes out with os.sendfile. With SENDFILE_OFFLOAD
+    the response only names the file (X-Sendfile / X-Accel-Redirect) and the proxy streams it,
+    so a slow download holds no worker thread.
+    """
+    if Config.SENDFILE_OFFLOAD not in ('x-sendfile', 'x-accel'):
+        return send_file(file_path, **kwargs)
+    
+    kwargs.setdefault('max_age', app.get_send_file_max_age)
+    response = werkzeug_send_file(os.path.abspath(file_path), request.environ, use_x_sendfile=True,
+                                  response_class=app.response_class, **kwargs)
+    # Absent on 304 responses
+    if Config.SENDFILE_OFFLOAD == 'x-accel' and 'X-Sendfile' in response.headers:
+        relative = os.path.relpath(response.headers.pop('X-Sendfile'), Config.OUTPUT_FOLDER)
+        response.headers['X-Accel-Redirect'] = (Config.ACCEL_REDIRECT_PREFIX.rstrip('/') + '/'
+                                                + quote(relative.replace(os.sep, '/')))
+    return response
+
+
 @app.route('/api/download/<filename>', methods=['GET'])
 def download_file(filename):
     """Download processed video"""
@@ -158,8 +517,58 @@ def download_file(filename):
                 'error': 'فایل یافت نشد (File not found)'
             }), 404
         
-        return send_file(
+        storage_manager.touch(file_path)
+        
+        return send_output_file(
+            file_path,
+            as_attachment=True,
+            download_name=filename
+        )
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'خطا در دانلود فایل: {str(e)}'
+        }), 500
+
+
+@app.route('/api/subtitles/<task_id>/<fmt>', methods=['GET'])
+def download_subtitles(task_id, fmt):
+    """Download a subtitle file (srt/ass/vtt) produced by a subtitles-only job (?lang= picks a language)"""
+    try:
+        status = get_task_status(task_id)
+        lang = request.args.get('lang')
+        if lang and status.get('subtitle_tracks'):
+            files = status['subtitle_tracks'].get(lang) or {}
+        else:
+            files = status.get('subtitle_files') or {}
+        filename = files.get(fmt)
+        
+        if not filename:
+            return jsonify({
+                'success': False,
+                'error': 'زیرنویس یافت نشد (Subtitle not found)'
+            }), 404
+        
+        file_path = os.path.join(Config.OUTPUT_FOLDER, filename)
+        
+        if not os.path.exists(file_path):
+            return jsonify({
+                'success': False,
+                'error': 'فایل یافت نشد (File not found)'
+            }), 404
+        
+        storage_manager.touch(file_path)
+        
+        mimetypes = {
+            'srt': 'application/x-subrip',
+            'ass': 'text/x-ssa',
+            'vtt': 'text/vtt'
+        }
+        
+        return send_output_file(
             file_path,
+            mimetype=mimetypes.get(fmt, 'text/plain'),
             as_attachment=True,
             download_name=filename
         )
@@ -171,21 +580,52 @@ def download_file(filename):
         }), 500
 
 
+@app.route('/api/trace/<task_id>', methods=['GET'])
+def download_trace(task_id):
+    """Chrome trace of a job's stages (open in chrome://tracing or ui.perfetto.dev)"""
+    if not Config.TRACE_FOLDER:
+        return jsonify({'success': False, 'error': 'Tracing is disabled'}), 404
+    
+    file_path = os.path.join(Config.TRACE_FOLDER, f'{secure_filename(task_id)}.json')
+    if not os.path.exists(file_path):
+        return jsonify({
+            'success': False,
+            'error': 'فایل یافت نشد (File not found)'
+        }), 404
+    
+    return send_file(file_path, mimetype='application/json', as_attachment=True,
+                     download_name=f'trace-{task_id}.json')
+
+
 @app.route('/api/preview/<filename>', methods=['GET'])
 def preview_file(filename):
-    """Stream video for preview"""
+    """Stream video for preview
+    
+    Also accepts a task_id: serves the final video once it exists, and the
+    low-resolution preview proxy while the full burn is still running.
+    """
     try:
         file_path = os.path.join(Config.OUTPUT_FOLDER, filename)
         
+        if not os.path.exists(file_path) and '.' not in filename:
+            status = get_task_status(filename)
+            rendition_file = status.get('output_file') or status.get('preview_file')
+            if rendition_file:
+                filename = rendition_file
+                file_path = os.path.join(Config.OUTPUT_FOLDER, rendition_file)
+        
         if not os.path.exists(file_path):
             return jsonify({
                 'success': False,
                 'error': 'فایل یافت نشد (File not found)'
             }), 404
         
-        return send_file(
+        storage_manager.touch(file_path)
+        
+        # Multi-language jobs produce an MKV with soft subtitle tracks
+        return send_output_file(
             file_path,
-            mimetype='video/mp4'
+            mimetype='video/x-matroska' if filename.endswith('.mkv') else 'video/mp4'
         )
     
     except Exception as e:
@@ -195,6 +635,25 @@ def preview_file(filename):
         }), 500
 
 
+@app.route('/api/hls/<task_id>/<name>', methods=['GET'])
+def hls_file(task_id, name):
+    """HLS playlist (index.m3u8) and segments of a video that may still be encoding"""
+    hls_dir = os.path.join(Config.OUTPUT_FOLDER, f'{secure_filename(task_id)}_hls')
+    file_path = os.path.join(hls_dir, secure_filename(name))
+    
+    if not name.endswith(('.m3u8', '.ts')) or not os.path.exists(file_path):
+        return jsonify({
+            'success': False,
+            'error': 'فایل یافت نشد (File not found)'
+        }), 404
+    
+    if name.endswith('.m3u8'):
+        storage_manager.touch(hls_dir)
+        # The playlist grows while ffmpeg runs: never serve a cached copy
+        return send_output_file(file_path, mimetype='application/vnd.apple.mpegurl', max_age=0)
+    return send_output_file(file_path, mimetype='video/mp2t', conditional=True)
+
+
 @app.route('/api/delete/<filename>', methods=['DELETE'])
 def delete_file(filename):
     """Delete processed video from server"""
@@ -207,7 +666,9 @@ def delete_file(filename):
                 'error': 'فایل یافت نشد (File not found)'
             }), 404
         
-        os.remove(file_path)
+        # Keep the storage index in sync
+        if not storage_manager.remove(file_path):
+            os.remove(file_path)
         
         return jsonify({
             'success': True,
@@ -221,16 +682,35 @@ def delete_file(filename):
         }), 500
 
 
+@app.route('/api/autoscaler', methods=['GET'])
+def autoscaler_metrics():
+    """Recent worker-pool scaling decisions (?limit=50) and counts per action"""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'پارامتر limit نامعتبر است (Invalid limit)'}), 400
+    
+    return jsonify({'success': True, **get_autoscaler_metrics(limit)})
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (workers_ready = warmed-up worker processes)"""
+    try:
+        workers_ready = count_ready_workers()
+    except Exception:
+        workers_ready = None
+    
     return jsonify({
         'status': 'healthy',
-        'service': 'AI Video Subtitler'
+        'service': 'AI Video Subtitler',
+        'workers_ready': workers_ready,
+        'ready': bool(workers_ready)
     })
 
 
 if __name__ == '__main__':
+    # Development server; production: gunicorn -c gunicorn.conf.py
     app.run(
         host=Config.HOST,
         port=Config.PORT,
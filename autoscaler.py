@@ -0,0 +1,188 @@
+"""
+Celery pool autoscaler driven by the Redis queue depth and the stage mix of running jobs
+Enabled with `celery -A tasks worker --autoscale=MAX,MIN`; tasks.py sets
+worker_autoscaler to QueueDepthAutoscaler. The built-in autoscaler only counts jobs
+this worker has already reserved, so a backlog still in the broker is invisible to it.
+
+Policy (every second):
+- wanted processes = jobs this worker holds + jobs waiting in the broker queue,
+  between the --autoscale bounds (AUTOSCALE_MIN_WORKERS / AUTOSCALE_MAX_WORKERS
+  in the start scripts)
+- no scale-up while AUTOSCALE_CPU_SLOTS jobs are in CPU-bound stages (Whisper,
+  burn): more processes would only compete for the same cores
+- scale-down waits AUTOSCALE_KEEPALIVE seconds after the last change, and only
+  idle processes are removed
+
+Every decision that differs from the previous one is logged and pushed to Redis
+(task_client.get_autoscaler_metrics, GET /api/autoscaler).
+"""
+
+import json
+import socket
+from datetime import datetime
+from time import monotonic
+
+from celery.worker import state
+from celery.worker.autoscale import Autoscaler
+
+from config import Config
+from task_client import (redis_client, AUTOSCALER_DECISIONS_KEY, AUTOSCALER_COUNTERS_KEY,
+                         AUTOSCALER_MAX_DECISIONS)
+from tracing import get_logger
+
+log = get_logger('autoscaler')
+
+# Stages that keep every core busy (Whisper subprocess, ffmpeg encodes)
+CPU_STAGES = ('transcribing', 'burning_subtitles')
+
+# kombu's Redis transport keeps one list per priority step: 'celery', 'celery\x06\x163', ...
+_PRIORITY_SEPARATOR = '\x06\x16'
+_PRIORITY_STEPS = (3, 6, 9)
+
+
+def queue_keys(queue: str) -> list:
+    return [queue] + [f'{queue}{_PRIORITY_SEPARATOR}{priority}' for priority in _PRIORITY_STEPS]
+
+
+def desired_processes(reserved: int, queued: int, cpu_busy: int, processes: int,
+                      min_processes: int, max_processes: int, cpu_slots: int) -> tuple:
+    """Target pool size and the reason for it: (target, reason)"""
+    target = min(reserved + queued, max_processes)
+    reason = 'demand'
+    if target > processes and cpu_busy >= cpu_slots:
+        target = processes
+        reason = 'cpu_saturated'
+    if target < min_processes:
+        target, reason = min_processes, 'min'
+    return target, reason
+
+
+class QueueDepthAutoscaler(Autoscaler):
+    """Grows / shrinks the prefork pool from broker queue depth and job stages
+
+    The consumer's prefetch follows the pool size (one job per process), so jobs
+    beyond that stay in the broker where every worker can see and take them.
+    """
+
+    def __init__(self, pool, max_concurrency, min_concurrency=0, worker=None,
+                 keepalive=None, mutex=None):
+        super().__init__(pool, max_concurrency, min_concurrency, worker=worker,
+                         keepalive=keepalive or Config.AUTOSCALE_KEEPALIVE, mutex=mutex)
+        app = worker.app if worker is not None else None
+        self.queue = app.conf.task_default_queue if app is not None else 'celery'
+        self.cpu_slots = Config.AUTOSCALE_CPU_SLOTS
+        self.hostname = getattr(worker, 'hostname', None) or socket.gethostname()
+        # Scale-down waits for keepalive after startup too, not only after a scale-up
+        self._last_change = monotonic()
+        self._last_decision = None
+        self._prefetch_synced = False
+
+    def queue_depth(self) -> int:
+        """Jobs waiting in the broker (not yet reserved by any worker)"""
+        pipe = redis_client.pipeline()
+        for key in queue_keys(self.queue):
+            pipe.llen(key)
+        return sum(pipe.execute())
+
+    def running_stages(self) -> list:
+        """Current stage of every job this worker is executing"""
+        task_ids = []
+        for request in list(state.active_requests):
+            args = request.args or ()
+            if request.name == 'tasks.process_video_task' and len(args) > 1:
+                task_ids.append(args[1])
+        if not task_ids:
+            return []
+        statuses = redis_client.mget([f'task_status:{task_id}' for task_id in task_ids])
+        return [json.loads(status).get('status') if status else None for status in statuses]
+
+    def _maybe_scale(self, req=None):
+        # Celery starts the consumer with prefetch for max_concurrency processes
+        if not self._prefetch_synced and self._update_prefetch(self.processes - self.max_concurrency):
+            self._prefetch_synced = True
+
+        try:
+            queued = self.queue_depth()
+            stages = self.running_stages()
+        except Exception as e:
+            # Without Redis fall back to Celery's own reserved-request count
+            log.warning('Autoscaler cannot read Redis', error=str(e))
+            return super()._maybe_scale(req)
+
+        reserved = len(state.reserved_requests)  # Received by this worker, running or not
+        cpu_busy = sum(1 for stage in stages if stage in CPU_STAGES)
+        processes = self.processes
+        target, reason = desired_processes(reserved, queued, cpu_busy, processes,
+                                           self.min_concurrency, self.max_concurrency, self.cpu_slots)
+
+        action = 'hold'
+        if target > processes:
+            self.scale_up(target - processes)
+        elif target < processes and not self.scale_down(processes - target):
+            action = 'scale_down_deferred'
+
+        # Shrinking skips busy processes, so use the size the pool actually reached
+        changed = self.processes - processes
+        if changed:
+            self._update_prefetch(changed)
+            action = 'scale_up' if changed > 0 else 'scale_down'
+        elif target < processes and action == 'hold':
+            action = 'scale_down_blocked'
+
+        self._record({
+            'action': action,
+            'reason': reason,
+            'processes': processes,
+            'target': target,
+            'queued': queued,
+            'reserved': reserved,
+            'running': len(state.active_requests),
+            'cpu_busy': cpu_busy,
+            'stages': {stage: stages.count(stage) for stage in set(stages) if stage},
+        })
+        return bool(changed)
+
+    def scale_up(self, n):
+        self._last_change = monotonic()
+        return super().scale_up(n)
+
+    def scale_down(self, n) -> bool:
+        """Shrink by up to n idle processes, once keepalive has passed since the last change"""
+        if monotonic() - self._last_change <= self.keepalive:
+            return False
+        self._last_change = monotonic()
+        self._shrink(n)
+        return True
+
+    def _update_prefetch(self, delta: int) -> bool:
+        """Move the consumer's prefetch by delta processes (False until the consumer is up)"""
+        consumer = getattr(self.worker, 'consumer', None)
+        if consumer is None or getattr(consumer, 'qos', None) is None:
+            return False
+        if delta:
+            consumer._update_prefetch_count(delta)
+        return True
+
+    def _record(self, decision: dict):
+        """Log and store a decision unless it repeats the previous one"""
+        key = (decision['action'], decision['reason'], decision['processes'], decision['target'])
+        if key == self._last_decision:
+            return
+        self._last_decision = key
+
+        log.info('Autoscaler decision', **decision)
+        entry = json.dumps({'time': datetime.utcnow().isoformat(), 'hostname': self.hostname, **decision})
+        try:
+            pipe = redis_client.pipeline()
+            pipe.lpush(AUTOSCALER_DECISIONS_KEY, entry)
+            pipe.ltrim(AUTOSCALER_DECISIONS_KEY, 0, AUTOSCALER_MAX_DECISIONS - 1)
+            pipe.hincrby(AUTOSCALER_COUNTERS_KEY, decision['action'], 1)
+            pipe.execute()
+        except Exception as e:
+            log.warning('Could not record autoscaler decision', error=str(e))
+
+    def info(self):
+        info = super().info()
+        info['queued'] = self.queue_depth()
+        info['last_decision'] = self._last_decision
+        return info
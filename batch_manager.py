@@ -0,0 +1,193 @@
+"""
+Batch / playlist submission with bounded fan-out
+A batch keeps its pending items in Redis and only runs `max_concurrency` of them at a time;
+each finished item pulls the next one, so a 200-video playlist never floods the queue.
+"""
+
+import json
+import math
+import time
+import uuid
+
+from tracing import get_logger
+
+log = get_logger('batch_manager')
+
+# Batch data lives as long as task status
+BATCH_TTL = 86400
+
+# Pop pending items while fewer than max_concurrency are running
+DISPATCH_SCRIPT = """
+local cap = tonumber(redis.call('HGET', KEYS[1], 'max_concurrency') or '1')
+local running = tonumber(redis.call('HGET', KEYS[1], 'running') or '0')
+local items = {}
+while running < cap do
+    local item = redis.call('LPOP', KEYS[2])
+    if not item then
+        break
+    end
+    running = running + 1
+    table.insert(items, item)
+end
+redis.call('HSET', KEYS[1], 'running', running)
+return items
+"""
+
+# Release one running slot (never below zero)
+FINISH_SCRIPT = """
+local running = tonumber(redis.call('HGET', KEYS[1], 'running') or '0')
+if running > 0 then
+    running = running - 1
+    redis.call('HSET', KEYS[1], 'running', running)
+end
+return running
+"""
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class BatchManager:
+    """Stores batches in Redis and fans their items out through `submit`
+
+    submit(url, task_id, mode, formats, batch_id, languages) starts one job.
+    """
+
+    def __init__(self, redis_client, submit=None):
+        self.redis = redis_client
+        self.submit = submit
+        self._dispatch = redis_client.register_script(DISPATCH_SCRIPT)
+        self._finish = redis_client.register_script(FINISH_SCRIPT)
+
+    def _key(self, batch_id: str) -> str:
+        return f'batch:{batch_id}'
+
+    def create(self, max_concurrency: int, mode: str = 'video', formats: list = None,
+               source: str = None, languages: list = None) -> str:
+        """Create an empty batch and return its id"""
+        batch_id = str(uuid.uuid4())
+        key = self._key(batch_id)
+        self.redis.hset(key, mapping={
+            'max_concurrency': max_concurrency,
+            'running': 0,
+            'mode': mode,
+            'formats': ','.join(formats or []),
+            'languages': ','.join(languages or []),
+            'source': source or '',
+            'state': 'created',
+            'created_at': time.time(),
+        })
+        self.redis.expire(key, BATCH_TTL)
+        return batch_id
+
+    def add_items(self, batch_id: str, urls: list) -> list:
+        """Queue URLs in the batch; returns the task id assigned to each"""
+        key = self._key(batch_id)
+        items = [{'task_id': str(uuid.uuid4()), 'url': url} for url in urls]
+
+        if items:
+            pipe = self.redis.pipeline()
+            pipe.rpush(f'{key}:pending', *[json.dumps(item) for item in items])
+            pipe.rpush(f'{key}:tasks', *[item['task_id'] for item in items])
+            pipe.hset(key, 'state', 'running')
+            pipe.expire(f'{key}:pending', BATCH_TTL)
+            pipe.expire(f'{key}:tasks', BATCH_TTL)
+            pipe.execute()
+
+        return [item['task_id'] for item in items]
+
+    def set_state(self, batch_id: str, state: str, **fields):
+        self.redis.hset(self._key(batch_id), mapping={'state': state, **fields})
+
+    def dispatch(self, batch_id: str) -> int:
+        """Start as many pending items as the concurrency cap allows"""
+        key = self._key(batch_id)
+        info = self.redis.hgetall(key)
+        if not info:
+            return 0
+
+        formats = info.get('formats', '').split(',') if info.get('formats') else None
+        languages = info.get('languages', '').split(',') if info.get('languages') else None
+        started = 0
+        for raw in self._dispatch(keys=[key, f'{key}:pending']):
+            item = json.loads(raw)
+            try:
+                self.submit(item['url'], item['task_id'], info.get('mode', 'video'), formats, batch_id, languages)
+                started += 1
+            except Exception as e:
+                log.warning('Could not start batch item', batch_id=batch_id, task_id=item['task_id'], error=str(e))
+                self._finish(keys=[key])
+        return started
+
+    def item_finished(self, batch_id: str) -> int:
+        """Release the slot of a finished item and start the next ones"""
+        self._finish(keys=[self._key(batch_id)])
+        return self.dispatch(batch_id)
+
+    def status(self, batch_id: str) -> dict:
+        """Aggregate status of every item: counts, progress and ETA"""
+        key = self._key(batch_id)
+        info = self.redis.hgetall(key)
+        if not info:
+            return None
+
+        task_ids = self.redis.lrange(f'{key}:tasks', 0, -1)
+        raw_statuses = self.redis.mget([f'task_status:{task_id}' for task_id in task_ids]) if task_ids else []
+
+        counts = {'completed': 0, 'failed': 0, 'in_progress': 0, 'queued': 0}
+        durations = []
+        items = []
+        for task_id, raw in zip(task_ids, raw_statuses):
+            status = json.loads(raw) if raw else {'status': 'queued', 'progress': 0}
+            state = status.get('status')
+
+            if state == 'completed':
+                counts['completed'] += 1
+                duration = (status.get('timing') or {}).get('total_duration')
+                if duration:
+                    durations.append(duration)
+            elif state in ('failed', 'cancelled'):
+                counts['failed'] += 1
+            elif state in ('queued', 'not_found'):
+                counts['queued'] += 1
+            else:
+                counts['in_progress'] += 1
+
+            items.append({
+                'task_id': task_id,
+                'status': state,
+                'progress': status.get('progress', 0),
+                'output_file': status.get('output_file'),
+                'subtitle_files': status.get('subtitle_files'),
+            })
+
+        total = len(task_ids)
+        done = counts['completed'] + counts['failed']
+        remaining = total - done
+        max_concurrency = int(info.get('max_concurrency', 1))
+
+        # ETA: average job time so far, spread over the concurrency slots
+        eta_seconds = None
+        if remaining == 0:
+            eta_seconds = 0
+        elif durations:
+            average = sum(durations) / len(durations)
+            eta_seconds = round(average * math.ceil(remaining / max(1, min(max_concurrency, remaining))))
+
+        state = info.get('state', 'running')
+        if state == 'running' and total and remaining == 0:
+            state = 'completed'
+
+        return {
+            'batch_id': batch_id,
+            'state': state,
+            'error': info.get('error') or None,
+            'total': total,
+            'done': counts['completed'],
+            'failed': counts['failed'],
+            'in_progress': counts['in_progress'],
+            'queued': counts['queued'],
+            'progress': round(done * 100 / total) if total else 0,
+            'max_concurrency': max_concurrency,
+            'eta_seconds': eta_seconds,
+            'items': items,
+        }
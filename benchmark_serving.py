@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Status latency while large downloads are in progress: development server vs gunicorn
+Runs the app (stubbed Redis / Celery, see loadtest.py) on the threaded Werkzeug server
+that `python app.py` uses and on the production profile (gunicorn.conf.py). For each,
+status pollers measure /api/status/<id> and /api/status?ids= latency first on an idle
+server, then while --downloaders connections download --file-mb output files back to back.
+
+Reports p50 / p99 status latency per phase and the download throughput, and checks that
+under gunicorn the status p99 during downloads stays below --max-p99-ms.
+
+Usage: python benchmark_serving.py [--downloaders 16] [--file-mb 512] [--duration 10]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import loadtest
+
+STATUS_ROUTES = ('GET /api/status/<id>', 'GET /api/status?ids')
+
+
+def check(name: str, ok: bool, detail: str = '') -> bool:
+    symbol = "✅" if ok else "❌"
+    print(f"{symbol} {name}" + (f": {detail}" if detail else ''))
+    return ok
+
+
+def poll(job) -> dict:
+    """Poller process: one keep-alive session per task, alternating the two status routes"""
+    port, task_ids, start, deadline, interval = job
+    samples, errors = defaultdict(list), defaultdict(int)
+    client = loadtest.Client('127.0.0.1', port, samples, errors)
+    bulk_ids = ','.join(task_ids)
+    time.sleep(max(0.0, start - time.time()))
+    while time.time() < deadline:
+        for task_id in task_ids:
+            client.request('GET /api/status/<id>', 'GET', f'/api/status/{task_id}')
+        client.request('GET /api/status?ids', 'GET', f'/api/status?ids={bulk_ids}')
+        time.sleep(interval)
+    return {'samples': dict(samples), 'errors': dict(errors)}
+
+
+def download(job) -> dict:
+    """Downloader process: back-to-back downloads of the large output files"""
+    port, filenames, start, deadline = job
+    samples, errors = defaultdict(list), defaultdict(int)
+    client = loadtest.Client('127.0.0.1', port, samples, errors)
+    time.sleep(max(0.0, start - time.time()))
+    count = 0
+    while time.time() < deadline:
+        client.request('GET /api/download/<file>', 'GET', f'/api/download/{filenames[count % len(filenames)]}')
+        count += 1
+    return {'samples': dict(samples), 'errors': dict(errors), 'downloads': count}
+
+
+def submit_jobs(port: int, count: int) -> list:
+    """Stub jobs for the pollers to watch, waited on until completed"""
+    samples, errors = defaultdict(list), defaultdict(int)
+    client = loadtest.Client('127.0.0.1', port, samples, errors)
+    task_ids = []
+    for _ in range(count):
+        status, _, data = client.request('POST /api/process', 'POST', '/api/process',
+                                         body={'url': 'https://example.com/watch?v=benchmark'})
+        if status != 200:
+            raise RuntimeError(f'POST /api/process failed ({status})')
+        task_ids.append(json.loads(data)['task_id'])
+    while True:
+        status, _, data = client.request('GET /api/status?ids', 'GET', f"/api/status?ids={','.join(task_ids)}")
+        statuses = json.loads(data)['statuses'] if status == 200 else {}
+        if statuses and all(s.get('status') == 'completed' for s in statuses.values()):
+            return task_ids
+        time.sleep(0.2)
+
+
+def summarize(results: list) -> dict:
+    samples, errors = [], 0
+    for result in results:
+        for route in STATUS_ROUTES:
+            samples.extend(result['samples'].get(route, []))
+            errors += result['errors'].get(route, 0)
+    if not samples:
+        return {'requests': 0, 'errors': errors, 'p50_ms': float('inf'), 'p99_ms': float('inf')}
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'p50_ms': round(loadtest.percentile(samples, 50) * 1000, 2),
+        'p99_ms': round(loadtest.percentile(samples, 99) * 1000, 2),
+    }
+
+
+def run_phase(pool, port: int, task_ids: list, filenames: list, args, downloaders: int) -> dict:
+    start = time.time() + 0.5
+    deadline = start + args.duration
+    poll_jobs = [(port, task_ids[i::args.pollers], start, deadline, args.poll_interval)
+                 for i in range(args.pollers)]
+    polls = pool.map_async(poll, poll_jobs)
+    downloads = pool.map_async(download, [(port, filenames, start, deadline)] * downloaders) if downloaders else None
+
+    phase = summarize(polls.get())
+    if downloads:
+        results = downloads.get()
+        completed = sum(len(r['samples'].get('GET /api/download/<file>', [])) for r in results)
+        phase['downloads'] = completed
+        phase['download_errors'] = sum(r['errors'].get('GET /api/download/<file>', 0) for r in results)
+        # In-flight downloads at the deadline are not counted
+        phase['download_mb_s'] = round(completed * args.file_mb / (time.time() - start), 1)
+    return phase
+
+
+def benchmark(server: str, args) -> dict:
+    server_args = argparse.Namespace(work_dir=tempfile.mkdtemp(prefix='benchmark_serving_'), workers=64,
+                                     job_seconds=0.5, file_mb=1, redis_url=args.redis_url,
+                                     server=server, web_workers=args.web_workers)
+    proc, port = loadtest.start_server(server_args)
+    try:
+        # Sparse files: the cost measured is serving them, not the disk
+        output_folder = os.path.join(server_args.work_dir, 'output')
+        filenames = [f'benchmark_{index}.mp4' for index in range(4)]
+        for filename in filenames:
+            with open(os.path.join(output_folder, filename), 'wb') as f:
+                f.truncate(args.file_mb * 1024 * 1024)
+
+        task_ids = submit_jobs(port, args.pollers * 2)
+        with multiprocessing.Pool(args.pollers + args.downloaders) as pool:
+            idle = run_phase(pool, port, task_ids, filenames, args, 0)
+            busy = run_phase(pool, port, task_ids, filenames, args, args.downloaders)
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(server_args.work_dir, ignore_errors=True)
+    return {'idle': idle, 'downloading': busy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Status latency during large downloads, Werkzeug vs gunicorn')
+    parser.add_argument('--downloaders', type=int, default=16, help='concurrent download connections')
+    parser.add_argument('--file-mb', type=int, default=512, help='size of each downloaded file')
+    parser.add_argument('--pollers', type=int, default=4, help='status polling processes')
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    parser.add_argument('--duration', type=float, default=10, help='seconds per phase')
+    parser.add_argument('--web-workers', type=int, default=0,
+                        help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--redis-url', help='use this Redis instead of the in-memory stand-in')
+    parser.add_argument('--max-p99-ms', type=float, default=250)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for server in ('werkzeug', 'gunicorn'):
+        print(f"Benchmarking {server}: {args.pollers} pollers, then + {args.downloaders} downloads "
+              f"of {args.file_mb} MB ({args.duration:g}s each)...")
+        results[server] = benchmark(server, args)
+
+    print(f"\n{'Server':<10} {'Phase':<12} {'Status req':>10} {'Errors':>7} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'Downloads':>10} {'MB/s':>8}")
+    for server, phases in results.items():
+        for phase, row in phases.items():
+            print(f"{server:<10} {phase:<12} {row['requests']:>10} {row['errors']:>7} {row['p50_ms']:>9} "
+                  f"{row['p99_ms']:>9} {row.get('downloads', '-'):>10} {row.get('download_mb_s', '-'):>8}")
+    print()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    gunicorn = results['gunicorn']['downloading']
+    checks = [
+        check('No status errors under gunicorn', gunicorn['errors'] == 0, f"{gunicorn['errors']} errors"),
+        check('Downloads completed under gunicorn', gunicorn.get('downloads', 0) > 0
+              and not gunicorn.get('download_errors'), f"{gunicorn.get('downloads', 0)} downloads"),
+        check(f'Status p99 during downloads below {args.max_p99_ms:g} ms', gunicorn['p99_ms'] < args.max_p99_ms,
+              f"{gunicorn['p99_ms']} ms (development server: {results['werkzeug']['downloading']['p99_ms']} ms)"),
+    ]
+    if not all(checks):
+        print("❌ Serving benchmark failed")
+        sys.exit(1)
+    print("✅ Serving benchmark OK")
+
+
+if __name__ == '__main__':
+    main()
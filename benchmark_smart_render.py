@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Smart-render vs full re-encode benchmark for the subtitle burn
+Burns the same subtitles with GeminiVideoProcessor.burn_subtitles (full re-encode) and
+smart_render.smart_burn, reports both encode times, and checks that the smart output is playable
+(decodes without errors, same frame count and duration, frame times and A/V offset of the
+source) and visually matches the full burn: SSIM against the source, frame by frame, is at
+least the full burn's (copied GOPs are the source's own frames, so on noisy footage the smart
+output is the closer one).
+
+Without arguments a synthetic 2-minute H.264 clip (2 s GOPs) with subtitles on about
+a third of the timeline is generated. Needs ffmpeg / ffprobe with libx264 and libass.
+
+Usage: python benchmark_smart_render.py [video.mp4 subtitles.ass] [--ssim-tolerance 0.005]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import smart_render
+import subtitle_writer
+from video_processor_gemini import GeminiVideoProcessor
+
+
+def check(name: str, ok: bool, detail: str = '') -> bool:
+    symbol = "✅" if ok else "❌"
+    print(f"{symbol} {name}" + (f": {detail}" if detail else ''))
+    return ok
+
+
+def generate_sample(work_dir: str, seconds: int = 120) -> tuple:
+    """Test-pattern video with a 2 s GOP and a few dialogue stretches"""
+    video_path = os.path.join(work_dir, 'sample.mp4')
+    subprocess.run([
+        'ffmpeg', '-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+        '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '60', '-keyint_min', '60', '-sc_threshold', '0',
+        '-c:a', 'aac', '-shortest', '-y', video_path
+    ], check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    segments = []
+    for block_start in range(5, seconds, 30):
+        for k in range(3):
+            start = block_start + k * 2.5
+            segments.append({'start': start, 'end': start + 2.2, 'text': f'Subtitle line at {start:.1f}s'})
+    subtitle_path = os.path.join(work_dir, 'sample.ass')
+    subtitle_writer.write_subtitles(segments, subtitle_path, 'ass', bidi=False)
+    return video_path, subtitle_path
+
+
+def frame_count(path: str) -> int:
+    output = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_frames',
+                             '-show_entries', 'stream=nb_read_frames', '-of', 'csv=p=0', path],
+                            check=True, capture_output=True, text=True).stdout
+    return int(output.strip() or 0)
+
+
+def duration(path: str) -> float:
+    output = subprocess.run(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+                            check=True, capture_output=True, text=True).stdout
+    return float(output.strip() or 0)
+
+
+def decode_errors(path: str) -> str:
+    return subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-f', 'null', '-'],
+                          capture_output=True, text=True).stderr.strip()
+
+
+def ssim(path: str, reference: str) -> tuple:
+    """(mean, worst frame) SSIM, frames paired by index: the smart output's timestamps may
+    differ from the reference's by a timescale tick, which the ssim filter would pair wrongly"""
+    with tempfile.NamedTemporaryFile(suffix='.log') as stats_file:
+        subprocess.run(['ffmpeg', '-i', path, '-i', reference, '-lavfi',
+                        f'[0:v]settb=AVTB,setpts=N[a];[1:v]settb=AVTB,setpts=N[b];[a][b]ssim=stats_file={stats_file.name}',
+                        '-f', 'null', '-'], check=True, capture_output=True)
+        values = [float(match.group(1)) for match in re.finditer(r'All:([\d.]+)', stats_file.read().decode())]
+    return (sum(values) / len(values), min(values)) if values else (0.0, 0.0)
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Smart-render vs full re-encode subtitle burn')
+    parser.add_argument('video', nargs='?')
+    parser.add_argument('subtitles', nargs='?')
+    parser.add_argument('--ssim-tolerance', type=float, default=0.005,
+                        help='how far the smart output may fall below the full burn\'s SSIM to the source')
+    args = parser.parse_args()
+
+    processor = GeminiVideoProcessor(gemini_api_key='unused', load_whisper=False, preview_height=0)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.video and args.subtitles:
+            video_path, subtitle_path = args.video, args.subtitles
+        else:
+            print("Generating a synthetic 2-minute clip...")
+            video_path, subtitle_path = generate_sample(work_dir)
+
+        full_path = os.path.join(work_dir, 'full.mp4')
+        smart_path = os.path.join(work_dir, 'smart.mp4')
+
+        _, full_seconds = timed(processor.burn_subtitles, video_path, subtitle_path, full_path)
+        stats, smart_seconds = timed(smart_render.smart_burn, video_path, subtitle_path, smart_path,
+                                     os.path.join(work_dir, 'pieces'))
+        if not stats:
+            print("❌ Smart render is not applicable to this source (see the log)")
+            sys.exit(1)
+
+        print(f"\n{stats['gops']} GOPs in {stats['runs']} runs: {stats['reencoded_seconds']:.1f}s re-encoded, "
+              f"{stats['copied_seconds']:.1f}s copied")
+        print(f"Full re-encode: {full_seconds:.2f}s")
+        print(f"Smart render:   {smart_seconds:.2f}s ({full_seconds / smart_seconds:.1f}x faster)\n")
+
+        errors = decode_errors(smart_path)
+        frames, reference_frames = frame_count(smart_path), frame_count(full_path)
+        try:
+            smart_render.verify_splice(video_path, smart_path, [])
+            splice_error = ''
+        except smart_render.SpliceError as e:
+            splice_error = str(e)
+        smart_ssim, full_ssim = ssim(smart_path, video_path), ssim(full_path, video_path)
+        print(f"SSIM to the source (mean / worst frame): smart {smart_ssim[0]:.4f} / {smart_ssim[1]:.4f}, "
+              f"full burn {full_ssim[0]:.4f} / {full_ssim[1]:.4f}; smart vs full {ssim(smart_path, full_path)[0]:.4f}\n")
+        results = [
+            check('Smart output decodes cleanly', not errors, errors[:200]),
+            check('Same frame count', frames == reference_frames, f'{frames} vs {reference_frames}'),
+            check('Same duration', abs(duration(smart_path) - duration(full_path)) < 0.1,
+                  f'{duration(smart_path):.2f}s vs {duration(full_path):.2f}s'),
+            check('Frame times and A/V offset of the source', not splice_error, splice_error),
+            check('Visually identical to the full burn',
+                  smart_ssim[0] >= full_ssim[0] - args.ssim_tolerance
+                  and smart_ssim[1] >= full_ssim[1] - 4 * args.ssim_tolerance,
+                  f'SSIM to the source {smart_ssim[0]:.4f} (full burn {full_ssim[0]:.4f}), '
+                  f'worst frame {smart_ssim[1]:.4f} ({full_ssim[1]:.4f})'),
+        ]
+
+    print()
+    if not all(results):
+        print("❌ Smart render benchmark failed")
+        sys.exit(1)
+    print("✅ Smart render OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for subtitle generation
+Compares the original per-segment writers with subtitle_writer on synthetic
+mixed Persian/English segments and checks that the output is byte-identical.
+
+Usage: python benchmark_subtitles.py [--segments 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import subtitle_writer
+from bidi_fixer import LRM, RLE, PDF
+
+PERSIAN_WORDS = ['سلام', 'من', 'یک', 'معلم', 'هستم', 'چطوره', 'بریم', 'نمیدونم',
+                 'ساعت', 'دو', 'نظرت', 'چیه', 'زبان', 'انگلیسی', 'با', 'مدارک']
+ENGLISH_WORDS = ['TESOL', 'T-Y-O-L', 'P-SOL', 'API', 'YouTube', 'Gemini', '2024', 'x86-64']
+
+
+# --- Original implementation (copied from GeminiVideoProcessor before the rewrite) ---
+
+def legacy_fix_bidi_text(text):
+    if not text or not text.strip():
+        return text
+    english_pattern = r'([A-Za-z0-9\-]+)'
+    fixed_text = re.sub(english_pattern, lambda m: f'{LRM}{m.group(1)}{LRM}', text)
+    fixed_text = f'{RLE}{fixed_text}{PDF}'
+    return fixed_text.strip()
+
+
+def legacy_format_timestamp_srt(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    millis = int((seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def legacy_format_timestamp_ass(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    secs = int(seconds % 60)
+    centisecs = int((seconds % 1) * 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centisecs:02d}"
+
+
+def legacy_generate_srt(segments, output_path):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for i, segment in enumerate(segments, 1):
+            f.write(f"{i}\n")
+            f.write(f"{legacy_format_timestamp_srt(segment['start'])} --> {legacy_format_timestamp_srt(segment['end'])}\n")
+            fixed_text = legacy_fix_bidi_text(segment['text'])
+            f.write(f"{fixed_text}\n\n")
+    return output_path
+
+
+def legacy_generate_ass(segments, output_path):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(subtitle_writer.ASS_HEADER)
+        for segment in segments:
+            start = legacy_format_timestamp_ass(segment['start'])
+            end = legacy_format_timestamp_ass(segment['end'])
+            fixed_text = legacy_fix_bidi_text(segment['text'])
+            text = fixed_text.replace('\n', '\\N')
+            f.write(f"Dialogue: 0,{start},{end},Default,,0,0,0,,{text}\n")
+    return output_path
+
+
+# --- Benchmark ---
+
+def make_segments(count, seed=42):
+    """Synthetic Whisper-like segments with mixed Persian/English text"""
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    for _ in range(count):
+        words = [rng.choice(ENGLISH_WORDS) if rng.random() < 0.25 else rng.choice(PERSIAN_WORDS)
+                 for _ in range(rng.randint(3, 12))]
+        text = ' '.join(words)
+        if rng.random() < 0.1:
+            text = text.replace(' ', '\n', 1)
+        if rng.random() < 0.01:
+            text = rng.choice(['', '  '])
+        start = round(t, rng.choice([2, 3]))
+        t += rng.uniform(0.5, 6.0)
+        segments.append({'start': start, 'end': round(t, 2), 'text': text})
+        t += rng.uniform(0.0, 1.0)
+    return segments
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--segments', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    segments = make_segments(args.segments)
+    print(f"Segments: {len(segments)} (last end {subtitle_writer.format_timestamp_srt(segments[-1]['end'])})")
+
+    all_identical = True
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, legacy in (('srt', legacy_generate_srt), ('ass', legacy_generate_ass)):
+            legacy_path = os.path.join(tmp, f'legacy.{fmt}')
+            new_path = os.path.join(tmp, f'new.{fmt}')
+
+            legacy_time = best_time(lambda: legacy(segments, legacy_path), args.repeat)
+            new_time = best_time(lambda: subtitle_writer.write_subtitles(segments, new_path, fmt), args.repeat)
+
+            with open(legacy_path, 'rb') as f:
+                legacy_bytes = f.read()
+            with open(new_path, 'rb') as f:
+                new_bytes = f.read()
+            identical = legacy_bytes == new_bytes
+            all_identical = all_identical and identical
+
+            print(f"{fmt.upper()}: legacy {legacy_time * 1000:8.1f} ms | batched {new_time * 1000:8.1f} ms | "
+                  f"speedup {legacy_time / new_time:4.2f}x | {len(new_bytes)} bytes | "
+                  f"{'byte-identical' if identical else 'OUTPUT DIFFERS'}")
+
+        vtt_path = os.path.join(tmp, 'new.vtt')
+        vtt_time = best_time(lambda: subtitle_writer.write_subtitles(segments, vtt_path, 'vtt'), args.repeat)
+        print(f"VTT: batched {vtt_time * 1000:8.1f} ms")
+
+    return 0 if all_identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,9 @@ LRM = '\u200E'  # Left-to-Right Mark
 RLE = '\u202B'  # Right-to-Left Embedding
 PDF = '\u202C'  # Pop Directional Formatting
 
+# English letters, numbers, and hyphens (compiled once, shared with subtitle_writer)
+ENGLISH_PATTERN = re.compile(r'([A-Za-z0-9\-]+)')
+
 def fix_bidi_text(text: str) -> str:
     """
     Fix bidirectional text issues in mixed Persian/English text
@@ -19,11 +22,9 @@ def fix_bidi_text(text: str) -> str:
     if not text or not text.strip():
         return text
     
-    # Pattern to match English letters, numbers, and hyphens
-    english_pattern = r'([A-Za-z0-9\-]+)'
-    
     # Wrap English words with LRM marks to keep them LTR
-    fixed_text = re.sub(english_pattern, lambda m: f'{LRM}{m.group(1)}{LRM}', text)
+    # (split keeps the matches, so joining with LRM puts one on each side of every match)
+    fixed_text = LRM.join(ENGLISH_PATTERN.split(text))
     
     # Wrap the entire text in RLE...PDF to force RTL direction
     fixed_text = f'{RLE}{fixed_text}{PDF}'
@@ -18,18 +18,95 @@ class Config:
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
     
+    # Worker pool autoscaling from queue depth and stage mix (bounds: celery worker --autoscale=MAX,MIN)
+    # Jobs in CPU-bound stages (Whisper, burn) at once before scale-up pauses
+    AUTOSCALE_CPU_SLOTS = int(os.getenv('AUTOSCALE_CPU_SLOTS', max(1, (os.cpu_count() or 1) // 4)))
+    AUTOSCALE_KEEPALIVE = float(os.getenv('AUTOSCALE_KEEPALIVE', 60))  # Seconds before shrinking
+    # Unacknowledged jobs are redelivered after this long (must exceed the longest job)
+    CELERY_VISIBILITY_TIMEOUT = int(os.getenv('CELERY_VISIBILITY_TIMEOUT', 21600))
+    
     # File Storage
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
     UPLOAD_FOLDER = os.path.join(BASE_DIR, os.getenv('UPLOAD_FOLDER', 'temp_files'))
     OUTPUT_FOLDER = os.path.join(BASE_DIR, os.getenv('OUTPUT_FOLDER', 'output_files'))
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 524288000))
     
+    # Shared download cache (hardlinked into task dirs; 0 bytes = disabled)
+    DOWNLOAD_CACHE_FOLDER = os.path.join(BASE_DIR, os.getenv('DOWNLOAD_CACHE_FOLDER', 'download_cache'))
+    DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv('DOWNLOAD_CACHE_MAX_BYTES', 10737418240))  # 10GB
+    DOWNLOAD_CONCURRENT_FRAGMENTS = int(os.getenv('DOWNLOAD_CONCURRENT_FRAGMENTS', 4))
+    
+    # Transcription cache keyed by audio fingerprint (0 entries = disabled)
+    TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv('TRANSCRIPT_CACHE_MAX_ENTRIES', 1000))
+    TRANSCRIPT_CACHE_MAX_BER = float(os.getenv('TRANSCRIPT_CACHE_MAX_BER', 0.25))
+
+    # Language ID over the first 30 s before full ASR, in the resident Whisper process
+    # ('' disables it; 'base' reuses the ASR model); below the probability threshold
+    # Whisper detects the language itself
+    LANGUAGE_DETECT_MODEL = os.getenv('LANGUAGE_DETECT_MODEL', 'base')
+    LANGUAGE_DETECT_MIN_PROBABILITY = float(os.getenv('LANGUAGE_DETECT_MIN_PROBABILITY', 0.5))
+
+    # Reuse captions published with the source video instead of running Whisper:
+    # 'off', 'manual' (uploaded by the creator) or 'auto' (also the platform's own ASR)
+    PLATFORM_CAPTIONS = os.getenv('PLATFORM_CAPTIONS', 'manual')
+    
+    # Low-resolution preview rendered alongside the full burn (0 = disabled)
+    PREVIEW_PROXY_HEIGHT = int(os.getenv('PREVIEW_PROXY_HEIGHT', 360))
+    
+    # Burn to HLS segments of this many seconds so playback starts while encoding (0 = MP4 only)
+    HLS_SEGMENT_SECONDS = int(os.getenv('HLS_SEGMENT_SECONDS', 0))
+    
+    # Smart render: re-encode only the GOPs that show a subtitle, stream-copy the rest
+    # (H.264 MP4 sources, single-language burns without HLS)
+    SMART_RENDER = os.getenv('SMART_RENDER', 'false').lower() == 'true'
+    
+    # Gemini rate limiting (shared by all workers through Redis)
+    GEMINI_REQUESTS_PER_MINUTE = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', 60))
+    GEMINI_BURST = int(os.getenv('GEMINI_BURST', 10))
+    GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', 5))
+    GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', 2.0))
+    GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', 60.0))
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('GEMINI_CIRCUIT_FAILURE_THRESHOLD', 5))
+    GEMINI_CIRCUIT_RESET_SECONDS = float(os.getenv('GEMINI_CIRCUIT_RESET_SECONDS', 60.0))
+    GEMINI_CIRCUIT_MAX_WAIT = float(os.getenv('GEMINI_CIRCUIT_MAX_WAIT', 600.0))
+
+    # Target languages (ISO 639-1 codes, see languages.py); one job can request several
+    DEFAULT_TARGET_LANGUAGE = os.getenv('DEFAULT_TARGET_LANGUAGE', 'fa')
+    SUPPORTED_LANGUAGES = os.getenv('SUPPORTED_LANGUAGES', 'fa,ar,en,es,fr,de,tr').split(',')
+    MAX_TARGET_LANGUAGES = int(os.getenv('MAX_TARGET_LANGUAGES', 5))
+
+    # Batch / playlist submissions
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 200))
+    BATCH_DEFAULT_CONCURRENCY = int(os.getenv('BATCH_DEFAULT_CONCURRENCY', 2))
+    BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 8))
+
+    # Task ids accepted by one bulk status request (GET /api/status?ids=...)
+    STATUS_MAX_IDS = int(os.getenv('STATUS_MAX_IDS', 100))
+
     # File Retention
     FILE_RETENTION_HOURS = int(os.getenv('FILE_RETENTION_HOURS', 24))
     
+    # Storage quota for output files and temp dirs (bytes, 0 = unlimited); LRU eviction above it
+    STORAGE_QUOTA_BYTES = int(os.getenv('STORAGE_QUOTA_BYTES', 21474836480))  # 20GB
+    
+    # Logging (JSON lines) and per-task Chrome trace files ('' disables traces)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    _TRACE_FOLDER = os.getenv('TRACE_FOLDER', 'traces')
+    TRACE_FOLDER = os.path.join(BASE_DIR, _TRACE_FOLDER) if _TRACE_FOLDER else ''
+    
     # Server
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', 5000))
+
+    # Production server (gunicorn.conf.py): pre-forked gthread workers (0 = 2 x CPU cores + 1)
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', 0))
+    WEB_THREADS = int(os.getenv('WEB_THREADS', 32))
+
+    # Hand output files to the front proxy instead of streaming them from a worker:
+    # '' (gunicorn os.sendfile), 'x-sendfile' (Apache / lighttpd) or 'x-accel' (nginx)
+    SENDFILE_OFFLOAD = os.getenv('SENDFILE_OFFLOAD', '').lower()
+    # nginx `internal` location aliased to OUTPUT_FOLDER (x-accel only)
+    ACCEL_REDIRECT_PREFIX = os.getenv('ACCEL_REDIRECT_PREFIX', '/protected-output/')
     
     # Ensure directories exist
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -0,0 +1,149 @@
+"""
+Shared download cache for yt-dlp
+Downloads are keyed by extractor, video id and selected format, stored once in
+DOWNLOAD_CACHE_FOLDER and hardlinked into each task's temp directory.
+Fragments are fetched concurrently and partial (.part) files are resumed after a crash.
+"""
+
+import fcntl
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+
+import yt_dlp
+
+from tracing import get_logger
+
+log = get_logger('download_cache')
+
+# Files that are not finished cache entries: .part/.ytdl fragments and the
+# per-format pieces (name.f137.mp4) that yt-dlp merges at the end
+_PARTIAL_PATTERN = re.compile(r'(\.part|\.ytdl|\.temp|\.f[0-9A-Za-z_-]+\.[0-9A-Za-z]+)$')
+
+
+class DownloadCache:
+    """Size-bounded, host-local cache of downloaded media files"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, concurrent_fragments: int = 4,
+                 stale_partial_seconds: float = 86400):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.concurrent_fragments = concurrent_fragments
+        self.stale_partial_seconds = stale_partial_seconds
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, url: str, dest_path: str, format_selector: str, ext: str) -> dict:
+        """Make `url` available at dest_path, downloading it into the cache only if needed
+
+        Returns {'path', 'cache_path', 'cache_hit'}.
+        """
+        ydl_opts = {
+            'format': format_selector,
+            # Cache key: extractor + video id + selected format (e.g. 137+140)
+            'outtmpl': os.path.join(self.cache_dir, f'%(extractor_key)s-%(id)s-%(format_id)s.{ext}'),
+            'restrictfilenames': True,
+            'concurrent_fragment_downloads': self.concurrent_fragments,
+            # Resume .part files left behind by a crashed worker
+            'continuedl': True,
+            'nopart': False,
+            'quiet': False,
+            'no_warnings': False,
+        }
+        if ext == 'mp4':
+            ydl_opts['merge_output_format'] = 'mp4'
+
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            cache_path = ydl.prepare_filename(info)
+
+            # Only one process downloads a given entry; the others wait and reuse it
+            with self._lock(cache_path):
+                cache_hit = os.path.exists(cache_path)
+                if cache_hit:
+                    log.info('Download cache hit', file=os.path.basename(cache_path))
+                else:
+                    ydl.process_ie_result(info, download=True)
+
+                # Mark as recently used for eviction
+                os.utime(cache_path, None)
+                self._link(cache_path, dest_path)
+
+        if not cache_hit:
+            self.evict()
+
+        return {'path': dest_path, 'cache_path': cache_path, 'cache_hit': cache_hit}
+
+    @contextmanager
+    def _lock(self, cache_path: str, blocking: bool = True):
+        lock_path = f'{cache_path}.lock'
+        with open(lock_path, 'a') as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(lock_file, flags)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _link(self, cache_path: str, dest_path: str):
+        """Hardlink the cached file into the task dir (copy across filesystems)"""
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(cache_path, dest_path)
+        except OSError:
+            shutil.copy2(cache_path, dest_path)
+
+    def evict(self) -> list:
+        """Delete least recently used entries until the cache fits max_bytes
+
+        Entries still hardlinked into a task dir (st_nlink > 1) or locked by a
+        download in progress are kept. Lock files (empty) are never deleted.
+        """
+        now = time.time()
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith('.lock'):
+                continue
+            if _PARTIAL_PATTERN.search(name):
+                # Partial downloads nobody resumed for a long time
+                if now - stat.st_mtime > self.stale_partial_seconds:
+                    self._remove(path)
+                else:
+                    total += stat.st_size
+                continue
+            total += stat.st_size
+            entries.append((stat.st_mtime, stat.st_size, stat.st_nlink, path))
+
+        evicted = []
+        for _, size, nlink, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if nlink > 1:
+                continue
+            try:
+                with self._lock(path, blocking=False):
+                    self._remove(path)
+            except BlockingIOError:
+                continue
+            total -= size
+            evicted.append(path)
+            log.info('Evicted from download cache', file=os.path.basename(path), bytes=size)
+
+        return evicted
+
+    def _remove(self, path: str):
+        # The entry's .lock file is kept: unlinking it while a waiter holds it open
+        # would let the next fetch lock a new inode and download alongside that waiter
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,37 @@
+"""
+Production server profile: gunicorn -c gunicorn.conf.py
+Pre-forked gthread workers, each serving WEB_THREADS requests at once. Idle keep-alive
+connections (the UI's status polls) wait in the worker's poller, not in a thread, and
+output files go out with os.sendfile (or through the front proxy, see SENDFILE_OFFLOAD),
+so a download does not hold the GIL while status requests are served.
+"""
+
+import multiprocessing
+
+from config import Config
+
+wsgi_app = 'app:app'
+bind = f'{Config.HOST}:{Config.PORT}'
+
+worker_class = 'gthread'
+workers = Config.WEB_WORKERS or multiprocessing.cpu_count() * 2 + 1
+threads = Config.WEB_THREADS
+# Import the app once in the master: workers fork ready to serve (Redis pools reconnect per process)
+preload_app = True
+# Open connections per worker, idle keep-alive ones included
+worker_connections = 1000
+keepalive = 5
+
+# gthread workers heartbeat from their main loop, so long downloads do not trip this
+timeout = 60
+graceful_timeout = 30
+
+# Downloads go out with os.sendfile, gunicorn's default. Leave `sendfile` unset: in gunicorn
+# 21.2 Config.sendfile returns False whenever the setting has any value (True included),
+# and Response.can_sendfile() only checks that result; the SENDFILE env var applies when unset
+
+# Front proxy headers (X-Forwarded-*) are trusted from localhost only
+forwarded_allow_ips = '127.0.0.1'
+
+accesslog = '-'
+loglevel = Config.LOG_LEVEL.lower()
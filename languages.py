@@ -0,0 +1,36 @@
+"""
+Target languages for translation
+Codes are ISO 639-1 (API / file names); each entry carries the name used in the
+Gemini prompt and the ISO 639-2 code written into container track metadata.
+"""
+
+LANGUAGES = {
+    'fa': {'name': 'Persian', 'iso639_2': 'per', 'rtl': True},
+    'ar': {'name': 'Arabic', 'iso639_2': 'ara', 'rtl': True},
+    'ur': {'name': 'Urdu', 'iso639_2': 'urd', 'rtl': True},
+    'he': {'name': 'Hebrew', 'iso639_2': 'heb', 'rtl': True},
+    'en': {'name': 'English', 'iso639_2': 'eng', 'rtl': False},
+    'es': {'name': 'Spanish', 'iso639_2': 'spa', 'rtl': False},
+    'fr': {'name': 'French', 'iso639_2': 'fre', 'rtl': False},
+    'de': {'name': 'German', 'iso639_2': 'ger', 'rtl': False},
+    'it': {'name': 'Italian', 'iso639_2': 'ita', 'rtl': False},
+    'pt': {'name': 'Portuguese', 'iso639_2': 'por', 'rtl': False},
+    'tr': {'name': 'Turkish', 'iso639_2': 'tur', 'rtl': False},
+    'ru': {'name': 'Russian', 'iso639_2': 'rus', 'rtl': False},
+    'hi': {'name': 'Hindi', 'iso639_2': 'hin', 'rtl': False},
+    'zh': {'name': 'Chinese', 'iso639_2': 'chi', 'rtl': False},
+    'ja': {'name': 'Japanese', 'iso639_2': 'jpn', 'rtl': False},
+    'ko': {'name': 'Korean', 'iso639_2': 'kor', 'rtl': False},
+}
+
+DEFAULT_LANGUAGE = 'fa'
+
+
+def language_name(code: str) -> str:
+    """English name of a language code ('fa' -> 'Persian')"""
+    return LANGUAGES.get(code, {}).get('name', code)
+
+
+def is_rtl(code: str) -> bool:
+    """Right-to-left scripts need the bidi fix in subtitle files"""
+    return LANGUAGES.get(code, {}).get('rtl', False)
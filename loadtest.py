@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Offline load test for the Flask API
+Starts the app in a separate process with an in-memory Redis (fakeredis, or a local
+redis-server via --redis-url) and a stub Celery: submitted jobs are "processed" by
+threads that walk the real status stages with update_task_status and write an output
+file. Client processes then run hundreds of concurrent browser-like sessions:
+
+    POST /api/process -> poll status every --poll-interval until completed -> download
+
+Polls mix the UI's bulk conditional poll (/api/status?ids=..., If-None-Match), the
+single-task /api/status/<id> and the HTML /simple/status/<id> page. A share of sessions
+cancel their job after the first poll instead (POST /api/cancel/<id>) and check that it
+stays cancelled. Reports p50 / p99 latency and requests per second per route. No network
+access is needed.
+
+--server gunicorn runs the app with the production profile (gunicorn.conf.py) instead of
+the threaded Werkzeug server. Its forked workers share the in-memory Redis over TCP, so a
+cancel usually lands on a different worker than the submit.
+
+Usage: python loadtest.py [--clients 200] [--duration 30] [--job-seconds 5] [--file-mb 8]
+                          [--server werkzeug|gunicorn]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import runpy
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Stages a stub job walks through, with their share of --job-seconds
+STUB_STAGES = [
+    ('downloading', 'مرحله ۱/۵: در حال دانلود ویدئو...', 10, 0.15),
+    ('transcribing', 'مرحله ۲/۵: در حال رونویسی صوتی...', 30, 0.35),
+    ('translating', 'مرحله ۳/۵: در حال ترجمه به فارسی...', 60, 0.2),
+    ('generating_subtitles', 'مرحله ۴/۵: در حال ساخت فایل زیرنویس...', 75, 0.05),
+    ('burning_subtitles', 'مرحله ۵/۵: در حال چسباندن زیرنویس...', 90, 0.25),
+]
+
+# Share of polls per route; the rest use the bulk conditional poll like the web UI
+SINGLE_STATUS_SHARE = 0.25
+SIMPLE_STATUS_SHARE = 0.15
+# Share of sessions that cancel their job after the first poll
+CANCEL_SHARE = 0.1
+
+# Celery ids revoked through the stub (in Redis: the cancel may reach another web worker)
+REVOKED_KEY = 'loadtest:revoked'
+
+
+# --- Server process -----------------------------------------------------------
+
+class StubResult:
+    def __init__(self, task_id: str):
+        self.id = task_id
+
+
+class StubControl:
+    def revoke(self, celery_id, terminate=False, signal=None):
+        from task_client import redis_client
+        redis_client.sadd(REVOKED_KEY, celery_id)
+
+
+class StubCelery:
+    """send_task() runs the job on a bounded thread pool instead of a Celery worker"""
+
+    def __init__(self, workers: int, job_seconds: float, output_bytes: int):
+        self.slots = threading.Semaphore(workers)
+        self.job_seconds = job_seconds
+        self.output_bytes = output_bytes
+        self.control = StubControl()
+
+    def send_task(self, name, args=None, kwargs=None):
+        celery_id = str(uuid.uuid4())
+        if name == 'tasks.process_video_task':
+            threading.Thread(target=self._process, args=(args[1], celery_id), daemon=True).start()
+        return StubResult(celery_id)
+
+    def _process(self, task_id: str, celery_id: str):
+        from config import Config
+        from task_client import update_task_status, storage_manager, redis_client
+
+        update_task_status(task_id, 'started', 'در صف پردازش', 0)
+        with self.slots:
+            for status, message, progress, share in STUB_STAGES + [(None, None, None, 0)]:
+                # A revoked job stops where a terminated Celery task would
+                if redis_client.sismember(REVOKED_KEY, celery_id):
+                    return
+                if status:
+                    update_task_status(task_id, status, message, progress)
+                    time.sleep(self.job_seconds * share)
+
+            output_path = os.path.join(Config.OUTPUT_FOLDER, f'{task_id}_subtitled.mp4')
+            with open(output_path, 'wb') as f:
+                f.truncate(self.output_bytes)  # Sparse: no disk write cost in the stub
+            storage_manager.register(output_path, task_id)
+            update_task_status(task_id, 'completed', 'پردازش با موفقیت انجام شد', 100,
+                               output_file=os.path.basename(output_path), rendition='final')
+
+
+def serve_fake_redis(parent_pid: int):
+    """In-memory Redis over TCP, shared by the gunicorn workers; exits with the server process"""
+    import fakeredis
+
+    class NoDelayFakeServer(fakeredis.TcpFakeServer):
+        # socketserver's default backlog of 5 drops connection bursts (1 s SYN retransmits)
+        request_queue_size = 128
+
+        # Replies are written one command at a time: without this pipelines wait for delayed ACKs
+        def get_request(self):
+            connection, address = super().get_request()
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return connection, address
+
+    server = NoDelayFakeServer(('127.0.0.1', 0), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(json.dumps({'port': server.server_address[1]}), flush=True)
+    while os.getppid() == parent_pid:
+        time.sleep(1)
+    os._exit(0)
+
+
+def install_stubs(args):
+    """Point Redis and Celery at the in-process stand-ins; must run before app is imported"""
+    import redis
+    retry = {}
+    if args.server == 'gunicorn' and not args.redis_url:
+        # Forked workers do not share memory: serve the fake Redis over TCP from its own process
+        from redis.backoff import NoBackoff
+        from redis.retry import Retry
+
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--fake-redis', str(os.getpid())],
+                                stdout=subprocess.PIPE, text=True, cwd=ROOT)
+        args.redis_url = f"redis://127.0.0.1:{json.loads(proc.stdout.readline())['port']}"
+        # The fake server closes the connection after any error reply (e.g. the NOSCRIPT
+        # that precedes every first SCRIPT LOAD); the next command reconnects
+        retry = {'retry': Retry(NoBackoff(), 2), 'retry_on_error': [redis.exceptions.ConnectionError]}
+    if args.redis_url:
+        real_redis, url = redis.Redis, args.redis_url
+        redis.Redis = lambda *a, **kwargs: real_redis.from_url(
+            url, decode_responses=kwargs.get('decode_responses', False), **retry)
+    else:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        redis.Redis = lambda *a, **kwargs: fakeredis.FakeRedis(
+            server=server, decode_responses=kwargs.get('decode_responses', False))
+
+    import task_client
+    stub = StubCelery(args.workers, args.job_seconds, args.file_mb * 1024 * 1024)
+    task_client.get_celery = lambda: stub
+
+
+def serve_gunicorn(args):
+    """Run the stubbed app under gunicorn with the settings of gunicorn.conf.py"""
+    from gunicorn.app.base import BaseApplication
+
+    def announce_port(arbiter):
+        print(json.dumps({'port': arbiter.LISTENERS[0].sock.getsockname()[1]}), flush=True)
+
+    class LoadTestServer(BaseApplication):
+        def load_config(self):
+            settings = runpy.run_path(os.path.join(ROOT, 'gunicorn.conf.py'))
+            for name, value in settings.items():
+                if name in self.cfg.settings and value is not None:
+                    self.cfg.set(name, value)
+            self.cfg.set('bind', '127.0.0.1:0')
+            self.cfg.set('accesslog', None)
+            self.cfg.set('loglevel', 'warning')
+            self.cfg.set('when_ready', announce_port)
+            if args.web_workers:
+                self.cfg.set('workers', args.web_workers)
+            # The profile must keep gunicorn's os.sendfile path (see gunicorn.conf.py)
+            if not self.cfg.sendfile:
+                raise SystemExit('gunicorn.conf.py disables sendfile')
+
+        def load(self):
+            from app import app
+            return app
+
+    LoadTestServer().run()
+
+
+def serve(args):
+    """Run the stubbed app on a threaded Werkzeug server (or gunicorn) and print its port"""
+    os.environ['OUTPUT_FOLDER'] = os.path.join(args.work_dir, 'output')
+    os.environ['UPLOAD_FOLDER'] = os.path.join(args.work_dir, 'upload')
+    os.environ['TRACE_FOLDER'] = ''
+    os.makedirs(os.environ['OUTPUT_FOLDER'])
+    os.makedirs(os.environ['UPLOAD_FOLDER'])
+
+    install_stubs(args)
+    if args.server == 'gunicorn':
+        serve_gunicorn(args)
+        return
+
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    print(json.dumps({'port': server.server_port}), flush=True)
+    server.serve_forever()
+
+
+def start_server(args) -> tuple:
+    cmd = [sys.executable, os.path.abspath(__file__), '--serve', '--work-dir', args.work_dir,
+           '--workers', str(args.workers), '--server', args.server, '--web-workers', str(args.web_workers),
+           '--job-seconds', str(args.job_seconds), '--file-mb', str(args.file_mb)]
+    if args.redis_url:
+        cmd += ['--redis-url', args.redis_url]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True,
+                            cwd=ROOT)
+    line = proc.stdout.readline()
+    if not line:
+        raise RuntimeError('load-test server failed to start')
+    return proc, json.loads(line)['port']
+
+
+# --- Client processes ---------------------------------------------------------
+
+class Client:
+    """One browser-like session on a keep-alive connection; latencies per route"""
+
+    def __init__(self, host: str, port: int, samples: dict, errors: dict):
+        self.host, self.port = host, port
+        self.samples, self.errors = samples, errors
+        self.conn = None
+
+    def request(self, route: str, method: str, path: str, body: dict = None, headers: dict = None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            started = time.perf_counter()
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+                self.conn.request(method, path, body=payload, headers=headers)
+                response = self.conn.getresponse()
+                data = b''
+                while True:
+                    chunk = response.read(1 << 20)
+                    if not chunk:
+                        break
+                    if len(data) < 65536:  # Downloads are read in full but not kept
+                        data += chunk
+                if response.getheader('Connection', '').lower() == 'close':
+                    self.conn.close()
+                    self.conn = None
+                elapsed = time.perf_counter() - started
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection: reconnect once
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+                if attempt:
+                    self.errors[route] += 1
+                    return None, None, b''
+                continue
+
+            self.samples[route].append(elapsed)
+            if response.status >= 400:
+                self.errors[route] += 1
+            return response.status, response, data
+        return None, None, b''
+
+    def cancel(self, task_id: str, deadline: float, poll_interval: float):
+        """Cancel after the first poll; the job must report cancelled from then on"""
+        time.sleep(poll_interval * random.uniform(0.8, 1.2))
+        self.request('GET /api/status/<id>', 'GET', f'/api/status/{task_id}')
+        status, _, _ = self.request('POST /api/cancel/<id>', 'POST', f'/api/cancel/{task_id}')
+        for _ in range(2):
+            if status != 200 or time.time() >= deadline:
+                return
+            time.sleep(poll_interval * random.uniform(0.8, 1.2))
+            status, _, data = self.request('GET /api/status/<id>', 'GET', f'/api/status/{task_id}')
+            if status == 200 and json.loads(data).get('status') != 'cancelled':
+                self.errors['POST /api/cancel/<id>'] += 1  # The revoked job kept running
+                return
+
+    def session(self, deadline: float, poll_interval: float):
+        status, _, data = self.request('POST /api/process', 'POST', '/api/process',
+                                       body={'url': f'https://example.com/watch?v={uuid.uuid4().hex[:11]}'})
+        if status != 200:
+            time.sleep(poll_interval)
+            return
+        task_id = json.loads(data)['task_id']
+
+        if random.random() < CANCEL_SHARE:
+            self.cancel(task_id, deadline, poll_interval)
+            return
+
+        etag = None
+        output_file = None
+        while time.time() < deadline and not output_file:
+            time.sleep(poll_interval * random.uniform(0.8, 1.2))
+            pick = random.random()
+            if pick < SIMPLE_STATUS_SHARE:
+                self.request('GET /simple/status/<id>', 'GET', f'/simple/status/{task_id}')
+                continue
+            if pick < SIMPLE_STATUS_SHARE + SINGLE_STATUS_SHARE:
+                status, _, data = self.request('GET /api/status/<id>', 'GET', f'/api/status/{task_id}')
+                current = json.loads(data) if status == 200 else None
+            else:
+                headers = {'If-None-Match': etag} if etag else {}
+                status, response, data = self.request(
+                    'GET /api/status?ids', 'GET',
+                    f'/api/status?ids={task_id}&fields=status,progress,message,output_file', headers=headers)
+                if status != 200:
+                    continue
+                etag = response.getheader('ETag')
+                current = json.loads(data)['statuses'][task_id]
+            if current and current.get('status') == 'completed':
+                output_file = current.get('output_file')
+
+        if output_file and time.time() < deadline:
+            self.request('GET /api/download/<file>', 'GET', f'/api/download/{output_file}')
+
+
+def run_clients(job) -> dict:
+    """Client process: `clients` threads running sessions until the deadline"""
+    host, port, clients, deadline, poll_interval = job
+    samples, errors = defaultdict(list), defaultdict(int)
+
+    def loop():
+        client = Client(host, port, samples, errors)
+        while time.time() < deadline:
+            client.session(deadline, poll_interval)
+
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=max(0.0, deadline - time.time()) + 60)
+    return {'samples': dict(samples), 'errors': dict(errors)}
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(results: list, elapsed: float) -> dict:
+    samples, errors = defaultdict(list), defaultdict(int)
+    for result in results:
+        for route, values in result['samples'].items():
+            samples[route].extend(values)
+        for route, count in result['errors'].items():
+            errors[route] += count
+
+    print(f"\n{'Route':<28} {'Requests':>9} {'Errors':>7} {'RPS':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    summary = {}
+    for route in sorted(samples):
+        values = samples[route]
+        summary[route] = {
+            'requests': len(values),
+            'errors': errors[route],
+            'rps': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+        }
+        row = summary[route]
+        print(f"{route:<28} {row['requests']:>9} {row['errors']:>7} {row['rps']:>8} "
+              f"{row['p50_ms']:>9} {row['p99_ms']:>9}")
+    total = sum(len(values) for values in samples.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), "
+          f"{sum(errors.values())} errors")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test for the Flask API')
+    parser.add_argument('--clients', type=int, default=200, help='concurrent browser sessions')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='seconds between polls (web UI: 2)')
+    parser.add_argument('--job-seconds', type=float, default=5, help='length of a stub job')
+    parser.add_argument('--workers', type=int, default=8, help='stub jobs processed at once')
+    parser.add_argument('--file-mb', type=int, default=8, help='size of each output file')
+    parser.add_argument('--client-processes', type=int, default=max(1, min(4, os.cpu_count() or 1)))
+    parser.add_argument('--redis-url', help='use this Redis instead of the in-memory stand-in')
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug',
+                        help='threaded Werkzeug server or the production gunicorn profile')
+    parser.add_argument('--web-workers', type=int, default=0, help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--json', help='also write the per-route summary to this file')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--fake-redis', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fake_redis:
+        serve_fake_redis(args.fake_redis)
+        return
+    if args.serve:
+        serve(args)
+        return
+
+    args.work_dir = tempfile.mkdtemp(prefix='loadtest_')
+    server, port = start_server(args)
+    try:
+        print(f"Load test: {args.clients} clients for {args.duration:g}s against {args.server} on 127.0.0.1:{port} "
+              f"(stub jobs {args.job_seconds:g}s, {args.workers} at once, {args.file_mb} MB outputs)")
+        processes = min(args.client_processes, args.clients)
+        deadline = time.time() + args.duration
+        jobs = [('127.0.0.1', port, args.clients // processes + (i < args.clients % processes),
+                 deadline, args.poll_interval) for i in range(processes)]
+        started = time.time()
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(run_clients, jobs)
+        summary = report(results, time.time() - started)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(args.work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
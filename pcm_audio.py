@@ -0,0 +1,43 @@
+"""
+Decoded audio handoff between ffmpeg, the fingerprinter and Whisper
+extract_audio decodes once to raw little-endian float32 PCM, 16 kHz mono, which is
+Whisper's own input format. Readers memory-map that file instead of decoding it again
+(Whisper would otherwise spawn its own ffmpeg) or copying it into new buffers.
+"""
+
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+DTYPE = '<f4'
+EXTENSION = '.f32'
+
+
+def ffmpeg_output_args(output_path: str) -> list:
+    """ffmpeg output options that write 16 kHz mono float32 PCM to output_path"""
+    return [
+        '-vn',  # No video
+        '-ac', '1',  # Mono
+        '-ar', str(SAMPLE_RATE),  # 16kHz sample rate
+        '-f', 'f32le',
+        '-acodec', 'pcm_f32le',
+        '-y',  # Overwrite output file
+        output_path,
+    ]
+
+
+def load(path: str) -> np.ndarray:
+    """Samples of a decoded PCM file, memory-mapped (no read or copy up front)
+
+    Copy-on-write: pages are shared with the page cache, and consumers that
+    expect a writable array (torch.from_numpy) get one without a copy.
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(path, dtype=DTYPE, mode='c')
+
+
+def duration(path: str) -> float:
+    """Length of a decoded PCM file in seconds"""
+    return os.path.getsize(path) / (np.dtype(DTYPE).itemsize * SAMPLE_RATE)
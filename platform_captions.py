@@ -0,0 +1,168 @@
+"""
+Captions published with the source video, reused as the transcription
+yt-dlp lists a video's manual and automatic caption tracks in its info dict. The best
+track in the spoken language is fetched (json3, else WebVTT) and parsed into the same
+{start, end, text} segments Whisper produces, so extraction and ASR can be skipped.
+"""
+
+import html
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+import yt_dlp
+
+from tracing import get_logger
+
+log = get_logger('platform_captions')
+
+# Caption formats we can parse, best first (json3 carries exact millisecond timings)
+PREFERRED_FORMATS = ('json3', 'vtt')
+
+# Old codes some platforms still use
+_LANGUAGE_ALIASES = {'iw': 'he', 'in': 'id', 'ji': 'yi'}
+
+_VTT_TIMING = re.compile(r'((?:\d+:)?\d{1,2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}\.\d{3})')
+_TAG = re.compile(r'<[^>]*>')
+
+
+def base_language(code: str) -> str:
+    """'en-US' / 'en-orig' -> 'en' (the code Whisper and languages.py use)"""
+    code = (code or '').split('-')[0].split('_')[0].lower()
+    return _LANGUAGE_ALIASES.get(code, code)
+
+
+def _pick_format(formats: list) -> Optional[dict]:
+    for ext in PREFERRED_FORMATS:
+        for fmt in formats or []:
+            if fmt.get('ext') == ext and fmt.get('url'):
+                return fmt
+    return None
+
+
+def choose_track(info: dict, mode: str = 'manual') -> Optional[dict]:
+    """Best caption track in the spoken language, or None
+
+    Manual tracks win over automatic ones. Without a known spoken language only a
+    video with exactly one manual track qualifies, since any other track may be a
+    translation. Automatic tracks need the spoken language: platforms list machine
+    translations of their ASR track for every language.
+    """
+    if mode not in ('manual', 'auto'):
+        return None
+    spoken = base_language(info.get('language'))
+
+    manual = {code: formats for code, formats in (info.get('subtitles') or {}).items() if code != 'live_chat'}
+    if spoken:
+        manual = {code: formats for code, formats in manual.items() if base_language(code) == spoken}
+    elif len(manual) != 1:
+        manual = {}
+    for code, formats in sorted(manual.items(), key=lambda item: len(item[0])):  # 'en' before 'en-GB'
+        fmt = _pick_format(formats)
+        if fmt:
+            return {'code': code, 'language': base_language(code), 'ext': fmt['ext'], 'url': fmt['url'],
+                    'automatic': False}
+
+    if mode == 'auto' and spoken:
+        automatic = info.get('automatic_captions') or {}
+        # '<lang>-orig' is the untranslated ASR track where a platform marks it
+        for code in (f'{spoken}-orig', spoken):
+            fmt = _pick_format(automatic.get(code))
+            if fmt:
+                return {'code': code, 'language': spoken, 'ext': fmt['ext'], 'url': fmt['url'],
+                        'automatic': True}
+    return None
+
+
+def _clip_overlaps(segments: List[Dict]) -> List[Dict]:
+    """Rolling captions stay on screen under the next line; end each one where the next starts"""
+    for current, following in zip(segments, segments[1:]):
+        if current['end'] > following['start']:
+            current['end'] = max(current['start'], following['start'])
+    return segments
+
+
+def parse_json3(data: str) -> List[Dict]:
+    """Segments from a json3 caption file (events with tStartMs / dDurationMs / segs)"""
+    segments = []
+    for event in json.loads(data).get('events', []):
+        if 'segs' not in event or event.get('aAppend'):
+            continue
+        text = ' '.join(''.join(seg.get('utf8', '') for seg in event['segs']).split())
+        if not text:
+            continue
+        start = event.get('tStartMs', 0) / 1000
+        segments.append({'start': start, 'end': start + event.get('dDurationMs', 0) / 1000, 'text': text})
+    return _clip_overlaps(segments)
+
+
+def _vtt_seconds(timestamp: str) -> float:
+    seconds = 0.0
+    for part in timestamp.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_vtt(data: str) -> List[Dict]:
+    """Segments from a WebVTT file
+
+    Auto-generated tracks repeat the previous line at the top of every cue (roll-up
+    captions); lines already shown by the previous cue are dropped.
+    """
+    cues = []  # (start, end, text lines)
+    cue = None
+    for line in data.replace('\r\n', '\n').split('\n'):
+        timing = _VTT_TIMING.search(line)
+        if timing:
+            cue = (_vtt_seconds(timing.group(1)), _vtt_seconds(timing.group(2)), [])
+            cues.append(cue)
+        elif not line:
+            cue = None  # A blank line ends the cue; whitespace-only lines are cue text
+        elif cue is not None:
+            text = ' '.join(html.unescape(_TAG.sub('', line)).split())
+            if text:
+                cue[2].append(text)
+
+    segments = []
+    previous_lines = []
+    for start, end, lines in cues:
+        new_lines = [line for line in lines if line not in previous_lines]
+        previous_lines = lines
+        if new_lines:
+            segments.append({'start': start, 'end': end, 'text': ' '.join(new_lines)})
+    return _clip_overlaps(segments)
+
+
+def parse_captions(data: str, ext: str) -> List[Dict]:
+    return parse_json3(data) if ext == 'json3' else parse_vtt(data)
+
+
+def fetch_captions(url: str, mode: str = 'manual') -> Optional[Tuple[List[Dict], dict]]:
+    """(segments, track) from the video's published captions, or None when none is usable
+
+    mode: 'manual' (tracks uploaded by the creator) or 'auto' (also the platform's own ASR).
+
+    Costs one metadata request and one caption download, no media.
+    """
+    if mode not in ('manual', 'auto'):
+        return None
+
+    ydl_opts = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'noplaylist': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+        if not info or info.get('_type') == 'playlist':
+            return None
+        track = choose_track(info, mode)
+        if not track:
+            log.info('No usable platform captions', spoken_language=info.get('language'),
+                     manual=sorted(info.get('subtitles') or {}))
+            return None
+        # Through yt-dlp so its cookies / headers apply to the caption request too
+        data = ydl.urlopen(track['url']).read().decode('utf-8', errors='replace')
+
+    segments = parse_captions(data, track['ext'])
+    if not segments:
+        return None
+    track = {key: value for key, value in track.items() if key != 'url'}  # Signed, short-lived
+    log.info('Using platform captions', segments=len(segments), **track)
+    return segments, track
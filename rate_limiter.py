@@ -0,0 +1,161 @@
+"""
+Cluster-wide rate limiting for the Gemini API
+Token bucket and circuit breaker state live in Redis so every Celery worker shares them
+"""
+
+import random
+import time
+
+from tracing import get_logger
+
+log = get_logger('rate_limiter')
+
+# Atomically refill the bucket and take one token.
+# Returns the number of seconds the caller has to wait before retrying (0 = granted).
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class CircuitOpenError(Exception):
+    """Raised when the provider circuit stays open longer than the caller is willing to wait"""
+
+
+class RedisTokenBucket:
+    """Token bucket shared by all workers through Redis"""
+
+    def __init__(self, redis_client, key: str, requests_per_minute: float, burst: int):
+        self.redis = redis_client
+        self.key = key
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def try_acquire(self) -> float:
+        """Take one token; return 0 if granted, otherwise seconds to wait"""
+        try:
+            wait = self._script(keys=[self.key], args=[self.rate, self.capacity, time.time(), 1])
+            return float(wait)
+        except Exception as e:
+            # Fail open: a Redis outage should not stop translation altogether
+            log.warning('Rate limiter unavailable, continuing without it', error=str(e))
+            return 0.0
+
+    def acquire(self) -> float:
+        """Block until a token is available; return total seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return waited
+            # Small jitter so workers woken together don't collide again
+            wait += random.uniform(0, 0.1)
+            time.sleep(wait)
+            waited += wait
+
+
+class RedisCircuitBreaker:
+    """Circuit breaker whose state is shared by all workers through Redis
+
+    closed    - calls go through, retryable failures are counted
+    open      - calls pause until the reset timeout has passed
+    half-open - a single worker probes the provider; success closes the circuit,
+                failure opens it again
+    """
+
+    def __init__(self, redis_client, name: str, failure_threshold: int,
+                 reset_timeout: float, failure_window: float = 60.0):
+        self.redis = redis_client
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_window = failure_window
+        self.failures_key = f'circuit:{name}:failures'
+        self.open_key = f'circuit:{name}:open'
+        self.half_open_key = f'circuit:{name}:half_open'
+        self.probe_key = f'circuit:{name}:probe'
+
+    def state(self) -> str:
+        """Return 'open', 'half_open' or 'closed'"""
+        try:
+            if self.redis.exists(self.open_key):
+                return 'open'
+            if self.redis.exists(self.half_open_key):
+                return 'half_open'
+        except Exception as e:
+            log.warning('Circuit breaker unavailable', error=str(e))
+        return 'closed'
+
+    def before_call(self) -> float:
+        """Return 0 if a call may proceed, otherwise seconds to pause before asking again"""
+        try:
+            remaining_ms = self.redis.pttl(self.open_key)
+            if remaining_ms and remaining_ms > 0:
+                return remaining_ms / 1000.0
+
+            if self.redis.exists(self.half_open_key):
+                # Only one worker gets to probe the provider at a time
+                probe_ms = int(self.reset_timeout * 1000)
+                if self.redis.set(self.probe_key, '1', nx=True, px=probe_ms):
+                    return 0.0
+                return min(1.0, self.reset_timeout)
+        except Exception as e:
+            log.warning('Circuit breaker unavailable, continuing without it', error=str(e))
+        return 0.0
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        try:
+            self.redis.delete(self.failures_key, self.half_open_key, self.probe_key)
+        except Exception as e:
+            log.warning('Circuit breaker unavailable', error=str(e))
+
+    def record_failure(self):
+        """Count a provider failure and open the circuit when the threshold is reached"""
+        try:
+            if self.redis.exists(self.half_open_key):
+                self._open()
+                return
+
+            pipe = self.redis.pipeline()
+            pipe.incr(self.failures_key)
+            pipe.expire(self.failures_key, int(self.failure_window))
+            failures, _ = pipe.execute()
+
+            if int(failures) >= self.failure_threshold:
+                self._open()
+        except Exception as e:
+            log.warning('Circuit breaker unavailable', error=str(e))
+
+    def _open(self):
+        pipe = self.redis.pipeline()
+        pipe.set(self.open_key, '1', px=int(self.reset_timeout * 1000))
+        pipe.set(self.half_open_key, '1')
+        pipe.delete(self.failures_key, self.probe_key)
+        pipe.execute()
+        log.warning('Circuit opened after repeated provider failures', reset_seconds=self.reset_timeout)
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter (attempt starts at 1)"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
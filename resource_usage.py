@@ -0,0 +1,223 @@
+"""
+Per-stage resource accounting for the worker process and its subprocesses
+CPU time and I/O come from getrusage (self + reaped children) and /proc/self/io,
+which on Linux also includes reaped children. Peak RSS of each subprocess
+(ffmpeg, Whisper) is taken from os.wait4 when it is run through run(). Long-lived
+children registered with add_resident() (the resident Whisper process) are never
+reaped per job; their CPU time and peak RSS are read from /proc/<pid> instead.
+
+Counters are process-wide: with the default prefork pool one process runs one job
+at a time, so they belong to that job.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_MAXRSS_SCALE = 1 if sys.platform == 'darwin' else 1024
+_CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+_children_lock = threading.Lock()
+_children_peak_rss = 0
+_resident_pids = set()
+
+
+def add_resident(pid: int):
+    """Count a long-lived child process as part of every stage it works in"""
+    with _children_lock:
+        _resident_pids.add(pid)
+
+
+def remove_resident(pid: int):
+    """Stop reading /proc for a resident child (call after reaping it)"""
+    with _children_lock:
+        _resident_pids.discard(pid)
+
+
+def run(cmd, check: bool = False, stdin=None, stdout=None, stderr=None, text: bool = False,
+        timeout: float = None) -> subprocess.CompletedProcess:
+    """subprocess.run() that also records the child's peak RSS
+
+    Supports the options the pipeline uses: stdout PIPE or a file/DEVNULL,
+    stderr DEVNULL/None (not PIPE).
+    """
+    global _children_peak_rss
+    proc = subprocess.Popen(cmd, stdin=stdin, stdout=stdout, stderr=stderr, text=text)
+
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, _kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        output = proc.stdout.read() if proc.stdout else None
+        # Reap the child ourselves: wait4 returns its own rusage (Popen.wait() does not)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        if timer:
+            timer.cancel()
+        if proc.stdout:
+            proc.stdout.close()
+
+    with _children_lock:
+        _children_peak_rss = max(_children_peak_rss, usage.ru_maxrss * _MAXRSS_SCALE)
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout, output=output)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=output)
+    return subprocess.CompletedProcess(cmd, proc.returncode, output)
+
+
+def _read_proc_io() -> dict:
+    """Bytes read/written by this process and its reaped children (Linux only)"""
+    try:
+        with open('/proc/self/io') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return {'read': int(fields['read_bytes']), 'write': int(fields['write_bytes'])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _read_vm_hwm(pid='self') -> int:
+    """VmHWM of a process in bytes, or None without /proc"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _read_peak_rss() -> int:
+    """Peak RSS of this process since the last reset_peak_rss() (VmHWM)"""
+    peak = _read_vm_hwm()
+    if peak is not None:
+        return peak
+    # Without /proc only the lifetime peak is available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _MAXRSS_SCALE
+
+
+def _read_children_peak_rss() -> int:
+    """Peak RSS of reaped subprocesses and resident children since the last reset"""
+    with _children_lock:
+        pids = list(_resident_pids)
+        peak = _children_peak_rss
+    return max([peak] + [_read_vm_hwm(pid) or 0 for pid in pids])
+
+
+def _read_resident_cpu() -> tuple:
+    """(user, system) CPU seconds of the resident children so far"""
+    with _children_lock:
+        pids = list(_resident_pids)
+    user = system = 0.0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                # Fields after the parenthesised command name; utime and stime are 14th and 15th
+                fields = f.read().rsplit(')', 1)[1].split()
+            user += int(fields[11]) / _CLOCK_TICKS
+            system += int(fields[12]) / _CLOCK_TICKS
+        except (OSError, IndexError, ValueError):
+            pass
+    return user, system
+
+
+def reset_peak_rss():
+    """Restart the VmHWM high-water marks (Linux); ignored where unsupported"""
+    global _children_peak_rss
+    with _children_lock:
+        pids = list(_resident_pids)
+        _children_peak_rss = 0
+    for pid in ['self'] + pids:
+        try:
+            with open(f'/proc/{pid}/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+
+
+def snapshot() -> dict:
+    """Cumulative counters for this process plus its reaped and resident children"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    resident_user, resident_system = _read_resident_cpu()
+    io = _read_proc_io()
+    if io is None:
+        # Block I/O operations in 512-byte units (macOS, or /proc unavailable)
+        io = {
+            'read': (own.ru_inblock + children.ru_inblock) * 512,
+            'write': (own.ru_oublock + children.ru_oublock) * 512,
+        }
+    return {
+        'wall': time.monotonic(),
+        'cpu_user': own.ru_utime,
+        'cpu_system': own.ru_stime,
+        'children_cpu_user': children.ru_utime + resident_user,
+        'children_cpu_system': children.ru_stime + resident_system,
+        'io_read': io['read'],
+        'io_write': io['write'],
+    }
+
+
+def usage_between(start: dict, end: dict, peak_rss: int, children_peak_rss: int) -> dict:
+    """Resource usage between two snapshots, in seconds and bytes"""
+    return {
+        'wall_seconds': round(end['wall'] - start['wall'], 3),
+        'cpu_user_seconds': round(end['cpu_user'] - start['cpu_user'], 3),
+        'cpu_system_seconds': round(end['cpu_system'] - start['cpu_system'], 3),
+        'children_cpu_user_seconds': round(end['children_cpu_user'] - start['children_cpu_user'], 3),
+        'children_cpu_system_seconds': round(end['children_cpu_system'] - start['children_cpu_system'], 3),
+        'io_read_bytes': end['io_read'] - start['io_read'],
+        'io_write_bytes': end['io_write'] - start['io_write'],
+        'peak_rss_bytes': peak_rss,
+        'children_peak_rss_bytes': children_peak_rss,
+    }
+
+
+class StageMeter:
+    """Measures each pipeline stage of one job; switch() is called on every status update"""
+
+    def __init__(self):
+        reset_peak_rss()
+        self._job_start = snapshot()
+        self._stage = None
+        self._stage_start = None
+        self._job_peak_rss = 0
+        self._job_children_peak_rss = 0
+        self.stages = {}
+
+    def switch(self, stage: str = None):
+        """Close the current stage and start `stage` (None just closes it)"""
+        if stage == self._stage:
+            return
+        if self._stage is not None:
+            peak_rss = _read_peak_rss()
+            children_peak_rss = _read_children_peak_rss()
+            self.stages[self._stage] = usage_between(self._stage_start, snapshot(), peak_rss, children_peak_rss)
+            self._job_peak_rss = max(self._job_peak_rss, peak_rss)
+            self._job_children_peak_rss = max(self._job_children_peak_rss, children_peak_rss)
+        self._stage = stage
+        if stage is not None:
+            reset_peak_rss()
+            self._stage_start = snapshot()
+
+    def report(self) -> dict:
+        """{'stages': {stage: usage}, 'total': usage of the whole job so far}"""
+        peak_rss = max(self._job_peak_rss, _read_peak_rss())
+        children_peak_rss = max(self._job_children_peak_rss, _read_children_peak_rss())
+        return {
+            'stages': dict(self.stages),
+            'total': usage_between(self._job_start, snapshot(), peak_rss, children_peak_rss),
+        }
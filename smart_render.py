@@ -0,0 +1,231 @@
+"""
+Smart-render subtitle burn: re-encode only the GOPs that show a subtitle
+Keyframe times from ffprobe split the source into GOPs. Runs of GOPs that overlap an
+ASS dialogue event are decoded, burned and re-encoded with the same encoder settings
+as the full burn; every other run is stream-copied in one ffmpeg pass (segment muxer).
+The pieces are joined with the concat demuxer and the original audio is muxed back
+once, so audio is never cut.
+
+Pieces are MPEG-TS, so every re-encoded run carries its own SPS/PPS in-band. Only
+closed-GOP H.264 in 8-bit 4:2:0 (what yt-dlp's mp4 selector returns) is supported;
+smart_burn returns None for anything else and the caller burns the whole video.
+The joined file is checked against the source from packet metadata (frame count and
+timing, a keyframe at every cut, audio / video offset); a bad splice raises SpliceError
+so the caller falls back to the full burn as well.
+"""
+
+import json
+import os
+import re
+import subprocess
+from typing import List, Optional, Tuple
+
+import resource_usage
+from tracing import get_logger, span
+
+log = get_logger('smart_render')
+
+# Above this share of re-encoded frames the piecewise overhead is not worth it
+MAX_REENCODE_FRACTION = 0.8
+
+# Cut points sit this far before a keyframe, so rounding never drops or repeats a frame
+_EPSILON = 0.001
+
+_X264_PROFILES = {'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high'}
+_ASS_DIALOGUE = re.compile(r'^Dialogue:\s*[^,]*,(\d+):(\d{2}):(\d{2}\.\d+),(\d+):(\d{2}):(\d{2}\.\d+),')
+
+
+def _run(cmd: list, capture: bool = False) -> str:
+    result = resource_usage.run(cmd, check=True, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE if capture else subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL, text=capture)
+    return result.stdout if capture else ''
+
+
+def probe(video_path: str) -> dict:
+    """Codec parameters of the first video stream and the container duration"""
+    output = _run(['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+                   '-show_entries', 'stream=codec_name,pix_fmt,profile,level,time_base:format=duration',
+                   '-of', 'json', video_path], capture=True)
+    data = json.loads(output)
+    stream = (data.get('streams') or [{}])[0]
+    return {**stream, 'duration': float(data.get('format', {}).get('duration') or 0)}
+
+
+class SpliceError(Exception):
+    """The joined video does not match the source frame for frame"""
+
+
+def packets(video_path: str, stream: str = 'v:0', first_only: bool = False) -> List[Tuple[float, bool]]:
+    """(pts seconds, keyframe) of every packet in presentation order (nothing is decoded)"""
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', stream]
+    if first_only:
+        cmd += ['-read_intervals', '%+#1']
+    output = _run(cmd + ['-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path], capture=True)
+    result = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.strip().rstrip(',').partition(',')
+        if pts_time not in ('', 'N/A'):
+            result.append((float(pts_time), 'K' in flags))
+    return sorted(result)
+
+
+def keyframe_times(video_path: str) -> List[float]:
+    """Presentation times of the video keyframes (from packet flags)"""
+    return sorted({pts for pts, keyframe in packets(video_path) if keyframe})
+
+
+def subtitle_intervals(subtitle_path: str) -> List[Tuple[float, float]]:
+    """(start, end) seconds of every ASS dialogue event"""
+    intervals = []
+    with open(subtitle_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = _ASS_DIALOGUE.match(line)
+            if match:
+                h1, m1, s1, h2, m2, s2 = match.groups()
+                start = int(h1) * 3600 + int(m1) * 60 + float(s1)
+                end = int(h2) * 3600 + int(m2) * 60 + float(s2)
+                if end > start:
+                    intervals.append((start, end))
+    return sorted(intervals)
+
+
+def plan_runs(keyframes: List[float], duration: float,
+              intervals: List[Tuple[float, float]]) -> List[Tuple[float, float, bool]]:
+    """Consecutive GOPs grouped into (start, end, reencode) runs
+
+    A GOP [keyframe, next keyframe) is re-encoded when any subtitle interval overlaps it.
+    """
+    # Frames before a late first keyframe belong to the first GOP
+    bounds = [0.0] + [t for t in keyframes if 0 < t < duration] + [duration]
+    runs = []
+    i = 0
+    for start, end in zip(bounds, bounds[1:]):
+        # Intervals are sorted: skip those that ended before this GOP
+        while i < len(intervals) and intervals[i][1] <= start:
+            i += 1
+        reencode = i < len(intervals) and intervals[i][0] < end
+        if runs and runs[-1][2] == reencode:
+            runs[-1] = (runs[-1][0], end, reencode)
+        else:
+            runs.append((start, end, reencode))
+    return runs
+
+
+def _encoder_args(info: dict) -> list:
+    """libx264 settings of the full burn (default CRF / preset), constrained to the source's
+    profile, level and pixel format so decoders accept the joined stream"""
+    args = ['-c:v', 'libx264', '-pix_fmt', info['pix_fmt'], '-profile:v', _X264_PROFILES[info['profile']]]
+    if info.get('level', 0) > 0:
+        args += ['-level', f"{info['level'] / 10:.1f}"]
+    return args
+
+
+def verify_splice(video_path: str, output_path: str, runs: List[Tuple[float, float, bool]]):
+    """Raise SpliceError unless the joined video has the source's frames at the source's
+    times, starts a GOP at every run boundary and keeps the source's audio / video offset"""
+    source, joined = packets(video_path), packets(output_path)
+    if len(joined) != len(source):
+        raise SpliceError(f'{len(joined)} video frames instead of {len(source)}')
+    if not source:
+        return
+
+    # Half the shortest frame interval: anything further off is a different frame
+    intervals = [b - a for (a, _), (b, _) in zip(source, source[1:]) if b > a]
+    tolerance = min(intervals) / 2 if intervals else _EPSILON
+    source_start, joined_start = source[0][0], joined[0][0]
+    drift = max(abs((j - joined_start) - (s - source_start)) for (s, _), (j, _) in zip(source, joined))
+    if drift > tolerance:
+        raise SpliceError(f'frame times differ from the source by up to {drift:.3f}s')
+
+    keyframes = [pts - joined_start for pts, keyframe in joined if keyframe]
+    for start, _, _ in runs[1:]:
+        if not any(abs(pts - (start - source_start)) <= tolerance for pts in keyframes):
+            raise SpliceError(f'no keyframe at the cut at {start:.3f}s')
+
+    # The source audio is muxed back as-is, so its offset to the video must be unchanged
+    source_audio, joined_audio = packets(video_path, 'a:0', True), packets(output_path, 'a:0', True)
+    if source_audio and joined_audio:
+        offset = (joined_audio[0][0] - joined_start) - (source_audio[0][0] - source_start)
+        if abs(offset) > tolerance:
+            raise SpliceError(f'audio shifted by {offset:.3f}s against the video')
+
+
+def smart_burn(video_path: str, subtitle_path: str, output_path: str, work_dir: str) -> Optional[dict]:
+    """Burn ASS subtitles re-encoding only the GOPs they appear in
+
+    Returns stats (GOP / seconds re-encoded vs copied), or None when the source is not
+    suitable and the whole video should be burned instead; raises SpliceError when the
+    joined output does not match the source. Pieces go to work_dir.
+    """
+    info = probe(video_path)
+    if (info.get('codec_name') != 'h264' or info.get('pix_fmt') != 'yuv420p'
+            or info.get('profile') not in _X264_PROFILES or not info['duration']):
+        log.info('Smart render not applicable', codec=info.get('codec_name'), pix_fmt=info.get('pix_fmt'),
+                 profile=info.get('profile'))
+        return None
+
+    keyframes = keyframe_times(video_path)
+    runs = plan_runs(keyframes, info['duration'], subtitle_intervals(subtitle_path))
+    reencoded = sum(end - start for start, end, reencode in runs if reencode)
+    stats = {
+        'gops': len(keyframes),
+        'runs': len(runs),
+        'reencoded_seconds': round(reencoded, 3),
+        'copied_seconds': round(info['duration'] - reencoded, 3),
+    }
+    if not keyframes or reencoded > MAX_REENCODE_FRACTION * info['duration']:
+        log.info('Smart render not worth it', **stats)
+        return None
+
+    os.makedirs(work_dir, exist_ok=True)
+    pieces = [os.path.join(work_dir, f'piece_{index:05d}.ts') for index in range(len(runs))]
+
+    # Every run boundary is a keyframe: one copy pass cuts the source into one file per run
+    if any(not reencode for _, _, reencode in runs):
+        cut_times = ','.join(f'{start - _EPSILON:.6f}' for start, _, _ in runs[1:])
+        cmd = ['ffmpeg', '-i', video_path, '-map', '0:v:0', '-c', 'copy', '-f', 'segment',
+               '-segment_format', 'mpegts', '-reset_timestamps', '1']
+        cmd += (['-segment_times', cut_times] if cut_times else [])
+        cmd += ['-y', os.path.join(work_dir, 'copy_%05d.ts')]
+        with span('smart_render_copy', runs=sum(1 for run in runs if not run[2])):
+            _run(cmd)
+
+    with span('smart_render_encode', seconds=stats['reencoded_seconds']):
+        for index, (start, end, reencode) in enumerate(runs):
+            copy_piece = os.path.join(work_dir, f'copy_{index:05d}.ts')
+            if not reencode:
+                os.replace(copy_piece, pieces[index])
+                continue
+            if os.path.exists(copy_piece):
+                os.remove(copy_piece)
+            # Seek just before the keyframe; shift timestamps back so the ASS events line up
+            seek = max(0.0, start - _EPSILON)
+            cmd = ['ffmpeg', '-ss', f'{seek:.6f}', '-i', video_path]
+            if end < info['duration']:
+                # Output timestamps restart at the keyframe (PTS-STARTPTS): stop before the next one
+                cmd += ['-t', f'{end - start - _EPSILON:.6f}']
+            cmd += ['-map', '0:v:0',
+                    '-vf', f"setpts=PTS+{seek:.6f}/TB,ass={subtitle_path},setpts=PTS-STARTPTS"]
+            cmd += _encoder_args(info) + ['-f', 'mpegts', '-y', pieces[index]]
+            _run(cmd)
+
+    concat_list = os.path.join(work_dir, 'pieces.txt')
+    with open(concat_list, 'w', encoding='utf-8') as f:
+        f.writelines(f"file '{os.path.abspath(piece)}'\n" for piece in pieces)
+
+    # Joined video + the untouched audio of the source, on the source's video timescale
+    # rather than MPEG-TS 90 kHz, so frame times match the source's
+    cmd = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_list, '-i', video_path,
+           '-map', '0:v:0', '-map', '1:a?', '-c', 'copy']
+    timescale = info.get('time_base', '').partition('1/')[2]
+    if timescale.isdigit():
+        cmd += ['-video_track_timescale', timescale]
+    cmd += ['-movflags', '+faststart', '-y', output_path]
+    with span('smart_render_join', pieces=len(pieces)):
+        _run(cmd)
+    with span('smart_render_verify'):
+        verify_splice(video_path, output_path, runs)
+
+    log.info('Smart render complete', **stats)
+    return stats
@@ -43,9 +43,10 @@ cleanup() {
 
 trap cleanup INT TERM
 
-# Start Celery Worker
+# Start Celery Worker (pool grows / shrinks with the queue, see autoscaler.py)
 echo "🔧 Starting Celery Worker..."
-celery -A tasks.celery worker --loglevel=info > logs/celery_worker.log 2>&1 &
+celery -A tasks.celery worker --loglevel=info \
+    --autoscale="${AUTOSCALE_MAX_WORKERS:-4},${AUTOSCALE_MIN_WORKERS:-1}" > logs/celery_worker.log 2>&1 &
 CELERY_WORKER_PID=$!
 
 # Start Celery Beat
@@ -58,7 +59,7 @@ sleep 3
 
 # Start Flask Application
 echo "🚀 Starting Flask Application..."
-python app.py &
+gunicorn -c gunicorn.conf.py > logs/web.log 2>&1 &
 FLASK_PID=$!
 
 echo ""
@@ -1,4 +1,5 @@
 #!/bin/bash
 source venv/bin/activate
 echo "Starting Celery worker..."
-celery -A tasks worker --loglevel=info
+# Pool grows / shrinks with the queue between these bounds (see autoscaler.py)
+celery -A tasks worker --loglevel=info --autoscale="${AUTOSCALE_MAX_WORKERS:-4},${AUTOSCALE_MIN_WORKERS:-1}"
@@ -21,12 +21,24 @@ const errorMessage = document.getElementById('error-message');
 
 const resultVideo = document.getElementById('result-video');
 const videoSource = document.getElementById('video-source');
+const previewContainer = document.getElementById('preview-container');
+const previewVideo = document.getElementById('preview-video');
+const previewLabel = document.getElementById('preview-label');
 
 // State
 let currentTaskId = null;
 let currentFilename = null;
 let statusCheckInterval = null;
 let isProcessing = false;
+let previewMode = null;  // null, 'proxy' (low-res file) or 'hls' (full quality, still encoding)
+let hlsPlayer = null;
+let statusEtag = null;  // ETag of the last status seen; unchanged polls get 304 and no body
+
+// Only the fields the UI reads (the timing / resources blobs keep growing)
+const STATUS_FIELDS = 'status,progress,message,rendition,preview_file,hls,output_file';
+
+// hls.js is only loaded for browsers without native HLS playback
+const HLS_JS_URL = 'https://cdn.jsdelivr.net/npm/hls.js@1/dist/hls.min.js';
 
 // Stage mapping
 const stageMapping = {
@@ -134,6 +146,7 @@ async function startProcessing() {
 }
 
 function startStatusPolling() {
+    statusEtag = null;
     statusCheckInterval = setInterval(checkStatus, 2000);
     checkStatus(); // Check immediately
 }
@@ -142,10 +155,21 @@ async function checkStatus() {
     if (!currentTaskId) return;
 
     try {
-        const response = await fetch(`${API_BASE}/api/status/${currentTaskId}`);
-        const data = await response.json();
+        const taskId = currentTaskId;
+        const headers = statusEtag ? { 'If-None-Match': statusEtag } : {};
+        const response = await fetch(
+            `${API_BASE}/api/status?ids=${encodeURIComponent(taskId)}&fields=${STATUS_FIELDS}`,
+            { headers }
+        );
+        // 304: nothing changed since the last poll (or the task was reset meanwhile)
+        if (response.status === 304 || taskId !== currentTaskId) return;
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        
+        statusEtag = response.headers.get('ETag');
+        const data = (await response.json()).statuses[taskId];
 
         updateProgress(data);
+        updatePreview(data);
 
         if (data.status === 'completed') {
             clearInterval(statusCheckInterval);
@@ -228,10 +252,69 @@ function updateProgress(data) {
     }
 }
 
+function updatePreview(data) {
+    // Full-quality HLS beats the low-resolution proxy; both play before the burn finishes
+    if (data.hls === 'live' && previewMode !== 'hls') {
+        playHls(`${API_BASE}/api/hls/${currentTaskId}/index.m3u8`);
+    } else if (data.rendition === 'preview' && previewMode === null) {
+        previewMode = 'proxy';
+        previewLabel.textContent = 'پیش‌نمایش سریع (کیفیت پایین) - نسخه نهایی در حال آماده‌سازی است';
+        previewVideo.src = `${API_BASE}/api/preview/${data.preview_file}`;
+        previewContainer.classList.remove('hidden');
+    }
+}
+
+function playHls(playlistUrl) {
+    previewMode = 'hls';
+    previewLabel.textContent = 'پخش در حین پردازش - ادامه ویدئو در حال آماده‌سازی است';
+    previewContainer.classList.remove('hidden');
+    
+    // Safari / iOS play HLS natively
+    if (previewVideo.canPlayType('application/vnd.apple.mpegurl')) {
+        previewVideo.src = playlistUrl;
+        return;
+    }
+    
+    loadHlsJs().then(Hls => {
+        if (previewMode !== 'hls' || !Hls.isSupported()) return;
+        // The playlist keeps growing: start from the beginning, not the live edge
+        hlsPlayer = new Hls({ startPosition: 0 });
+        hlsPlayer.loadSource(playlistUrl);
+        hlsPlayer.attachMedia(previewVideo);
+    }).catch(error => console.error('Could not load hls.js:', error));
+}
+
+function loadHlsJs() {
+    if (window.Hls) return Promise.resolve(window.Hls);
+    
+    return new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = HLS_JS_URL;
+        script.onload = () => resolve(window.Hls);
+        script.onerror = () => reject(new Error(`failed to load ${HLS_JS_URL}`));
+        document.head.appendChild(script);
+    });
+}
+
+function hidePreview() {
+    if (hlsPlayer) {
+        hlsPlayer.destroy();
+        hlsPlayer = null;
+    }
+    previewMode = null;
+    previewVideo.pause();
+    previewVideo.removeAttribute('src');
+    previewVideo.load();
+    previewContainer.classList.add('hidden');
+}
+
 function handleCompletion(data) {
     // Extract filename from response
     currentFilename = data.output_file;
     
+    // The final MP4 replaces the proxy / HLS stream
+    hidePreview();
+    
     // Hide progress, show result
     progressSection.classList.add('hidden');
     resultSection.classList.remove('hidden');
@@ -246,6 +329,7 @@ function showError(message) {
     progressSection.classList.add('hidden');
     resultSection.classList.add('hidden');
     errorSection.classList.remove('hidden');
+    hidePreview();
     
     errorMessage.textContent = message;
 }
@@ -297,6 +381,7 @@ function resetApp() {
     }
     
     // Reset UI
+    hidePreview();
     videoUrlInput.value = '';
     resetButton();
     
@@ -0,0 +1,211 @@
+"""
+Quota-based storage manager for output files and task temp directories
+Each artifact's size, owner task, expiry and last access are indexed in Redis,
+so cleanup never has to walk OUTPUT_FOLDER / UPLOAD_FOLDER.
+"""
+
+import os
+import shutil
+import time
+
+from tracing import get_logger
+
+log = get_logger('storage')
+
+# Record (or re-record) an artifact and keep the byte total consistent
+REGISTER_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if old then
+    redis.call('INCRBY', KEYS[5], -tonumber(old))
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+return redis.call('INCRBY', KEYS[5], ARGV[2])
+"""
+
+# Drop an artifact from the index; returns 1 only for the caller that removed it
+FORGET_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[1])
+if not old then
+    return 0
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+redis.call('INCRBY', KEYS[5], -tonumber(old))
+return 1
+"""
+
+
+class StorageManager:
+    """Tracks artifacts in Redis and evicts them by expiry or LRU when over quota
+
+    is_task_active(task_id) -> bool decides whether a task still needs its files;
+    artifacts of active tasks are never deleted.
+    """
+
+    SIZES_KEY = 'storage:sizes'
+    OWNERS_KEY = 'storage:owners'
+    EXPIRY_KEY = 'storage:expiry'
+    LRU_KEY = 'storage:lru'
+    TOTAL_KEY = 'storage:total_bytes'
+    INDEXED_KEY = 'storage:indexed'
+
+    # How far to push back the expiry of an artifact whose task is still running
+    ACTIVE_GRACE_SECONDS = 3600
+
+    def __init__(self, redis_client, quota_bytes: int, retention_seconds: float, is_task_active=None):
+        self.redis = redis_client
+        self.quota_bytes = quota_bytes
+        self.retention_seconds = retention_seconds
+        self.is_task_active = is_task_active or (lambda task_id: False)
+        self._register = redis_client.register_script(REGISTER_SCRIPT)
+        self._forget = redis_client.register_script(FORGET_SCRIPT)
+
+    @property
+    def _keys(self):
+        return [self.SIZES_KEY, self.OWNERS_KEY, self.EXPIRY_KEY, self.LRU_KEY, self.TOTAL_KEY]
+
+    def register(self, path: str, task_id: str, retention_seconds: float = None, enforce_quota: bool = True) -> int:
+        """Index a new artifact (file or directory) and enforce the quota; returns total bytes stored"""
+        size = _path_size(path)
+        now = time.time()
+        expiry = now + (retention_seconds if retention_seconds is not None else self.retention_seconds)
+
+        total = int(self._register(keys=self._keys, args=[path, size, task_id or '', expiry, now]))
+
+        if enforce_quota and self.quota_bytes and total > self.quota_bytes:
+            self.enforce_quota()
+            total = self.total_bytes()
+        return total
+
+    def touch(self, path: str):
+        """Mark an artifact as recently used (downloads and previews)"""
+        self.redis.zadd(self.LRU_KEY, {path: time.time()}, xx=True)
+
+    def remove(self, path: str) -> bool:
+        """Delete an artifact from disk, then from the index; False if it stays on disk"""
+        if not self.redis.hexists(self.SIZES_KEY, path):
+            return False
+
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except FileNotFoundError:
+            pass  # Deleted concurrently
+        except OSError as e:
+            # Keep it indexed so the next cleanup retries and the quota stays honest
+            log.warning('Could not delete artifact', path=path, error=str(e))
+            return False
+        return bool(int(self._forget(keys=self._keys, args=[path])))
+
+    def forget(self, path: str) -> bool:
+        """Drop an artifact from the index without touching the disk (already deleted)"""
+        return bool(int(self._forget(keys=self._keys, args=[path])))
+
+    def total_bytes(self) -> int:
+        return int(self.redis.get(self.TOTAL_KEY) or 0)
+
+    def _owner_active(self, path: str) -> bool:
+        task_id = self.redis.hget(self.OWNERS_KEY, path)
+        return bool(task_id) and self.is_task_active(task_id)
+
+    def enforce_quota(self) -> list:
+        """Evict least recently used artifacts until the total fits the quota"""
+        evicted = []
+        if not self.quota_bytes:
+            return evicted
+
+        start = 0
+        batch = 50
+        while self.total_bytes() > self.quota_bytes:
+            candidates = self.redis.zrange(self.LRU_KEY, start, start + batch - 1)
+            if not candidates:
+                # Everything left belongs to running tasks or could not be deleted
+                log.warning('Storage over quota but remaining files belong to active tasks '
+                            'or could not be deleted',
+                            total_bytes=self.total_bytes(), quota_bytes=self.quota_bytes)
+                break
+
+            pass_start, pass_evicted = start, len(evicted)
+            for path in candidates:
+                if self.total_bytes() <= self.quota_bytes:
+                    break
+                if self._owner_active(path):
+                    start += 1
+                    continue
+                if self.remove(path):
+                    evicted.append(path)
+                    log.info('Evicted (quota)', file=os.path.basename(path))
+                else:
+                    # Still indexed (delete failed): skip it like an active task's file
+                    start += 1
+            if start == pass_start and len(evicted) == pass_evicted:
+                # A pass that neither evicted nor skipped anything would repeat forever
+                break
+
+        return evicted
+
+    def expire_due(self, now: float = None) -> list:
+        """Delete artifacts whose retention has passed"""
+        now = now or time.time()
+        expired = []
+
+        for path in self.redis.zrangebyscore(self.EXPIRY_KEY, '-inf', now):
+            if self._owner_active(path):
+                # Never delete files of a running task; check again later
+                self.redis.zadd(self.EXPIRY_KEY, {path: now + self.ACTIVE_GRACE_SECONDS}, xx=True)
+                continue
+            if self.remove(path):
+                expired.append(path)
+                log.info('Deleted expired file', file=os.path.basename(path))
+
+        return expired
+
+    def ensure_indexed(self, folders):
+        """One-time scan that indexes files written before the storage index existed"""
+        if not self.redis.set(self.INDEXED_KEY, '1', nx=True):
+            return 0
+
+        count = 0
+        for folder in folders:
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                if self.redis.hexists(self.SIZES_KEY, path):
+                    continue
+                # Keep the original age-based retention for pre-existing files
+                age = time.time() - os.path.getmtime(path)
+                self.register(path, _task_id_from_name(name),
+                              retention_seconds=self.retention_seconds - age, enforce_quota=False)
+                count += 1
+
+        if count:
+            log.info('Indexed existing files', count=count)
+        return count
+
+
+def _path_size(path: str) -> int:
+    """Size of a file, or the total size of a directory tree"""
+    if os.path.isdir(path):
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _task_id_from_name(name: str) -> str:
+    """Task ids are uuid4 strings at the start of every artifact name"""
+    return name[:36]
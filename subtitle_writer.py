@@ -0,0 +1,146 @@
+"""
+Batched subtitle rendering (SRT / ASS / VTT)
+Renders a whole segment list in one pass and writes it with a single buffered write.
+Output is byte-identical to the original per-segment writers in GeminiVideoProcessor.
+"""
+
+from typing import Dict, List, Tuple
+from bidi_fixer import ENGLISH_PATTERN, LRM, RLE, PDF
+
+# Joins all subtitle texts so the bidi regex runs once per file instead of once per line.
+# NUL never appears in subtitle text and is not matched by ENGLISH_PATTERN.
+_BATCH_SEPARATOR = '\x00'
+
+# ASS header with Persian font settings
+# BackColour: &H66000000 = 40% transparent black background (66 hex = 102 decimal)
+# BorderStyle=4 for background box (valid values: 1, 3, 4)
+# Outline=4 for thicker outline
+# Using Vazirmatn font for better Persian text rendering
+# Font size: 70 (35% increase from 52)
+ASS_HEADER = """[Script Info]
+Title: Auto-generated Persian Subtitles (Gemini AI)
+ScriptType: v4.00+
+WrapStyle: 0
+PlayResX: 1920
+PlayResY: 1080
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Vazirmatn,70,&H00FFFFFF,&H000088EF,&H00000000,&H66000000,-1,0,0,0,100,100,0,0,4,4,0,2,10,10,10,178
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def _clock(seconds: float, scale: int) -> Tuple[int, int, int, int]:
+    """Split seconds into (hours, minutes, seconds, fraction * scale) with integer math.
+
+    The fractional part is exact (x - int(x) never rounds), so truncating it
+    gives the same digits as the original float-modulo formatting.
+    """
+    whole = int(seconds)
+    minutes, secs = divmod(whole, 60)
+    hours, minutes = divmod(minutes, 60)
+    return hours, minutes, secs, int((seconds - whole) * scale)
+
+
+def format_timestamp_srt(seconds: float) -> str:
+    """Format seconds to SRT timestamp format (HH:MM:SS,mmm)"""
+    return '%02d:%02d:%02d,%03d' % _clock(seconds, 1000)
+
+
+def format_timestamp_vtt(seconds: float) -> str:
+    """Format seconds to WebVTT timestamp format (HH:MM:SS.mmm)"""
+    return '%02d:%02d:%02d.%03d' % _clock(seconds, 1000)
+
+
+def format_timestamp_ass(seconds: float) -> str:
+    """Format seconds to ASS timestamp format (H:MM:SS.cc)"""
+    return '%d:%02d:%02d.%02d' % _clock(seconds, 100)
+
+
+def fix_bidi_batch(texts: List[str]) -> List[str]:
+    """Apply fix_bidi_text to every text with a single regex pass
+
+    Splitting on the capturing pattern yields [text, match, text, match, ...],
+    so joining the pieces with LRM wraps every match in LRM...LRM without a
+    per-match Python callback.
+    """
+    if not texts:
+        return []
+
+    joined = LRM.join(ENGLISH_PATTERN.split(_BATCH_SEPARATOR.join(texts)))
+
+    fixed = []
+    for original, text in zip(texts, joined.split(_BATCH_SEPARATOR)):
+        # Same rule as fix_bidi_text: empty / whitespace-only text is left untouched
+        if not original or original.isspace():
+            fixed.append(original)
+        else:
+            fixed.append(f'{RLE}{text}{PDF}')
+    return fixed
+
+
+def _texts(segments: List[Dict], bidi: bool) -> List[str]:
+    texts = [segment['text'] for segment in segments]
+    return fix_bidi_batch(texts) if bidi else texts
+
+
+def render_srt(segments: List[Dict], bidi: bool = True) -> str:
+    """Render segments as SRT text"""
+    template = '%d\n%02d:%02d:%02d,%03d --> %02d:%02d:%02d,%03d\n%s\n\n'
+    return ''.join([
+        template % (i, *_clock(segment['start'], 1000), *_clock(segment['end'], 1000), text)
+        for i, (segment, text) in enumerate(zip(segments, _texts(segments, bidi)), 1)
+    ])
+
+
+def render_ass(segments: List[Dict], bidi: bool = True, header: str = ASS_HEADER) -> str:
+    """Render segments as ASS text"""
+    template = 'Dialogue: 0,%d:%02d:%02d.%02d,%d:%02d:%02d.%02d,Default,,0,0,0,,%s\n'
+    return header + ''.join([
+        template % (*_clock(segment['start'], 100), *_clock(segment['end'], 100), text.replace('\n', '\\N'))
+        for segment, text in zip(segments, _texts(segments, bidi))
+    ])
+
+
+def _vtt_text(text: str) -> str:
+    # A blank line would end the cue early
+    if '\n' not in text:
+        return text
+    return '\n'.join(line for line in text.split('\n') if line.strip())
+
+
+def render_vtt(segments: List[Dict], bidi: bool = True) -> str:
+    """Render segments as WebVTT text"""
+    template = '%02d:%02d:%02d.%03d --> %02d:%02d:%02d.%03d\n%s\n\n'
+    return 'WEBVTT\n\n' + ''.join([
+        template % (*_clock(segment['start'], 1000), *_clock(segment['end'], 1000), _vtt_text(text))
+        for segment, text in zip(segments, _texts(segments, bidi))
+    ])
+
+
+RENDERERS = {
+    'srt': render_srt,
+    'ass': render_ass,
+    'vtt': render_vtt,
+}
+
+
+def write_subtitles(segments: List[Dict], output_path: str, fmt: str = None, bidi: bool = True) -> str:
+    """Render segments and write them with a single buffered write
+
+    The format is taken from the file extension unless fmt is given.
+    """
+    if fmt is None:
+        fmt = output_path.rsplit('.', 1)[-1].lower()
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unsupported subtitle format: {fmt}")
+
+    content = RENDERERS[fmt](segments, bidi=bidi)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+    return output_path
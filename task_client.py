@@ -0,0 +1,328 @@
+"""
+Thin task-submission and status API used by the web process
+Only Redis and the small manager modules are imported here; Celery is created on
+first use and jobs are sent by task name, so the API never loads the worker's
+ML / download stack (Gemini, yt-dlp, Whisper).
+"""
+
+import os
+import shutil
+import json
+import time
+from datetime import datetime
+import redis
+from config import Config
+from storage_manager import StorageManager
+from batch_manager import BatchManager
+from tracing import get_logger
+
+log = get_logger('task_client')
+
+# Shared by the API (producer) and the worker (tasks.py)
+CELERY_SETTINGS = {
+    'broker_url': Config.CELERY_BROKER_URL,
+    'result_backend': Config.CELERY_RESULT_BACKEND,
+    'task_serializer': 'json',
+    'result_serializer': 'json',
+    'accept_content': ['json'],
+    'timezone': 'UTC',
+    'enable_utc': True,
+    # Jobs run for minutes: reserve one at a time so queued jobs go to idle processes,
+    # and acknowledge after completion so a crashed worker's job is not lost
+    'worker_prefetch_multiplier': 1,
+    'task_acks_late': True,
+    'broker_transport_options': {'visibility_timeout': Config.CELERY_VISIBILITY_TIMEOUT},
+}
+
+_celery = None
+
+
+def get_celery():
+    """Celery app, created on first use (importing Celery pulls in kombu)"""
+    global _celery
+    if _celery is None:
+        from celery import Celery
+        _celery = Celery('tasks')
+        _celery.conf.update(CELERY_SETTINGS)
+    return _celery
+
+
+# Initialize Redis for persistent task status storage
+redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+
+# Task status storage (in production, use Redis or database)
+# Keeping this for backward compatibility but will use Redis primarily
+task_status_storage = {}
+
+# Celery id of each job, kept in Redis so any web worker can revoke it
+CELERY_ID_TTL = 86400
+
+# Statuses after which a task no longer needs its files
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled', 'not_found')
+
+# Job modes accepted by process_video_task
+JOB_MODES = ('video', 'subtitles')
+SUBTITLE_FORMATS = ('srt', 'ass', 'vtt')
+
+
+def store_celery_id(task_id: str, celery_id: str):
+    redis_client.setex(f'task_celery_id:{task_id}', CELERY_ID_TTL, celery_id)
+
+
+def is_task_active(task_id: str) -> bool:
+    """True while a task may still read or write its files"""
+    return get_task_status(task_id).get('status') not in TERMINAL_STATUSES
+
+
+# Size / expiry index for output files and temp dirs
+storage_manager = StorageManager(
+    redis_client,
+    quota_bytes=Config.STORAGE_QUOTA_BYTES,
+    retention_seconds=Config.FILE_RETENTION_HOURS * 3600,
+    is_task_active=is_task_active
+)
+
+
+def update_task_status(task_id: str, status: str, message: str, progress: int = 0, resources: dict = None,
+                       **kwargs):
+    """Update task status in storage - now persisted in Redis
+
+    resources ({'stages': {...}, 'total': {...}} from resource_usage.StageMeter) is stored
+    with the timing data: per stage under stages[stage]['resources'], the job total under 'resources'.
+    """
+    current_time = datetime.utcnow()
+    
+    status_data = {
+        'status': status,
+        'message': message,
+        'progress': progress,
+        'updated_at': current_time.isoformat()
+    }
+    
+    # Track timing for each stage
+    timing_key = f'task_timing:{task_id}'
+    
+    # Get existing timing data
+    existing_timing = redis_client.get(timing_key)
+    if existing_timing:
+        timing_data = json.loads(existing_timing)
+    else:
+        timing_data = {'start_time': current_time.isoformat(), 'stages': {}}
+    
+    # List of stages in order
+    stage_order = ['downloading', 'transcribing', 'translating', 'generating_subtitles', 'burning_subtitles']
+    
+    # Update stage timing
+    if status in stage_order:
+        # Complete previous stage if it exists and doesn't have duration
+        current_index = stage_order.index(status)
+        if current_index > 0:
+            prev_stage = stage_order[current_index - 1]
+            if prev_stage in timing_data['stages'] and 'duration' not in timing_data['stages'][prev_stage]:
+                stage_start = datetime.fromisoformat(timing_data['stages'][prev_stage]['start'])
+                duration = (current_time - stage_start).total_seconds()
+                timing_data['stages'][prev_stage]['duration'] = duration
+        
+        # Start current stage if not already started
+        if status not in timing_data['stages']:
+            timing_data['stages'][status] = {'start': current_time.isoformat()}
+    
+    # If completed, calculate total time and complete last stage
+    if status == 'completed':
+        # Complete the last stage (burning_subtitles, or generating_subtitles for subtitles-only jobs)
+        for stage in stage_order:
+            if stage in timing_data['stages'] and 'duration' not in timing_data['stages'][stage]:
+                stage_start = datetime.fromisoformat(timing_data['stages'][stage]['start'])
+                duration = (current_time - stage_start).total_seconds()
+                timing_data['stages'][stage]['duration'] = duration
+        
+        # Calculate total duration
+        start_time = datetime.fromisoformat(timing_data['start_time'])
+        total_duration = (current_time - start_time).total_seconds()
+        timing_data['total_duration'] = total_duration
+    
+    # CPU / memory / I/O measured by the worker
+    if resources:
+        for stage, usage in resources.get('stages', {}).items():
+            timing_data['stages'].setdefault(stage, {})['resources'] = usage
+        timing_data['resources'] = resources.get('total')
+    
+    # Store timing data
+    redis_client.setex(timing_key, 86400, json.dumps(timing_data))
+    
+    # Always include timing data in status (not just on completion)
+    status_data['timing'] = timing_data
+    
+    # Add any additional fields (like output_file, detected_language, etc.)
+    status_data.update(kwargs)
+    
+    # Store in Redis with 24-hour expiration
+    try:
+        redis_client.setex(
+            f'task_status:{task_id}',
+            86400,  # 24 hours in seconds
+            json.dumps(status_data)
+        )
+    except Exception as e:
+        log.warning('Redis error, falling back to memory', task_id=task_id, error=str(e))
+        # Fallback to memory storage
+        task_status_storage[task_id] = status_data
+
+
+NOT_FOUND_STATUS = {
+    'status': 'not_found',
+    'message': 'Task not found',
+    'progress': 0
+}
+
+
+def get_task_status(task_id: str) -> dict:
+    """Retrieve task status from storage - now from Redis"""
+    try:
+        # Try to get from Redis first
+        status_json = redis_client.get(f'task_status:{task_id}')
+        if status_json:
+            return json.loads(status_json)
+    except Exception as e:
+        log.warning('Redis error, falling back to memory', task_id=task_id, error=str(e))
+    
+    # Fallback to memory storage
+    return task_status_storage.get(task_id, dict(NOT_FOUND_STATUS))
+
+
+def get_task_status_blobs(task_ids: list) -> list:
+    """Raw status JSON of many tasks with one MGET (None for unknown tasks)
+
+    Left unparsed so callers can compare / hash them before paying for json.loads.
+    """
+    try:
+        return redis_client.mget([f'task_status:{task_id}' for task_id in task_ids])
+    except Exception as e:
+        log.warning('Redis error, falling back to memory', tasks=len(task_ids), error=str(e))
+    return [json.dumps(task_status_storage[task_id]) if task_id in task_status_storage else None
+            for task_id in task_ids]
+
+
+def submit_video_task(url: str, task_id: str, mode: str = 'video', subtitle_formats: list = None,
+                      source_path: str = None, batch_id: str = None, languages: list = None):
+    """Queue tasks.process_video_task by name"""
+    kwargs = {'batch_id': batch_id} if batch_id else {}
+    if languages:
+        kwargs['languages'] = languages
+    result = get_celery().send_task(
+        'tasks.process_video_task',
+        args=[url, task_id, mode, subtitle_formats, source_path],
+        kwargs=kwargs
+    )
+    store_celery_id(task_id, result.id)
+    return result
+
+
+def submit_playlist_expansion(batch_id: str, playlist_url: str):
+    """Queue tasks.expand_playlist_task by name"""
+    return get_celery().send_task('tasks.expand_playlist_task', args=[batch_id, playlist_url])
+
+
+def submit_batch_item(url: str, task_id: str, mode: str, formats: list, batch_id: str, languages: list = None):
+    """Start one batch item as a regular processing task"""
+    submit_video_task(url, task_id, mode, formats, batch_id=batch_id, languages=languages)
+
+
+# Bounded fan-out for batch / playlist submissions
+batch_manager = BatchManager(redis_client, submit=submit_batch_item)
+
+
+def start_batch(batch_id: str, urls: list) -> list:
+    """Queue URLs in a batch, mark them queued and start the first max_concurrency items"""
+    task_ids = batch_manager.add_items(batch_id, urls)
+    for task_id in task_ids:
+        update_task_status(task_id, 'queued', 'در صف پردازش', 0, batch_id=batch_id)
+    batch_manager.dispatch(batch_id)
+    return task_ids
+
+
+def cleanup_temp_files(temp_dir: str):
+    """Remove temporary files"""
+    try:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+        storage_manager.forget(temp_dir)
+    except Exception as e:
+        log.warning('Error cleaning up temporary files', temp_dir=temp_dir, error=str(e))
+
+def cancel_task(task_id: str) -> bool:
+    """Cancel a running task; False when there was nothing to revoke"""
+    try:
+        # Finished jobs keep their final status
+        if get_task_status(task_id).get('status') in TERMINAL_STATUSES:
+            return False
+        celery_task_id = redis_client.get(f'task_celery_id:{task_id}')
+        
+        if celery_task_id:
+            # Revoke the task
+            get_celery().control.revoke(celery_task_id, terminate=True, signal='SIGKILL')
+            
+            # Update status (keep batch membership so the batch slot can be released)
+            batch_id = get_task_status(task_id).get('batch_id')
+            update_task_status(task_id, 'cancelled', 'Task cancelled by user', 0, batch_id=batch_id)
+            
+            # A killed task never reaches its finally block
+            if batch_id:
+                batch_manager.item_finished(batch_id)
+            
+            # Clean up temp files
+            temp_dir = os.path.join(Config.UPLOAD_FOLDER, task_id)
+            cleanup_temp_files(temp_dir)
+            
+            # Remove from tracking
+            redis_client.delete(f'task_celery_id:{task_id}')
+            
+            return True
+        else:
+            # Task not found or already completed
+            return False
+    
+    except Exception as e:
+        log.warning('Error cancelling task', task_id=task_id, error=str(e))
+        return False
+
+
+# Warm worker processes ('<host>:<pid>') scored by their last heartbeat; entries not
+# refreshed within WORKER_READY_TTL belong to crashed workers and are pruned on read
+WORKER_READY_KEY = 'workers_ready'
+WORKER_READY_TTL = 60
+
+
+def worker_ready_member(hostname: str, pid: int) -> str:
+    return f'{hostname}:{pid}'
+
+
+def publish_worker_ready(member: str):
+    redis_client.zadd(WORKER_READY_KEY, {member: time.time()})
+
+
+def withdraw_worker_ready(member: str):
+    redis_client.zrem(WORKER_READY_KEY, member)
+
+
+def count_ready_workers() -> int:
+    """Number of worker processes that finished warming up"""
+    pipe = redis_client.pipeline()
+    pipe.zremrangebyscore(WORKER_READY_KEY, '-inf', time.time() - WORKER_READY_TTL)
+    pipe.zcard(WORKER_READY_KEY)
+    return pipe.execute()[1]
+
+
+# Autoscaler decisions (autoscaler.py), newest first
+AUTOSCALER_DECISIONS_KEY = 'autoscaler:decisions'
+AUTOSCALER_COUNTERS_KEY = 'autoscaler:counters'
+AUTOSCALER_MAX_DECISIONS = 1000
+
+
+def get_autoscaler_metrics(limit: int = 50) -> dict:
+    """Recent scaling decisions of all workers and how often each action was taken"""
+    decisions = redis_client.lrange(AUTOSCALER_DECISIONS_KEY, 0, max(0, limit - 1))
+    return {
+        'decisions': [json.loads(decision) for decision in decisions],
+        'counters': {action: int(count) for action, count in redis_client.hgetall(AUTOSCALER_COUNTERS_KEY).items()},
+    }
@@ -1,128 +1,210 @@
+"""
+Celery worker: task definitions and per-process warm state
+The web process does not import this module; it submits jobs and reads status
+through task_client.
+"""
+
 import os
-import shutil
-import json
-from datetime import datetime, timedelta
-from celery import Celery
+import socket
+import threading
+from contextlib import ExitStack
+from celery.signals import worker_process_init, worker_process_shutdown
 from config import Config
 from video_processor_gemini import GeminiVideoProcessor
-import redis
+from rate_limiter import RedisTokenBucket, RedisCircuitBreaker
+from download_cache import DownloadCache
+from transcript_cache import TranscriptCache
+from resource_usage import StageMeter
+import tracing
+from task_client import (get_celery, redis_client, store_celery_id, update_task_status, storage_manager,
+                         batch_manager, start_batch, cleanup_temp_files, worker_ready_member,
+                         publish_worker_ready, withdraw_worker_ready, WORKER_READY_TTL, SUBTITLE_FORMATS)
 import multiprocessing
 
 # Force spawn method for multiprocessing (Mac compatibility for PyTorch/Whisper)
 multiprocessing.set_start_method('spawn', force=True)
 
-# Initialize Celery
-celery = Celery('tasks')
-celery.conf.broker_url = Config.CELERY_BROKER_URL
-celery.conf.result_backend = Config.CELERY_RESULT_BACKEND
-celery.conf.task_serializer = 'json'
-celery.conf.result_serializer = 'json'
-celery.conf.accept_content = ['json']
-celery.conf.timezone = 'UTC'
-celery.conf.enable_utc = True
+# Initialize Celery (same app and settings the API uses to submit jobs)
+celery = get_celery()
+# Used when the worker runs with --autoscale=MAX,MIN
+celery.conf.worker_autoscaler = 'autoscaler:QueueDepthAutoscaler'
 
-# Initialize Redis for persistent task status storage
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+# Structured logs and per-task trace files
+tracing.configure(Config.LOG_LEVEL, Config.TRACE_FOLDER)
+log = tracing.get_logger('tasks')
 
-# Task status storage (in production, use Redis or database)
-# Keeping this for backward compatibility but will use Redis primarily
-task_status_storage = {}
+# Gemini throttling shared by every worker in the cluster
+gemini_rate_limiter = RedisTokenBucket(
+    redis_client,
+    'ratelimit:gemini',
+    requests_per_minute=Config.GEMINI_REQUESTS_PER_MINUTE,
+    burst=Config.GEMINI_BURST
+)
+gemini_circuit_breaker = RedisCircuitBreaker(
+    redis_client,
+    'gemini',
+    failure_threshold=Config.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=Config.GEMINI_CIRCUIT_RESET_SECONDS
+)
+# Downloads shared across tasks on this host
+download_cache = DownloadCache(
+    Config.DOWNLOAD_CACHE_FOLDER,
+    max_bytes=Config.DOWNLOAD_CACHE_MAX_BYTES,
+    concurrent_fragments=Config.DOWNLOAD_CONCURRENT_FRAGMENTS
+) if Config.DOWNLOAD_CACHE_MAX_BYTES else None
 
-# Track Celery task IDs for cancellation
-celery_task_ids = {}
+# Whisper output shared across URLs of the same audio
+transcript_cache = TranscriptCache(
+    redis_client,
+    max_entries=Config.TRANSCRIPT_CACHE_MAX_ENTRIES,
+    max_ber=Config.TRANSCRIPT_CACHE_MAX_BER
+) if Config.TRANSCRIPT_CACHE_MAX_ENTRIES else None
 
+# Per-worker-process warm state, built in worker_process_init and reused by every task
+worker_processor = None
+worker_ready = False
+_worker_lock = threading.Lock()
+_worker_heartbeat = threading.Event()
 
-def update_task_status(task_id: str, status: str, message: str, progress: int = 0, **kwargs):
-    """Update task status in storage - now persisted in Redis"""
-    current_time = datetime.utcnow()
-    
-    status_data = {
-        'status': status,
-        'message': message,
-        'progress': progress,
-        'updated_at': current_time.isoformat()
-    }
-    
-    # Track timing for each stage
-    timing_key = f'task_timing:{task_id}'
-    
-    # Get existing timing data
-    existing_timing = redis_client.get(timing_key)
-    if existing_timing:
-        timing_data = json.loads(existing_timing)
-    else:
-        timing_data = {'start_time': current_time.isoformat(), 'stages': {}}
-    
-    # List of stages in order
-    stage_order = ['downloading', 'transcribing', 'translating', 'generating_subtitles', 'burning_subtitles']
-    
-    # Update stage timing
-    if status in stage_order:
-        # Complete previous stage if it exists and doesn't have duration
-        current_index = stage_order.index(status)
-        if current_index > 0:
-            prev_stage = stage_order[current_index - 1]
-            if prev_stage in timing_data['stages'] and 'duration' not in timing_data['stages'][prev_stage]:
-                stage_start = datetime.fromisoformat(timing_data['stages'][prev_stage]['start'])
-                duration = (current_time - stage_start).total_seconds()
-                timing_data['stages'][prev_stage]['duration'] = duration
-        
-        # Start current stage if not already started
-        if status not in timing_data['stages']:
-            timing_data['stages'][status] = {'start': current_time.isoformat()}
-    
-    # If completed, calculate total time and complete last stage
-    if status == 'completed':
-        # Complete the last stage (burning_subtitles)
-        if 'burning_subtitles' in timing_data['stages'] and 'duration' not in timing_data['stages']['burning_subtitles']:
-            stage_start = datetime.fromisoformat(timing_data['stages']['burning_subtitles']['start'])
-            duration = (current_time - stage_start).total_seconds()
-            timing_data['stages']['burning_subtitles']['duration'] = duration
-        
-        # Calculate total duration
-        start_time = datetime.fromisoformat(timing_data['start_time'])
-        total_duration = (current_time - start_time).total_seconds()
-        timing_data['total_duration'] = total_duration
-    
-    # Store timing data
-    redis_client.setex(timing_key, 86400, json.dumps(timing_data))
-    
-    # Always include timing data in status (not just on completion)
-    status_data['timing'] = timing_data
-    
-    # Add any additional fields (like output_file, detected_language, etc.)
-    status_data.update(kwargs)
-    
-    # Store in Redis with 24-hour expiration
+
+def build_processor() -> GeminiVideoProcessor:
+    """Create the Gemini processor (load_whisper=False: Whisper runs in a resident subprocess)"""
+    return GeminiVideoProcessor(
+        gemini_api_key=os.getenv('GEMINI_API_KEY'),
+        load_whisper=False,
+        rate_limiter=gemini_rate_limiter,
+        circuit_breaker=gemini_circuit_breaker,
+        max_retries=Config.GEMINI_MAX_RETRIES,
+        backoff_base=Config.GEMINI_BACKOFF_BASE,
+        backoff_max=Config.GEMINI_BACKOFF_MAX,
+        circuit_max_wait=Config.GEMINI_CIRCUIT_MAX_WAIT,
+        download_cache=download_cache,
+        concurrent_fragments=Config.DOWNLOAD_CONCURRENT_FRAGMENTS,
+        transcript_cache=transcript_cache,
+        preview_height=Config.PREVIEW_PROXY_HEIGHT,
+        hls_segment_seconds=Config.HLS_SEGMENT_SECONDS,
+        language_detect_model=Config.LANGUAGE_DETECT_MODEL,
+        language_detect_min_probability=Config.LANGUAGE_DETECT_MIN_PROBABILITY,
+        platform_captions=Config.PLATFORM_CAPTIONS,
+        smart_render=Config.SMART_RENDER
+    )
+
+
+def get_processor() -> GeminiVideoProcessor:
+    """Return this process's processor, building it on first use"""
+    global worker_processor
+    with _worker_lock:
+        if worker_processor is None:
+            worker_processor = build_processor()
+        return worker_processor
+
+
+def _worker_ready_member() -> str:
+    return worker_ready_member(socket.gethostname(), os.getpid())
+
+
+def _warm_up_worker():
+    """Build the processor, open the Gemini connection and start the resident Whisper process"""
+    global worker_ready
     try:
-        redis_client.setex(
-            f'task_status:{task_id}',
-            86400,  # 24 hours in seconds
-            json.dumps(status_data)
-        )
+        get_processor().warm_up()
+        worker_ready = True
+        log.info('Worker process is warm', pid=os.getpid())
+        
+        # Publish readiness until the process shuts down
+        while not _worker_heartbeat.is_set():
+            try:
+                publish_worker_ready(_worker_ready_member())
+            except Exception as e:
+                log.warning('Could not publish worker readiness', error=str(e))
+            _worker_heartbeat.wait(WORKER_READY_TTL / 3)
     except Exception as e:
-        print(f"Redis error, falling back to memory: {e}")
-        # Fallback to memory storage
-        task_status_storage[task_id] = status_data
+        log.error('Worker warm-up failed', error=str(e))
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Warm each pool process after fork (gRPC channels must not be shared across fork)
+
+    Warm-up runs in a background thread: Celery kills pool processes whose init
+    takes longer than a few seconds, and Whisper weights may need downloading.
+    """
+    threading.Thread(target=_warm_up_worker, name='worker-warmup', daemon=True).start()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Withdraw this process's readiness flag and stop its resident Whisper process"""
+    _worker_heartbeat.set()
+    try:
+        withdraw_worker_ready(_worker_ready_member())
+    except Exception:
+        pass
+    if worker_processor and worker_processor.whisper_worker:
+        worker_processor.whisper_worker.close()
 
 
 @celery.task(bind=True)
-def process_video_task(self, url: str, task_id: str):
-    """Background task for video processing"""
+def process_video_task(self, url: str, task_id: str, mode: str = 'video', subtitle_formats: list = None,
+                       source_path: str = None, batch_id: str = None, languages: list = None):
+    """Background task for video processing
+
+    mode='video' burns Persian subtitles into the video.
+    mode='subtitles' downloads audio only and returns subtitle files (no video download, no burn).
+    source_path points at an uploaded file in the task's temp dir; the download stage is skipped.
+    batch_id is set for items of a batch; finishing releases a slot for the next item.
+    languages lists target language codes: download and Whisper run once, translation
+    runs per language, and video jobs with several languages get a multi-track MKV.
+    """
+    languages = languages or [Config.DEFAULT_TARGET_LANGUAGE]
+    
+    # Stored with every status update
+    job_fields = {'mode': mode, 'languages': languages}
+    if batch_id:
+        job_fields['batch_id'] = batch_id
+    if mode != 'subtitles':
+        # Playable rendition: None, 'preview' (low-res proxy) or 'final'
+        job_fields['rendition'] = None
+    
+    # Every log line and trace span of this job carries its task_id
+    task_context = tracing.current_task_id.set(task_id)
+    job_span = ExitStack()
+    job_span.enter_context(tracing.span('job', mode=mode, languages=languages, batch_id=batch_id))
+    
     try:
         # Store Celery task ID for potential cancellation
-        celery_task_ids[task_id] = self.request.id
+        store_celery_id(task_id, self.request.id)
         
         # Create temporary directory for this task
         temp_dir = os.path.join(Config.UPLOAD_FOLDER, task_id)
         os.makedirs(temp_dir, exist_ok=True)
+        storage_manager.register(temp_dir, task_id, enforce_quota=False)
         
-        # Initialize Gemini processor (load_whisper=False to avoid fork issues)
-        # Whisper will be loaded lazily when needed in transcribe_audio()
-        processor = GeminiVideoProcessor(gemini_api_key=os.getenv('GEMINI_API_KEY'), load_whisper=False)
+        # Reuse this worker process's warm processor
+        processor = get_processor()
         
-        # Status callback
-        def status_callback(status: str, message: str):
+        # Per-stage CPU, peak RSS and I/O of this process and its ffmpeg / Whisper children
+        meter = StageMeter()
+        
+        # Preview proxy of a video job, replaced by the final file once it is ready
+        preview_paths = []
+        # HLS directory of a video job, playable while the burn is still running
+        hls_dirs = []
+        
+        # Status callback (extra fields such as translation_stats are stored with the status)
+        def status_callback(status: str, message: str, **extra):
+            if 'preview_file' in extra:
+                preview_path = extra.pop('preview_file')
+                storage_manager.register(preview_path, task_id)
+                preview_paths.append(preview_path)
+                # Kept in job_fields so every later update still reports it
+                job_fields.update(rendition='preview', preview_file=os.path.basename(preview_path))
+            if 'hls_playlist' in extra:
+                hls_dir = os.path.dirname(extra.pop('hls_playlist'))
+                storage_manager.register(hls_dir, task_id, enforce_quota=False)
+                hls_dirs.append(hls_dir)
+                job_fields['hls'] = 'live'
+            meter.switch(status)
             progress_map = {
                 'downloading': 20,
                 'transcribing': 40,
@@ -130,28 +212,88 @@ def process_video_task(self, url: str, task_id: str):
                 'generating_subtitles': 80,
                 'burning_subtitles': 90
             }
-            update_task_status(task_id, status, message, progress_map.get(status, 0))
+            update_task_status(task_id, status, message, progress_map.get(status, 0),
+                               resources=meter.report(), **job_fields, **extra)
         
         # Initial status
-        update_task_status(task_id, 'started', 'آماده دریافت درخواست', 0)
+        update_task_status(task_id, 'started', 'آماده دریافت درخواست', 0, **job_fields)
+        
+        if mode == 'subtitles':
+            # Subtitles only: audio download, ASR and translation
+            result = processor.process_subtitles(
+                url=url,
+                temp_dir=temp_dir,
+                output_dir=Config.OUTPUT_FOLDER,
+                status_callback=status_callback,
+                formats=subtitle_formats or SUBTITLE_FORMATS,
+                source_path=source_path,
+                languages=languages
+            )
+        else:
+            # Process video
+            result = processor.process_video(
+                url=url,
+                temp_dir=temp_dir,
+                output_dir=Config.OUTPUT_FOLDER,
+                status_callback=status_callback,
+                source_path=source_path,
+                languages=languages
+            )
+        
+        # Close the last stage's measurement
+        meter.switch(None)
         
-        # Process video
-        result = processor.process_video(
-            url=url,
-            temp_dir=temp_dir,
-            output_dir=Config.OUTPUT_FOLDER,
-            status_callback=status_callback
-        )
+        # The preview is only served until the final file exists
+        for path in preview_paths:
+            storage_manager.remove(path)
+        job_fields.pop('preview_file', None)
+        if mode != 'subtitles':
+            job_fields['rendition'] = 'final' if result['success'] else None
+        for hls_dir in hls_dirs:
+            if result['success']:
+                # Re-index with the final size of all segments
+                storage_manager.register(hls_dir, task_id)
+                job_fields['hls'] = 'complete'
+            else:
+                storage_manager.remove(hls_dir)
+                job_fields.pop('hls', None)
         
         if result['success']:
+            if mode == 'subtitles':
+                outputs = {
+                    'subtitle_files': {
+                        fmt: os.path.basename(path) for fmt, path in result['subtitle_files'].items()
+                    }
+                }
+                if len(languages) > 1:
+                    outputs['subtitle_tracks'] = {
+                        code: {fmt: os.path.basename(path) for fmt, path in files.items()}
+                        for code, files in result['subtitle_tracks'].items()
+                    }
+                output_paths = [path for files in result['subtitle_tracks'].values() for path in files.values()]
+            else:
+                outputs = {'output_file': os.path.basename(result['output_file'])}
+                output_paths = [result['output_file']]
+            
+            # Index the new outputs; evicts least recently used files if over quota
+            for path in output_paths:
+                storage_manager.register(path, task_id)
+            
             update_task_status(
                 task_id, 
                 'completed', 
                 'پردازش با موفقیت انجام شد', 
                 100,
-                output_file=os.path.basename(result['output_file']),
+                resources=meter.report(),
+                **job_fields,
                 detected_language=result.get('detected_language'),
-                segments_count=result.get('segments_count')
+                segments_count=result.get('segments_count'),
+                transcript_cache_hit=result.get('transcript_cache_hit'),
+                asr_skipped=result.get('asr_skipped'),
+                caption_track=result.get('caption_track'),
+                translation_skipped=result.get('translation_skipped'),
+                translation_stats=result.get('translation_stats'),
+                **outputs
             )
             
             # Clean up temporary files
@@ -159,12 +301,21 @@ def process_video_task(self, url: str, task_id: str):
             
             return {
                 'status': 'completed',
-                'output_file': os.path.basename(result['output_file']),
+                'mode': mode,
                 'detected_language': result.get('detected_language'),
-                'segments_count': result.get('segments_count')
+                'segments_count': result.get('segments_count'),
+                **outputs
             }
         else:
-            update_task_status(task_id, 'failed', f'خطا در پردازش: {result["error"]}', 0)
+            update_task_status(
+                task_id,
+                'failed',
+                f'خطا در پردازش: {result["error"]}',
+                0,
+                resources=meter.report(),
+                **job_fields,
+                translation_stats=result.get('translation_stats')
+            )
             cleanup_temp_files(temp_dir)
             
             return {
@@ -173,7 +324,7 @@ def process_video_task(self, url: str, task_id: str):
             }
     
     except Exception as e:
-        update_task_status(task_id, 'failed', f'خطای سیستمی: {str(e)}', 0)
+        update_task_status(task_id, 'failed', f'خطای سیستمی: {str(e)}', 0, **job_fields)
         
         # Clean up on error
         if 'temp_dir' in locals():
@@ -183,102 +334,86 @@ def process_video_task(self, url: str, task_id: str):
             'status': 'failed',
             'error': str(e)
         }
+    
+    finally:
+        job_span.close()
+        trace_file = tracing.trace_path(task_id)
+        if trace_file and os.path.exists(trace_file):
+            storage_manager.register(trace_file, task_id, enforce_quota=False)
+        tracing.current_task_id.reset(task_context)
+        
+        # Let the next item of the batch start
+        if batch_id:
+            batch_manager.item_finished(batch_id)
 
 
-def cleanup_temp_files(temp_dir: str):
-    """Remove temporary files"""
+def expand_playlist(playlist_url: str, max_items: int) -> list:
+    """List the video URLs of a playlist with yt-dlp flat extraction (no per-video requests)"""
+    import yt_dlp
+    
+    ydl_opts = {
+        'extract_flat': 'in_playlist',
+        'skip_download': True,
+        'quiet': True,
+        'no_warnings': True,
+        'playlistend': max_items,
+    }
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(playlist_url, download=False)
+    
+    entries = info.get('entries') if info.get('_type') == 'playlist' else [info]
+    
+    urls = []
+    for entry in entries or []:
+        if not entry:
+            continue
+        url = entry.get('webpage_url') or entry.get('url')
+        if url and url.startswith(('http://', 'https://')):
+            urls.append(url)
+    return urls[:max_items]
+
+
+@celery.task
+def expand_playlist_task(batch_id: str, playlist_url: str):
+    """Expand a playlist into batch items and start the fan-out"""
     try:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        urls = expand_playlist(playlist_url, Config.BATCH_MAX_ITEMS)
+        if not urls:
+            batch_manager.set_state(batch_id, 'failed', error='Playlist has no videos')
+            return {'status': 'failed', 'error': 'Playlist has no videos'}
+        
+        start_batch(batch_id, urls)
+        return {'status': 'running', 'items': len(urls)}
+    
     except Exception as e:
-        print(f"Error cleaning up temporary files: {e}")
+        batch_manager.set_state(batch_id, 'failed', error=str(e))
+        return {'status': 'failed', 'error': str(e)}
 
 
 @celery.task
 def cleanup_old_files():
-    """Periodic task to delete old output files"""
+    """Periodic task: delete expired artifacts and enforce the storage quota from the Redis index"""
     try:
-        retention_hours = Config.FILE_RETENTION_HOURS
-        cutoff_time = datetime.utcnow() - timedelta(hours=retention_hours)
-        
-        # Clean output folder
-        for filename in os.listdir(Config.OUTPUT_FOLDER):
-            file_path = os.path.join(Config.OUTPUT_FOLDER, filename)
-            
-            if os.path.isfile(file_path):
-                file_modified = datetime.fromtimestamp(os.path.getmtime(file_path))
-                
-                if file_modified < cutoff_time:
-                    os.remove(file_path)
-                    print(f"Deleted old file: {filename}")
+        # Pick up files written before the index existed (runs once)
+        storage_manager.ensure_indexed([Config.OUTPUT_FOLDER, Config.UPLOAD_FOLDER])
         
-        # Clean temp folder
-        for task_dir in os.listdir(Config.UPLOAD_FOLDER):
-            task_path = os.path.join(Config.UPLOAD_FOLDER, task_dir)
-            
-            if os.path.isdir(task_path):
-                dir_modified = datetime.fromtimestamp(os.path.getmtime(task_path))
-                
-                if dir_modified < cutoff_time:
-                    shutil.rmtree(task_path)
-                    print(f"Deleted old task directory: {task_dir}")
+        storage_manager.expire_due()
+        storage_manager.enforce_quota()
     
     except Exception as e:
-        print(f"Error in cleanup task: {e}")
+        log.error('Error in cleanup task', error=str(e))
 
 
-# Configure periodic cleanup (every hour)
+# Configure periodic cleanup (every 5 minutes - cheap, no directory walks)
 celery.conf.beat_schedule = {
     'cleanup-old-files': {
         'task': 'tasks.cleanup_old_files',
-        'schedule': 3600.0,  # Every hour
+        'schedule': 300.0,
     },
 }
 
 
-def get_task_status(task_id: str) -> dict:
-    """Retrieve task status from storage - now from Redis"""
-    try:
-        # Try to get from Redis first
-        status_json = redis_client.get(f'task_status:{task_id}')
-        if status_json:
-            return json.loads(status_json)
-    except Exception as e:
-        print(f"Redis error, falling back to memory: {e}")
-    
-    # Fallback to memory storage
-    return task_status_storage.get(task_id, {
-        'status': 'not_found',
-        'message': 'Task not found',
-        'progress': 0
-    })
 
 
-def cancel_task(task_id: str) -> bool:
-    """Cancel a running task"""
-    try:
-        # Get the Celery task ID
-        celery_task_id = celery_task_ids.get(task_id)
-        
-        if celery_task_id:
-            # Revoke the task
-            celery.control.revoke(celery_task_id, terminate=True, signal='SIGKILL')
-            
-            # Update status
-            update_task_status(task_id, 'cancelled', 'Task cancelled by user', 0)
-            
-            # Clean up temp files
-            temp_dir = os.path.join(Config.UPLOAD_FOLDER, task_id)
-            cleanup_temp_files(temp_dir)
-            
-            # Remove from tracking
-            celery_task_ids.pop(task_id, None)
-            
-            return True
-        else:
-            # Task not found or already completed
-            return False
-    
-    except Exception as e:
-        print(f"Error cancelling task {task_id}: {e}")
-        return False
+
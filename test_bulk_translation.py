@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Bulk translation test against a local Translation API stub
+Runs VideoProcessor.translate_segments through the real translate_v2 client pointed at
+an in-process HTTP server that answers /language/translate/v2, counts requests and
+concurrent requests, and checks that every segment gets its own translation back.
+
+No Google credentials or network access are needed.
+
+Usage: python test_bulk_translation.py [--segments 600] [--latency-ms 50]
+"""
+
+import argparse
+import json
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import translate_v2 as translate
+
+import video_processor
+from video_processor import VideoProcessor
+
+
+class TranslateStub(ThreadingHTTPServer):
+    """POST /language/translate/v2: translation of `q[i]` is '<target>:' + q[i]"""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float):
+        super().__init__(('127.0.0.1', 0), TranslateStubHandler)
+        self.latency = latency
+        self.requests = []  # strings per request
+        self.request_chars = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class TranslateStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        if self.path.split('?')[0] != '/language/translate/v2':
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        values = body['q'] if isinstance(body['q'], list) else [body['q']]
+
+        with server.lock:
+            server.requests.append(len(values))
+            server.request_chars.append(sum(len(v) for v in values))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.latency)
+        with server.lock:
+            server.in_flight -= 1
+
+        payload = json.dumps({'data': {'translations': [
+            {'translatedText': f"{body['target']}:{value}", 'detectedSourceLanguage': 'en'}
+            for value in values
+        ]}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def check(name: str, ok: bool, detail: str = '') -> bool:
+    symbol = "✅" if ok else "❌"
+    print(f"{symbol} {name}" + (f": {detail}" if detail else ''))
+    return ok
+
+
+def make_segments(count: int) -> list:
+    # Varying lengths so the character cap, not only the count cap, splits batches
+    return [
+        {'start': i * 2.0, 'end': i * 2.0 + 1.5, 'text': f'segment {i} ' + 'word ' * (i % 17)}
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk translation against a local stub')
+    parser.add_argument('--segments', type=int, default=600)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    server = TranslateStub(latency=args.latency_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = translate.Client(credentials=AnonymousCredentials(), client_options={'api_endpoint': server.url})
+    processor = VideoProcessor(streaming=False, speech_client=object(), translate_client=client)
+
+    segments = make_segments(args.segments)
+    total_chars = sum(len(segment['text']) for segment in segments)
+    started = time.perf_counter()
+    translated = processor.translate_segments(segments, 'fa')
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    print(f"{args.segments} segments ({total_chars} chars) in {elapsed:.2f}s, "
+          f"{len(server.requests)} requests, up to {server.max_in_flight} in flight "
+          f"(one request per segment at {args.latency_ms:g} ms would take "
+          f"{args.segments * args.latency_ms / 1000:.1f}s)")
+
+    min_requests = max(math.ceil(args.segments / video_processor.TRANSLATE_BATCH_SEGMENTS),
+                       math.ceil(total_chars / video_processor.TRANSLATE_BATCH_CHARS))
+    mapped = all(
+        out['text'] == f"fa:{seg['text']}" and out['start'] == seg['start'] and out['end'] == seg['end']
+        for seg, out in zip(segments, translated)
+    )
+
+    results = [
+        check('Request count', min_requests <= len(server.requests) <= min_requests + 2,
+              f'{len(server.requests)} requests (at least {min_requests} needed)'),
+        check('Batch size caps',
+              max(server.requests) <= video_processor.TRANSLATE_BATCH_SEGMENTS
+              and max(server.request_chars) <= video_processor.TRANSLATE_BATCH_CHARS,
+              f'largest batch {max(server.requests)} segments / {max(server.request_chars)} chars'),
+        check('Concurrent batches',
+              1 < server.max_in_flight <= video_processor.TRANSLATE_CONCURRENCY
+              or len(server.requests) == 1,
+              f'{server.max_in_flight} in flight'),
+        check('Results mapped back by index', len(translated) == len(segments) and mapped),
+        check('Empty input makes no request', processor.translate_segments([], 'fa') == []),
+    ]
+
+    print()
+    if not all(results):
+        print("❌ Bulk translation test failed")
+        sys.exit(1)
+    print("✅ Bulk translation OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the Flask API process
+Imports app.py in a fresh interpreter with `python -X importtime` and fails if
+startup exceeds the budget or pulls in the worker's ML / download stack.
+
+Usage: python test_import_time.py [--budget-ms 600] [--runs 3]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules only the Celery worker (tasks.py) may load
+FORBIDDEN_MODULES = (
+    'tasks',
+    'video_processor_gemini',
+    'yt_dlp',
+    'google.generativeai',
+    'whisper',
+    'torch',
+    'kombu',
+)
+
+DEFAULT_BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', 600))
+
+
+def measure_import(module: str = 'app') -> tuple:
+    """Import `module` in a new interpreter; returns (cumulative ms, set of loaded modules)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{result.stderr[-2000:]}')
+
+    # Lines look like: "import time:   self [us] |  cumulative |  [indent]package"
+    loaded = set()
+    total_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        loaded.add(name)
+        if name == module:
+            total_us = int(cumulative)
+
+    return total_us / 1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check API import time')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    # Best of N runs: the first one also pays for a cold disk cache
+    timings = []
+    loaded = set()
+    for _ in range(args.runs):
+        elapsed_ms, loaded = measure_import('app')
+        timings.append(elapsed_ms)
+    best = min(timings)
+
+    failures = []
+    heavy = sorted(m for m in FORBIDDEN_MODULES if m in loaded)
+    if heavy:
+        failures.append(f'API process imports worker-only modules: {", ".join(heavy)}')
+    if best > args.budget_ms:
+        failures.append(f'import app took {best:.0f} ms (budget {args.budget_ms:.0f} ms)')
+
+    print(f"import app: best {best:.0f} ms over {args.runs} runs "
+          f"({', '.join(f'{t:.0f}' for t in timings)} ms), budget {args.budget_ms:.0f} ms")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+
+    print("✅ API startup within budget")
+
+
+if __name__ == '__main__':
+    main()
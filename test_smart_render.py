@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Smart-render splice checks against a synthetic H.264 clip
+Runs smart_render.smart_burn on a short test pattern with 2 s GOPs and checks that
+ - a correct plan joins to the source's frames and passes verify_splice,
+ - a cut point that is not on a keyframe is rejected (SpliceError) and
+   burn_subtitles falls back to the full burn, which then matches the source,
+ - audio shifted against the video is rejected.
+
+Needs ffmpeg / ffprobe with libx264 and libass.
+
+Usage: python test_smart_render.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import smart_render
+import subtitle_writer
+from video_processor_gemini import GeminiVideoProcessor
+
+
+def check(name: str, ok: bool, detail: str = '') -> bool:
+    symbol = "✅" if ok else "❌"
+    print(f"{symbol} {name}" + (f": {detail}" if detail else ''))
+    return ok
+
+
+def ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-v', 'error'] + list(args) + ['-y'], check=True,
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+
+
+def generate_clip(work_dir: str, seconds: int = 20) -> tuple:
+    """320x240 test pattern, 30 fps, keyframe every 2 s, subtitles at 5-7 s and 13-14 s"""
+    video_path = os.path.join(work_dir, 'clip.mp4')
+    ffmpeg('-f', 'lavfi', '-i', f'testsrc2=size=320x240:rate=30:duration={seconds}',
+           '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+           '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', '60', '-keyint_min', '60', '-sc_threshold', '0',
+           '-c:a', 'aac', '-shortest', video_path)
+    subtitle_path = os.path.join(work_dir, 'clip.ass')
+    subtitle_writer.write_subtitles([
+        {'start': 5.0, 'end': 7.0, 'text': 'First line'},
+        {'start': 13.0, 'end': 14.0, 'text': 'Second line'},
+    ], subtitle_path, 'ass', bidi=False)
+    return video_path, subtitle_path
+
+
+def mid_gop_plan(plan_runs):
+    """plan_runs with every cut moved half a GOP past its keyframe"""
+    def plan(keyframes, duration, intervals):
+        runs = plan_runs(keyframes, duration, intervals)
+        cuts = [start + 1.0 for start, _, _ in runs[1:]]
+        bounds = [0.0] + cuts + [duration]
+        return [(start, end, reencode) for (start, end), (_, _, reencode)
+                in zip(zip(bounds, bounds[1:]), runs)]
+    return plan
+
+
+def main():
+    if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+        print("❌ ffmpeg / ffprobe not found")
+        sys.exit(1)
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path, subtitle_path = generate_clip(work_dir)
+        source_frames = len(smart_render.packets(video_path))
+
+        # Correct plan
+        good_path = os.path.join(work_dir, 'good.mp4')
+        stats = smart_render.smart_burn(video_path, subtitle_path, good_path, os.path.join(work_dir, 'good'))
+        results.append(check('Keyframe-aligned plan splices and verifies', bool(stats) and stats['runs'] > 1,
+                             f"{stats['runs']} runs, {stats['reencoded_seconds']}s re-encoded" if stats else 'None'))
+
+        # Cut points off the keyframes
+        original_plan = smart_render.plan_runs
+        smart_render.plan_runs = mid_gop_plan(original_plan)
+        try:
+            bad_path = os.path.join(work_dir, 'bad.mp4')
+            try:
+                smart_render.smart_burn(video_path, subtitle_path, bad_path, os.path.join(work_dir, 'bad'))
+                results.append(check('Mid-GOP cuts rejected', False, 'smart_burn returned normally'))
+            except smart_render.SpliceError as e:
+                results.append(check('Mid-GOP cuts rejected', True, str(e)))
+
+            processor = GeminiVideoProcessor(gemini_api_key='unused', load_whisper=False, preview_height=0,
+                                             smart_render=True)
+            fallback_path = os.path.join(work_dir, 'fallback.mp4')
+            processor.burn_subtitles(video_path, subtitle_path, fallback_path)
+            frames = len(smart_render.packets(fallback_path))
+            try:
+                smart_render.verify_splice(video_path, fallback_path, [])
+                matches = True
+            except smart_render.SpliceError:
+                matches = False
+            results.append(check('burn_subtitles falls back to the full burn', frames == source_frames and matches,
+                                 f'{frames} of {source_frames} frames'))
+        finally:
+            smart_render.plan_runs = original_plan
+
+        # Audio moved against the video
+        shifted_path = os.path.join(work_dir, 'shifted.mp4')
+        ffmpeg('-i', good_path, '-itsoffset', '0.5', '-i', good_path,
+               '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', shifted_path)
+        try:
+            smart_render.verify_splice(video_path, shifted_path, [])
+            results.append(check('Audio offset rejected', False, 'verify_splice passed'))
+        except smart_render.SpliceError as e:
+            results.append(check('Audio offset rejected', True, str(e)))
+
+    print()
+    if not all(results):
+        print("❌ Smart render checks failed")
+        sys.exit(1)
+    print("✅ Smart render checks OK")
+
+
+if __name__ == '__main__':
+    main()
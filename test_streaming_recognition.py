@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Streaming recognition test against a local fake Speech-to-Text server
+Runs VideoProcessor.transcribe_audio_streaming over gRPC to an in-process server that
+implements google.cloud.speech.v1.Speech/StreamingRecognize, enforces a stream-length
+limit and "recognizes" synthetic audio, then checks the stitched transcript.
+
+No Google credentials or network access are needed.
+
+Usage: python test_streaming_recognition.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import wave
+from concurrent import futures
+
+import grpc
+import numpy as np
+from google.cloud import speech_v1
+from google.cloud.speech_v1.services.speech.transports import SpeechGrpcTransport
+
+import video_processor
+from video_processor import VideoProcessor
+
+SAMPLE_RATE = 16000
+# Synthetic speech: word k fills the first WORD_SECONDS of second k-1 with sample value
+# k * AMPLITUDE, followed by silence
+WORD_SECONDS = 0.6
+AMPLITUDE = 100
+FRAME_SAMPLES = 160  # 10 ms labelling resolution of the fake recognizer
+# The fake server ends an utterance (a final result) every UTTERANCE_WORDS words
+UTTERANCE_WORDS = 4
+MAX_CHUNK_BYTES = 25600
+
+
+def write_synthetic_wav(path: str, words: int):
+    """16 kHz mono PCM with one word per second"""
+    samples = np.zeros(words * SAMPLE_RATE, dtype='<i2')
+    word_samples = int(WORD_SECONDS * SAMPLE_RATE)
+    for k in range(1, words + 1):
+        start = (k - 1) * SAMPLE_RATE
+        samples[start:start + word_samples] = k * AMPLITUDE
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+class FakeSpeechServer:
+    """Speech.StreamingRecognize on a local port, registered with a generic handler"""
+
+    def __init__(self, stream_limit_seconds: float):
+        self.stream_limit_seconds = stream_limit_seconds
+        self.streams = []  # audio seconds received per stream
+        self.max_chunk_bytes = 0
+        self.errors = []
+        self._lock = threading.Lock()
+
+        handler = grpc.method_handlers_generic_handler('google.cloud.speech.v1.Speech', {
+            'StreamingRecognize': grpc.stream_stream_rpc_method_handler(
+                self.streaming_recognize,
+                request_deserializer=speech_v1.StreamingRecognizeRequest.deserialize,
+                response_serializer=speech_v1.StreamingRecognizeResponse.serialize,
+            ),
+        })
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        self.server.add_generic_rpc_handlers((handler,))
+        self.port = self.server.add_insecure_port('127.0.0.1:0')
+
+    def __enter__(self):
+        self.server.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.stop(None)
+
+    @staticmethod
+    def _word(label: int, start_frame: int, end_frame: int) -> dict:
+        chopped = (end_frame - start_frame) * FRAME_SAMPLES < int(WORD_SECONDS * SAMPLE_RATE)
+        return {
+            'word': f'w{label}' + ('~' if chopped else ''),
+            'start': start_frame * FRAME_SAMPLES / SAMPLE_RATE,
+            'end': end_frame * FRAME_SAMPLES / SAMPLE_RATE,
+        }
+
+    @staticmethod
+    def _result(words: list) -> speech_v1.StreamingRecognizeResponse:
+        alternative = speech_v1.SpeechRecognitionAlternative(
+            transcript=' '.join(w['word'] for w in words),
+            words=[
+                speech_v1.WordInfo(word=w['word'], start_time={'seconds': int(w['start']),
+                                                               'nanos': round(w['start'] % 1 * 1e9)},
+                                   end_time={'seconds': int(w['end']), 'nanos': round(w['end'] % 1 * 1e9)})
+                for w in words
+            ],
+        )
+        end = words[-1]['end']
+        return speech_v1.StreamingRecognizeResponse(results=[speech_v1.StreamingRecognitionResult(
+            alternatives=[alternative], is_final=True, language_code='en-us',
+            result_end_time={'seconds': int(end), 'nanos': round(end % 1 * 1e9)},
+        )])
+
+    def streaming_recognize(self, request_iterator, context):
+        first = next(request_iterator)
+        if 'streaming_config' not in first or first.audio_content:
+            self.errors.append('first request must carry only streaming_config')
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, 'Missing streaming_config')
+
+        pending = np.zeros(0, dtype='<i2')
+        frame = 0           # 10 ms frames labelled so far in this stream
+        run = None          # (label, start_frame) of the word being heard
+        utterance = []
+        for request in request_iterator:
+            if 'streaming_config' in request:
+                self.errors.append('streaming_config sent twice in one stream')
+            chunk = request.audio_content
+            with self._lock:
+                self.max_chunk_bytes = max(self.max_chunk_bytes, len(chunk))
+
+            pending = np.concatenate([pending, np.frombuffer(chunk, dtype='<i2')])
+            usable = len(pending) // FRAME_SAMPLES * FRAME_SAMPLES
+            labels, pending = pending[:usable].reshape(-1, FRAME_SAMPLES)[:, 0] // AMPLITUDE, pending[usable:]
+
+            for label in labels:
+                if run and label != run[0]:
+                    utterance.append(self._word(run[0], run[1], frame))
+                    run = None
+                    if len(utterance) == UTTERANCE_WORDS:
+                        yield self._result(utterance)
+                        utterance = []
+                if label and run is None:
+                    run = (int(label), frame)
+                frame += 1
+
+            if frame * FRAME_SAMPLES / SAMPLE_RATE > self.stream_limit_seconds:
+                context.abort(grpc.StatusCode.OUT_OF_RANGE, 'Exceeded maximum allowed stream duration')
+
+        # Half-close: finalize whatever was heard, including a word cut by the end of the stream
+        if run:
+            utterance.append(self._word(run[0], run[1], frame))
+        if utterance:
+            yield self._result(utterance)
+        with self._lock:
+            self.streams.append(frame * FRAME_SAMPLES / SAMPLE_RATE)
+
+
+def check(name: str, ok: bool, detail: str = '') -> bool:
+    symbol = "✅" if ok else "❌"
+    print(f"{symbol} {name}" + (f": {detail}" if detail else ''))
+    return ok
+
+
+def run_case(name: str, words: int, stream_limit: float, holdback: float) -> bool:
+    print(f"\n{name}: {words}s of audio, {stream_limit:g}s stream limit")
+    video_processor.STREAM_LIMIT_SECONDS = stream_limit
+    video_processor.ROLLOVER_HOLDBACK_SECONDS = holdback
+
+    with FakeSpeechServer(stream_limit_seconds=stream_limit) as server, \
+            tempfile.TemporaryDirectory() as temp_dir:
+        audio_path = os.path.join(temp_dir, 'audio.wav')
+        write_synthetic_wav(audio_path, words)
+
+        channel = grpc.insecure_channel(f'127.0.0.1:{server.port}')
+        client = speech_v1.SpeechClient(transport=SpeechGrpcTransport(channel=channel))
+        processor = VideoProcessor(streaming=True, speech_client=client, translate_client=object())
+        segments, language = processor.transcribe_audio(audio_path)
+        channel.close()
+
+    transcript = ' '.join(segment['text'] for segment in segments).split()
+    expected = [f'w{k}' for k in range(1, words + 1)]
+    starts_ok = all(
+        abs(segment['start'] - (int(segment['text'].split()[0][1:].rstrip('~')) - 1)) < 0.02 for segment in segments
+    )
+    ordered = all(a['end'] <= b['start'] for a, b in zip(segments, segments[1:]))
+
+    results = [
+        check('Protocol', not server.errors, '; '.join(server.errors)),
+        check('Every stream within the limit', all(s <= stream_limit for s in server.streams),
+              f"{len(server.streams)} streams: {', '.join(f'{s:g}s' for s in server.streams)}"),
+        check('Chunked requests', 0 < server.max_chunk_bytes <= MAX_CHUNK_BYTES,
+              f'largest chunk {server.max_chunk_bytes} bytes'),
+        check('Every word once, in order, none split', transcript == expected,
+              '' if transcript == expected else ' '.join(transcript)),
+        check('Continuous timestamps', starts_ok and ordered,
+              f"last segment {segments[-1]['start']:.2f}-{segments[-1]['end']:.2f}s" if segments else ''),
+        check('Language', language == 'en-us', language),
+    ]
+    return all(results)
+
+
+def main():
+    ok = run_case('Single stream', words=8, stream_limit=30, holdback=5)
+    ok &= run_case('Rollover mid-word', words=47, stream_limit=10.3, holdback=5)
+    ok &= run_case('Rollover at a pause', words=23, stream_limit=7, holdback=0)
+
+    print()
+    if not ok:
+        print("❌ Streaming recognition test failed")
+        sys.exit(1)
+    print("✅ Streaming recognition stitched correctly")
+
+
+if __name__ == '__main__':
+    main()
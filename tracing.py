@@ -0,0 +1,135 @@
+"""
+Structured logging and trace spans for the processing pipeline
+Log records are JSON lines tagged with the current task_id. Spans are also written
+as Chrome trace events, one file per task in TRACE_FOLDER, which open as a
+timeline / flame view in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Task being processed by the current thread / context
+current_task_id = contextvars.ContextVar('task_id', default=None)
+
+_ROOT_LOGGER = 'pipeline'
+_trace_folder = None
+_trace_lock = threading.Lock()
+_named_threads = set()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, task_id and fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        task_id = current_task_id.get()
+        if task_id:
+            entry['task_id'] = task_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """log.info('message', key=value, ...): keyword arguments become JSON fields"""
+
+    _RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in self._RESERVED}
+        kwargs['extra'] = {**kwargs.get('extra', {}), 'fields': fields}
+        return msg, kwargs
+
+
+def configure(level: str = 'INFO', trace_folder: str = None):
+    """Send pipeline logs to stderr as JSON lines and enable trace files (None/'' disables)"""
+    global _trace_folder
+    logger = logging.getLogger(_ROOT_LOGGER)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+
+    if trace_folder:
+        os.makedirs(trace_folder, exist_ok=True)
+    _trace_folder = trace_folder or None
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(f'{_ROOT_LOGGER}.{name}'), {})
+
+
+def trace_path(task_id: str) -> str:
+    """Trace file of a task (None when tracing is disabled)"""
+    if not _trace_folder:
+        return None
+    return os.path.join(_trace_folder, f'{task_id}.json')
+
+
+def _write_events(events: list):
+    task_id = current_task_id.get()
+    if not _trace_folder:
+        return
+    path = trace_path(task_id or f'worker-{os.getpid()}')
+
+    # JSON Array Format: the closing ']' is optional, so events can simply be appended
+    with _trace_lock:
+        thread_key = (path, threading.get_native_id())
+        if thread_key not in _named_threads:
+            _named_threads.add(thread_key)
+            events = [{
+                'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_key[1],
+                'args': {'name': threading.current_thread().name},
+            }] + events
+        lines = ''.join(json.dumps(event, ensure_ascii=False, default=str) + ',\n' for event in events)
+        with open(path, 'a', encoding='utf-8') as f:
+            if f.tell() == 0:
+                lines = '[\n' + lines
+            f.write(lines)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a pipeline stage: a Chrome 'complete' event plus debug log lines
+
+    Yields the attrs dict so results (e.g. cache_hit) can be attached before the span ends.
+    """
+    log = get_logger('trace')
+    start_us = time.time_ns() // 1000
+    start = time.perf_counter()
+    log.debug(f'{name} started', span=name, **attrs)
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs['error'] = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        try:
+            _write_events([{
+                'name': name,
+                'cat': 'pipeline',
+                'ph': 'X',
+                'ts': start_us,
+                'dur': int(duration * 1_000_000),
+                'pid': os.getpid(),
+                'tid': threading.get_native_id(),
+                'args': {'task_id': current_task_id.get(), **attrs},
+            }])
+        except OSError as e:
+            log.warning('Could not write trace event', span=name, error=str(e))
+        log.debug(f'{name} finished', span=name, duration_seconds=round(duration, 3), **attrs)
@@ -0,0 +1,231 @@
+"""
+Transcription cache keyed by an audio fingerprint
+The same clip often arrives through different URLs (re-uploads, mirrors, short links).
+A fingerprint of the 16 kHz mono PCM from extract_audio finds a near-identical track
+that was already transcribed, so Whisper can be skipped.
+
+Fingerprint: one 32-bit sub-fingerprint per 16 ms frame from the sign of energy
+differences between 33 log-spaced bands (300-2000 Hz) across frequency and time,
+which survives re-encoding, resampling and volume changes.
+Lookup: MinHash of the sub-fingerprint set, one LSH band per hash stored as Redis sets;
+candidates are aligned on their shared sub-fingerprints and verified by bit error rate.
+"""
+
+import base64
+import json
+import time
+import uuid
+import wave
+
+import numpy as np
+
+import pcm_audio
+from tracing import get_logger
+
+log = get_logger('transcript_cache')
+
+SAMPLE_RATE = pcm_audio.SAMPLE_RATE
+FRAME_SIZE = 2048
+# Heavy frame overlap keeps sub-fingerprints stable when a copy is trimmed by a fraction of a frame
+HOP_SIZE = 256  # 16 ms per sub-fingerprint
+BAND_EDGES = np.geomspace(300, 2000, 34)
+
+# Only every STORED_DECIMATION-th sub-fingerprint is kept for verification (~60 bytes/s)
+STORED_DECIMATION = 4
+
+# MinHash signature: NUM_BANDS bands of ROWS_PER_BAND hashes each. Copies that are not
+# frame-aligned share only a few percent of their exact sub-fingerprints, so single-hash
+# bands are needed to find them; false candidates are rejected by the bit error rate.
+NUM_BANDS = 64
+ROWS_PER_BAND = 1
+_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(20240611)
+_HASH_A = _rng.randint(1, 1 << 31, size=NUM_BANDS * ROWS_PER_BAND).astype(np.uint64)
+_HASH_B = _rng.randint(0, 1 << 31, size=NUM_BANDS * ROWS_PER_BAND).astype(np.uint64)
+
+# Frames read per FFT block (bounds memory for long files)
+_BLOCK_FRAMES = 512
+
+
+def compute_fingerprint(audio_path: str) -> np.ndarray:
+    """Sub-fingerprints (uint32, one per HOP_SIZE samples) of 16 kHz mono audio
+
+    Reads the float32 PCM written by extract_audio (memory-mapped) or a 16-bit WAV.
+    Only signs of energy differences are used, so both give the same fingerprint.
+    """
+    if audio_path.endswith('.wav'):
+        with wave.open(audio_path, 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError('Expected 16-bit mono PCM')
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+    else:
+        samples = pcm_audio.load(audio_path)
+
+    if len(samples) < FRAME_SIZE:
+        return np.zeros(0, dtype=np.uint32)
+
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+
+    # FFT bin -> band summing matrix
+    freqs = np.fft.rfftfreq(FRAME_SIZE, 1.0 / SAMPLE_RATE)
+    band_index = np.digitize(freqs, BAND_EDGES) - 1
+    band_matrix = np.zeros((len(freqs), len(BAND_EDGES) - 1), dtype=np.float32)
+    in_range = (band_index >= 0) & (band_index < len(BAND_EDGES) - 1)
+    band_matrix[np.nonzero(in_range)[0], band_index[in_range]] = 1.0
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE]
+    energies = np.empty((len(frames), len(BAND_EDGES) - 1), dtype=np.float32)
+    for start in range(0, len(frames), _BLOCK_FRAMES):
+        block = frames[start:start + _BLOCK_FRAMES].astype(np.float32) * window
+        energies[start:start + len(block)] = (np.abs(np.fft.rfft(block, axis=1)) ** 2) @ band_matrix
+
+    # Bit m of frame n: (E[n,m] - E[n,m+1]) - (E[n-1,m] - E[n-1,m+1]) > 0
+    diff = energies[:, :-1] - energies[:, 1:]
+    bits = (diff[1:] - diff[:-1]) > 0
+    weights = (1 << np.arange(32, dtype=np.uint64)).astype(np.uint64)
+    return (bits.astype(np.uint64) * weights).sum(axis=1).astype(np.uint32)
+
+
+def minhash_bands(fingerprint: np.ndarray) -> list:
+    """LSH band keys: MinHash of the sub-fingerprint set, NUM_BANDS bands of ROWS_PER_BAND"""
+    values = np.unique(fingerprint)
+    # Silence and clipping produce the same all-zero / all-one frames in every track
+    values = values[(values != 0) & (values != 0xFFFFFFFF)].astype(np.uint64)
+    if not len(values):
+        return []
+    hashes = ((values[None, :] * _HASH_A[:, None] + _HASH_B[:, None]) % _PRIME).min(axis=1)
+    rows = hashes.reshape(NUM_BANDS, ROWS_PER_BAND)
+    return [f'{band}:' + '-'.join(str(int(h)) for h in row) for band, row in enumerate(rows)]
+
+
+def estimate_offset(stored: np.ndarray, fingerprint: np.ndarray):
+    """Frame offset of `fingerprint` relative to a decimated stored fingerprint, or None
+
+    Frame i of the stored track is frame i + offset of the new one. Every sub-fingerprint
+    value found in both votes for one offset; the most common offset wins.
+    """
+    stored_values, stored_index = np.unique(stored, return_index=True)
+    new_values, new_index = np.unique(fingerprint, return_index=True)
+    _, i, j = np.intersect1d(stored_values, new_values, assume_unique=True, return_indices=True)
+    keep = (stored_values[i] != 0) & (stored_values[i] != 0xFFFFFFFF)
+    if not keep.any():
+        return None
+
+    votes = new_index[j[keep]] - STORED_DECIMATION * stored_index[i[keep]]
+    low = votes.min()
+    return int(np.bincount(votes - low).argmax() + low)
+
+
+def bit_error_rate(stored: np.ndarray, fingerprint: np.ndarray, offset: int) -> float:
+    """Bit error rate between a decimated stored fingerprint and a new one at a frame offset"""
+    positions = offset + STORED_DECIMATION * np.arange(len(stored))
+    valid = (positions >= 0) & (positions < len(fingerprint))
+    if valid.sum() < 16:
+        return 1.0
+    diff = np.bitwise_xor(stored[valid], fingerprint[positions[valid]])
+    return float(np.unpackbits(diff.view(np.uint8)).sum()) / (32.0 * valid.sum())
+
+
+class TranscriptCache:
+    """Bounded, Redis-backed cache of Whisper output keyed by audio fingerprint
+
+    Entries beyond max_entries are evicted least recently used first.
+    """
+
+    ENTRY_PREFIX = 'asrcache:entry:'
+    BAND_PREFIX = 'asrcache:band:'
+    LRU_KEY = 'asrcache:lru'
+
+    def __init__(self, redis_client, max_entries: int = 1000, max_ber: float = 0.25,
+                 max_duration_delta: float = 2.0):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.max_ber = max_ber
+        self.max_duration_delta = max_duration_delta
+
+    def lookup(self, fingerprint: np.ndarray):
+        """Return (segments, language) of a near-identical cached track, or None"""
+        bands = minhash_bands(fingerprint)
+        if not bands:
+            return None
+
+        pipe = self.redis.pipeline()
+        for band in bands:
+            pipe.smembers(self.BAND_PREFIX + band)
+        candidates = set().union(*pipe.execute())
+
+        duration = len(fingerprint) * HOP_SIZE / SAMPLE_RATE
+        best = None
+        for entry_id in candidates:
+            entry = self.redis.hgetall(self.ENTRY_PREFIX + entry_id)
+            if not entry:
+                continue
+            if abs(float(entry['duration']) - duration) > self.max_duration_delta:
+                continue
+            stored = np.frombuffer(base64.b64decode(entry['fingerprint']), dtype=np.uint32)
+            offset = estimate_offset(stored, fingerprint)
+            if offset is None:
+                continue
+            ber = bit_error_rate(stored, fingerprint, offset)
+            if ber <= self.max_ber and (best is None or ber < best[0]):
+                best = (ber, offset, entry_id, entry)
+
+        if best is None:
+            return None
+
+        ber, offset, entry_id, entry = best
+        self.redis.zadd(self.LRU_KEY, {entry_id: time.time()})
+        log.info('Transcript cache hit', bit_error_rate=round(ber, 3), offset_frames=offset)
+
+        # Shift timestamps when the new track starts earlier or later than the cached one
+        shift = offset * HOP_SIZE / SAMPLE_RATE
+        segments = json.loads(entry['segments'])
+        if shift:
+            segments = [
+                {**seg, 'start': max(0.0, seg['start'] + shift), 'end': max(0.0, seg['end'] + shift)}
+                for seg in segments
+            ]
+        return segments, entry['language']
+
+    def store(self, fingerprint: np.ndarray, segments: list, language: str) -> str:
+        """Cache a transcription and evict the least recently used entries over max_entries"""
+        bands = minhash_bands(fingerprint)
+        if not bands:
+            return None
+
+        entry_id = str(uuid.uuid4())
+        pipe = self.redis.pipeline()
+        pipe.hset(self.ENTRY_PREFIX + entry_id, mapping={
+            'fingerprint': base64.b64encode(
+                fingerprint[::STORED_DECIMATION].astype(np.uint32).tobytes()).decode('ascii'),
+            'duration': len(fingerprint) * HOP_SIZE / SAMPLE_RATE,
+            'segments': json.dumps(segments),
+            'language': language or 'unknown',
+            'bands': ','.join(bands),
+        })
+        for band in bands:
+            pipe.sadd(self.BAND_PREFIX + band, entry_id)
+        pipe.zadd(self.LRU_KEY, {entry_id: time.time()})
+        pipe.execute()
+
+        self.evict()
+        return entry_id
+
+    def evict(self) -> int:
+        """Drop least recently used entries beyond max_entries"""
+        excess = self.redis.zcard(self.LRU_KEY) - self.max_entries
+        if excess <= 0:
+            return 0
+
+        evicted = 0
+        for entry_id in self.redis.zrange(self.LRU_KEY, 0, excess - 1):
+            key = self.ENTRY_PREFIX + entry_id
+            bands = self.redis.hget(key, 'bands') or ''
+            pipe = self.redis.pipeline()
+            for band in filter(None, bands.split(',')):
+                pipe.srem(self.BAND_PREFIX + band, entry_id)
+            pipe.delete(key)
+            pipe.zrem(self.LRU_KEY, entry_id)
+            pipe.execute()
+            evicted += 1
+        return evicted
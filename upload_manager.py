@@ -0,0 +1,125 @@
+"""
+Resumable, streaming file uploads
+Clients create an upload session, then PUT the file in chunks at increasing offsets.
+Each chunk is streamed from the request body straight into the task's temp directory,
+so nothing larger than one read buffer is held in memory.
+"""
+
+import os
+import time
+from werkzeug.utils import secure_filename
+
+# Bytes read from the request stream per iteration
+READ_BUFFER_SIZE = 1024 * 1024
+
+# Upload sessions expire after 24 hours, like task status
+SESSION_TTL = 86400
+
+
+class UploadError(Exception):
+    """Upload request rejected; carries the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400, offset: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class UploadManager:
+    """Tracks upload sessions in Redis and writes chunks to disk"""
+
+    def __init__(self, redis_client, upload_folder: str, max_size: int):
+        self.redis = redis_client
+        self.upload_folder = upload_folder
+        self.max_size = max_size
+
+    def _key(self, task_id: str) -> str:
+        return f'upload:{task_id}'
+
+    def create(self, task_id: str, filename: str, size: int, **options) -> dict:
+        """Create an upload session and an empty target file for task_id"""
+        if size <= 0:
+            raise UploadError('Invalid upload size')
+        if size > self.max_size:
+            raise UploadError(f'File too large (max {self.max_size} bytes)', 413)
+
+        ext = os.path.splitext(secure_filename(filename or ''))[1].lower() or '.mp4'
+        temp_dir = os.path.join(self.upload_folder, task_id)
+        os.makedirs(temp_dir, exist_ok=True)
+        path = os.path.join(temp_dir, f'{task_id}_source{ext}')
+
+        # Pre-create the file so chunks can be written in place
+        open(path, 'wb').close()
+
+        session = {
+            'path': path,
+            'size': size,
+            'offset': 0,
+            'filename': filename or '',
+            'created_at': time.time(),
+        }
+        session.update({k: v for k, v in options.items() if v is not None})
+
+        self.redis.hset(self._key(task_id), mapping=session)
+        self.redis.expire(self._key(task_id), SESSION_TTL)
+        return self.get(task_id)
+
+    def get(self, task_id: str) -> dict:
+        """Return the upload session, or None if it does not exist"""
+        session = self.redis.hgetall(self._key(task_id))
+        if not session:
+            return None
+        session['size'] = int(session['size'])
+        session['offset'] = int(session['offset'])
+        session['complete'] = session['offset'] >= session['size']
+        return session
+
+    def write_chunk(self, task_id: str, offset: int, stream, length: int = None) -> dict:
+        """Stream one chunk from `stream` into the upload file at `offset`
+
+        The offset must equal the number of bytes already received, so a client
+        that lost its connection asks for the current offset and resumes from there.
+        """
+        # One writer per upload at a time
+        lock_key = f'{self._key(task_id)}:lock'
+        if not self.redis.set(lock_key, '1', nx=True, ex=300):
+            current = self.get(task_id)
+            raise UploadError('Another chunk is being written', 409, current and current['offset'])
+
+        try:
+            session = self.get(task_id)
+            if not session:
+                raise UploadError('Upload not found', 404)
+            if session['complete']:
+                raise UploadError('Upload already complete', 409, session['offset'])
+            if offset != session['offset']:
+                raise UploadError('Offset mismatch', 409, session['offset'])
+
+            remaining = session['size'] - offset
+            if length is not None and length > remaining:
+                raise UploadError('Chunk exceeds declared upload size', 413, offset)
+
+            written = 0
+            try:
+                with open(session['path'], 'r+b') as f:
+                    f.seek(offset)
+                    while True:
+                        data = stream.read(READ_BUFFER_SIZE)
+                        if not data:
+                            break
+                        if written + len(data) > remaining:
+                            raise UploadError('Chunk exceeds declared upload size', 413, offset + written)
+                        f.write(data)
+                        written += len(data)
+            finally:
+                # Keep whatever arrived before a disconnect so the client can resume from there
+                if written:
+                    self.redis.hset(self._key(task_id), 'offset', offset + written)
+        finally:
+            self.redis.delete(lock_key)
+
+        return self.get(task_id)
+
+    def delete(self, task_id: str):
+        """Forget the upload session (the file stays with the task)"""
+        self.redis.delete(self._key(task_id))
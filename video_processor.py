@@ -1,22 +1,45 @@
 import os
 import subprocess
 import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 from google.cloud import speech_v1
 from google.cloud import translate_v2 as translate
 import yt_dlp
 
+# Streaming recognition: audio is sent in 100 ms chunks (the service recommends
+# ~100 ms frames, max 25 KB per request)
+STREAM_CHUNK_SECONDS = 0.1
+# A single stream is limited to about 305 s of audio; roll over to a new one before that
+STREAM_LIMIT_SECONDS = 290
+# The last result of a stream is sent again at the start of the next one when it ends
+# this close to the cut, so an utterance split by the rollover is recognized whole
+ROLLOVER_HOLDBACK_SECONDS = 10
+
+# Bulk translation: the v2 API takes up to 128 strings per request and recommends
+# at most 5K characters; several requests are kept in flight at once
+TRANSLATE_BATCH_SEGMENTS = 128
+TRANSLATE_BATCH_CHARS = 5000
+TRANSLATE_CONCURRENCY = 4
+
 
 class VideoProcessor:
     """Handles video download, transcription, translation, and subtitle burn-in"""
     
-    def __init__(self, google_credentials_path: str = None):
-        """Initialize with Google Cloud credentials"""
+    def __init__(self, google_credentials_path: str = None, streaming: bool = True,
+                 speech_client=None, translate_client=None):
+        """Initialize with Google Cloud credentials
+        
+        streaming: transcribe with streaming recognition (audio sent in chunks) instead
+        of one inline long_running_recognize request, which is limited to ~10 MB / 1 min.
+        """
         if google_credentials_path:
             os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = google_credentials_path
         
-        self.speech_client = speech_v1.SpeechClient()
-        self.translate_client = translate.Client()
+        self.streaming = streaming
+        self.speech_client = speech_client or speech_v1.SpeechClient()
+        self.translate_client = translate_client or translate.Client()
     
     def download_video(self, url: str, output_path: str) -> str:
         """Download video using yt-dlp"""
@@ -48,14 +71,8 @@ class VideoProcessor:
         subprocess.run(cmd, check=True, capture_output=True)
         return audio_path
     
-    def transcribe_audio(self, audio_path: str) -> Tuple[List[Dict], str]:
-        """Transcribe audio using Google Cloud Speech-to-Text with word-level timestamps"""
-        with open(audio_path, 'rb') as audio_file:
-            content = audio_file.read()
-        
-        audio = speech_v1.RecognitionAudio(content=content)
-        
-        config = speech_v1.RecognitionConfig(
+    def _recognition_config(self) -> speech_v1.RecognitionConfig:
+        return speech_v1.RecognitionConfig(
             encoding=speech_v1.RecognitionConfig.AudioEncoding.LINEAR16,
             sample_rate_hertz=16000,
             language_code='auto',  # Auto-detect language
@@ -63,6 +80,17 @@ class VideoProcessor:
             enable_word_time_offsets=True,
             model='latest_long',
         )
+    
+    def transcribe_audio(self, audio_path: str) -> Tuple[List[Dict], str]:
+        """Transcribe audio using Google Cloud Speech-to-Text with word-level timestamps"""
+        if self.streaming:
+            return self.transcribe_audio_streaming(audio_path)
+        
+        with open(audio_path, 'rb') as audio_file:
+            content = audio_file.read()
+        
+        audio = speech_v1.RecognitionAudio(content=content)
+        config = self._recognition_config()
         
         # For long audio files, use long_running_recognize
         operation = self.speech_client.long_running_recognize(config=config, audio=audio)
@@ -90,6 +118,93 @@ class VideoProcessor:
         
         return transcription_segments, detected_language or 'en-US'
     
+    def _audio_requests(self, wav: wave.Wave_read, start_frame: int, end_frame: int):
+        """Stream requests with the PCM frames [start_frame, end_frame), read chunk by chunk"""
+        chunk_frames = int(wav.getframerate() * STREAM_CHUNK_SECONDS)
+        wav.setpos(start_frame)
+        position = start_frame
+        while position < end_frame:
+            data = wav.readframes(min(chunk_frames, end_frame - position))
+            if not data:
+                break
+            position += len(data) // (wav.getsampwidth() * wav.getnchannels())
+            yield speech_v1.StreamingRecognizeRequest(audio_content=data)
+    
+    def _recognize_stream(self, wav: wave.Wave_read, start_frame: int, end_frame: int,
+                          streaming_config) -> Tuple[List[Dict], str]:
+        """Recognize one stream; segment times are relative to start_frame"""
+        responses = self.speech_client.streaming_recognize(
+            streaming_config, self._audio_requests(wav, start_frame, end_frame)
+        )
+        
+        segments = []
+        language = None
+        previous_end = 0.0
+        for response in responses:
+            for result in response.results:
+                if not result.is_final or not result.alternatives:
+                    continue
+                alternative = result.alternatives[0]
+                language = language or result.language_code
+                
+                result_end = result.result_end_time.total_seconds()
+                if alternative.words:
+                    start = alternative.words[0].start_time.total_seconds()
+                    end = alternative.words[-1].end_time.total_seconds()
+                else:
+                    start, end = previous_end, result_end
+                previous_end = max(previous_end, result_end)
+                
+                if alternative.transcript.strip():
+                    segments.append({'start': start, 'end': end, 'text': alternative.transcript.strip()})
+        
+        return segments, language
+    
+    def transcribe_audio_streaming(self, audio_path: str) -> Tuple[List[Dict], str]:
+        """Transcribe with streaming recognition, without loading the file into memory
+        
+        Audio longer than one stream allows is sent as consecutive streams; results are
+        stitched with timestamps relative to the start of the file.
+        """
+        streaming_config = speech_v1.StreamingRecognitionConfig(
+            config=self._recognition_config(),
+            interim_results=False,
+        )
+        
+        transcription_segments = []
+        detected_language = None
+        
+        with wave.open(audio_path, 'rb') as wav:
+            rate = wav.getframerate()
+            total_frames = wav.getnframes()
+            stream_frames = int(STREAM_LIMIT_SECONDS * rate)
+            
+            start_frame = 0
+            while start_frame < total_frames:
+                end_frame = min(start_frame + stream_frames, total_frames)
+                offset = start_frame / rate
+                segments, language = self._recognize_stream(wav, start_frame, end_frame, streaming_config)
+                detected_language = detected_language or language
+                
+                next_frame = end_frame
+                if end_frame < total_frames and segments:
+                    # The stream was cut mid-audio: an utterance ending near the cut may have
+                    # been split, so drop it and start the next stream where it began
+                    last = segments[-1]
+                    cut = (end_frame - start_frame) / rate
+                    resume = int(last['start'] * rate)
+                    if cut - last['end'] <= ROLLOVER_HOLDBACK_SECONDS and resume > 0:
+                        segments.pop()
+                        next_frame = start_frame + resume
+                
+                transcription_segments.extend(
+                    {**segment, 'start': segment['start'] + offset, 'end': segment['end'] + offset}
+                    for segment in segments
+                )
+                start_frame = next_frame
+        
+        return transcription_segments, detected_language or 'en-US'
+    
     def translate_text(self, text: str, target_language: str = 'fa') -> str:
         """Translate text to Persian using Google Cloud Translation API"""
         result = self.translate_client.translate(
@@ -99,19 +214,48 @@ class VideoProcessor:
         
         return result['translatedText']
     
+    def translate_batch(self, texts: List[str], target_language: str = 'fa') -> List[str]:
+        """Translate a list of texts in one request; results keep the input order"""
+        results = self.translate_client.translate(texts, target_language=target_language)
+        return [result['translatedText'] for result in results]
+    
+    def _translation_batches(self, texts: List[str]) -> List[List[int]]:
+        """Group segment indexes into batches capped by count and characters"""
+        batches = []
+        batch, batch_chars = [], 0
+        for index, text in enumerate(texts):
+            if batch and (len(batch) >= TRANSLATE_BATCH_SEGMENTS
+                          or batch_chars + len(text) > TRANSLATE_BATCH_CHARS):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append(index)
+            batch_chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+    
     def translate_segments(self, segments: List[Dict], target_language: str = 'fa') -> List[Dict]:
-        """Translate all transcription segments"""
-        translated_segments = []
-        
-        for segment in segments:
-            translated_text = self.translate_text(segment['text'], target_language)
-            translated_segments.append({
-                'start': segment['start'],
-                'end': segment['end'],
-                'text': translated_text
-            })
-        
-        return translated_segments
+        """Translate all transcription segments in concurrent bulk requests"""
+        if not segments:
+            return []
+        
+        texts = [segment['text'] for segment in segments]
+        batches = self._translation_batches(texts)
+        translations = [None] * len(texts)
+        
+        with ThreadPoolExecutor(max_workers=min(TRANSLATE_CONCURRENCY, len(batches))) as pool:
+            futures = {
+                pool.submit(self.translate_batch, [texts[i] for i in batch], target_language): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                for index, translated_text in zip(futures[future], future.result()):
+                    translations[index] = translated_text
+        
+        return [
+            {'start': segment['start'], 'end': segment['end'], 'text': translated_text}
+            for segment, translated_text in zip(segments, translations)
+        ]
     
     def format_timestamp_srt(self, seconds: float) -> str:
         """Format seconds to SRT timestamp format (HH:MM:SS,mmm)"""
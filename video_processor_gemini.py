@@ -1,18 +1,62 @@
 import os
+import shutil
 import subprocess
 import tempfile
-from typing import Dict, List, Tuple
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 # import whisper  # REMOVED - will import only when needed to avoid PyTorch issues
 import yt_dlp
-from bidi_fixer import fix_srt_file, fix_bidi_text
+import subtitle_writer
+import resource_usage
+import pcm_audio
+from tracing import get_logger, span
+from rate_limiter import CircuitOpenError, backoff_delay
+from languages import LANGUAGES, DEFAULT_LANGUAGE, language_name, is_rtl
+from transcript_cache import compute_fingerprint
+import platform_captions
+import smart_render
+from whisper_worker import ResidentWhisper
+
+log = get_logger('processor')
+
+# Errors worth retrying: rate limiting (429) and transient provider/network failures
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.BadGateway,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.DeadlineExceeded,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class TranslationError(Exception):
+    """Raised when Gemini translation keeps failing after all retries"""
 
 
 class GeminiVideoProcessor:
     """Handles video download, transcription (Whisper), translation (Gemini), and subtitle burn-in"""
     
-    def __init__(self, gemini_api_key: str = None, load_whisper: bool = True):
-        """Initialize with Gemini API key"""
+    # Playlist name inside a job's HLS directory
+    HLS_PLAYLIST = 'index.m3u8'
+    
+    def __init__(self, gemini_api_key: str = None, load_whisper: bool = True,
+                 rate_limiter=None, circuit_breaker=None, max_retries: int = 5,
+                 backoff_base: float = 2.0, backoff_max: float = 60.0,
+                 circuit_max_wait: float = 600.0, download_cache=None,
+                 concurrent_fragments: int = 4, transcript_cache=None, preview_height: int = 360,
+                 hls_segment_seconds: int = 0, language_detect_model: str = 'base',
+                 language_detect_min_probability: float = 0.5, platform_captions: str = 'manual',
+                 smart_render: bool = False):
+        """Initialize with Gemini API key and optional shared rate limiter / circuit breaker"""
         # Configure Gemini
         api_key = gemini_api_key or os.getenv('GEMINI_API_KEY')
         if not api_key:
@@ -21,129 +65,335 @@ class GeminiVideoProcessor:
         genai.configure(api_key=api_key)
         self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
         
+        # Throttling and retry policy for Gemini calls
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_max_wait = circuit_max_wait
+        self._stats_lock = threading.Lock()
+        self.reset_translation_stats()
+        
+        # Shared download cache (None = always download into the task dir)
+        self.download_cache = download_cache
+        self.concurrent_fragments = concurrent_fragments
+        
+        # Audio-fingerprint cache of Whisper output (None = always transcribe)
+        self.transcript_cache = transcript_cache
+        
+        # Height of the quick preview rendered alongside the full burn (0 = no preview)
+        self.preview_height = preview_height
+        
+        # Burn to HLS segments of this length so playback can start early (0 = MP4 only)
+        self.hls_segment_seconds = hls_segment_seconds
+        
+        # Quick language ID on the first 30 s, in the resident Whisper process before full ASR
+        # ('' = let Whisper detect it; the ASR model itself needs no extra load)
+        self.language_detect_model = language_detect_model
+        self.language_detect_min_probability = language_detect_min_probability
+        
+        # Reuse captions published with the source ('off', 'manual' or 'auto') instead of ASR
+        self.platform_captions = platform_captions
+        
+        # Re-encode only the GOPs that show a subtitle; the rest is stream-copied
+        self.smart_render = smart_render
+        
         # Whisper model - only load if requested (for multiprocessing safety)
         self.whisper_model = None
+        # Resident Whisper process started by warm_up(); without it each job spawns one
+        self.whisper_worker = None
         if load_whisper:
             self._load_whisper()
     
+    def warm_up(self, whisper_model: str = 'base'):
+        """Open the Gemini connection and start the resident Whisper process
+
+        Called once per worker process so the first job is as fast as the rest.
+        """
+        # First request creates the gRPC client/channel, which is then kept open and reused
+        try:
+            next(iter(genai.list_models(page_size=1)), None)
+        except Exception as e:
+            log.warning('Gemini warm-up failed, will retry on first request', error=str(e))
+        
+        # Whisper runs in a subprocess that keeps the ASR and language ID models loaded
+        # for every job of this process
+        self.whisper_worker = ResidentWhisper([whisper_model, self.language_detect_model])
+        try:
+            self.whisper_worker.start()
+        except Exception as e:
+            # Started again on the first transcription
+            log.warning('Whisper warm-up failed', models=self.whisper_worker.models, error=str(e))
+    
     def _load_whisper(self):
         """Load Whisper model (separated for lazy loading in forked processes)"""
         if self.whisper_model is None:
-            print("Loading Whisper model...")
+            log.info('Loading Whisper model')
             import whisper  # Import only when needed
             self.whisper_model = whisper.load_model("base")
-            print("Whisper model loaded!")
+            log.info('Whisper model loaded')
     
-    def download_video(self, url: str, output_path: str) -> str:
-        """Download video using yt-dlp"""
-        ydl_opts = {
-            'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
-            'outtmpl': output_path,
-            'quiet': False,
-            'no_warnings': False,
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-        
-        return output_path
+    def reset_translation_stats(self):
+        """Reset the per-job throttling / retry counters"""
+        with self._stats_lock:
+            self.translation_stats = {
+                'requests': 0,
+                'retries': 0,
+                'throttled': 0,
+                'throttled_seconds': 0.0,
+                'circuit_pauses': 0,
+                'circuit_paused_seconds': 0.0,
+                'fallbacks': 0,
+            }
     
-    def extract_audio(self, video_path: str, audio_path: str) -> str:
-        """Extract audio from video using FFmpeg"""
-        print("="*80)
-        print("EXTRACT_AUDIO CALLED")
-        print(f"Video path: {video_path}")
-        print(f"Audio path: {audio_path}")
-        print(f"Video exists: {os.path.exists(video_path)}")
-        print("="*80)
-        
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,
-            '-vn',  # No video
-            '-acodec', 'pcm_s16le',  # PCM format
-            '-ar', '16000',  # 16kHz sample rate
-            '-ac', '1',  # Mono
-            '-y',  # Overwrite output file
-            audio_path
-        ]
-        
-        print("About to run FFmpeg subprocess...")
-        # Don't capture output - let it go to stdout/stderr, and use DEVNULL for stdin
-        result = subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        print("FFmpeg completed!")
-        return audio_path
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self.translation_stats[key] += amount
     
-    def transcribe_audio(self, audio_path: str) -> Tuple[List[Dict], str]:
-        """Transcribe audio using Whisper (local, FREE!) - runs in subprocess to avoid fork issues"""
-        print("="*80)
-        print("TRANSCRIBE_AUDIO CALLED")
-        print("="*80)
-        print("Transcribing audio with Whisper (subprocess mode)...")
-        print(f"Audio file: {audio_path}")
-        print(f"File exists: {os.path.exists(audio_path)}")
-        print(f"File size: {os.path.getsize(audio_path) if os.path.exists(audio_path) else 'N/A'} bytes")
+    def _generate_content(self, prompt: str):
+        """Call Gemini through the shared rate limiter, circuit breaker and retry policy"""
+        attempt = 0
+        paused = 0.0
         
-        try:
-            # Run Whisper in a subprocess to avoid PyTorch/fork issues
-            import subprocess
-            import json
-            import sys
-            
-            print("About to get Python executable...")
-            # Use current Python executable
-            python_exe = sys.executable
-            print(f"Python exe: {python_exe}")
+        while True:
+            # Pause while the provider circuit is open
+            if self.circuit_breaker:
+                wait = self.circuit_breaker.before_call()
+                if wait > 0:
+                    if paused >= self.circuit_max_wait:
+                        raise CircuitOpenError(
+                            f"Gemini unavailable: circuit open for more than {self.circuit_max_wait:.0f}s")
+                    self._count('circuit_pauses')
+                    self._count('circuit_paused_seconds', wait)
+                    time.sleep(wait)
+                    paused += wait
+                    continue
             
-            # Run whisper_subprocess.py
-            script_path = os.path.join(os.path.dirname(__file__), 'whisper_subprocess.py')
-            print(f"Script path: {script_path}")
-            print(f"Script exists: {os.path.exists(script_path)}")
+            # Wait for a token from the cluster-wide bucket
+            if self.rate_limiter:
+                waited = self.rate_limiter.acquire()
+                if waited > 0:
+                    self._count('throttled')
+                    self._count('throttled_seconds', waited)
             
-            print(f"About to run: {python_exe} {script_path} {audio_path} base")
-            print("Starting subprocess.run()...")
+            self._count('requests')
+            try:
+                response = self.gemini_model.generate_content(prompt)
+            except RETRYABLE_ERRORS as e:
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure()
+                
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise TranslationError(
+                        f"Gemini request failed after {self.max_retries} retries: {type(e).__name__}: {e}") from e
+                
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                self._count('retries')
+                log.warning('Gemini request failed, retrying', error=type(e).__name__,
+                            attempt=attempt, max_retries=self.max_retries, delay_seconds=round(delay, 1))
+                time.sleep(delay)
+                continue
             
-            result = subprocess.run(
-                [python_exe, script_path, audio_path, 'base'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL,  # Ignore Whisper's progress bars
-                text=True,
-                timeout=300  # 5 minutes max
-            )
+            if self.circuit_breaker:
+                self.circuit_breaker.record_success()
+            return response
+    
+    def download_video(self, url: str, output_path: str) -> str:
+        """Download video using yt-dlp (through the shared cache when configured)"""
+        format_selector = 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best'
+        return self._download(url, output_path, format_selector, 'mp4')
+    
+    def _download(self, url: str, output_path: str, format_selector: str, ext: str) -> str:
+        with span('download', url=url, format=format_selector) as attrs:
+            if self.download_cache:
+                attrs['cache_hit'] = self.download_cache.fetch(url, output_path, format_selector, ext)['cache_hit']
+                return output_path
             
-            print("Subprocess.run() completed!")
-            print(f"Subprocess return code: {result.returncode}")
-            print(f"Subprocess stdout length: {len(result.stdout) if result.stdout else 0} chars")
-            print(f"Subprocess stdout preview: {result.stdout[:200] if result.stdout else 'Empty'}")
+            ydl_opts = {
+                'format': format_selector,
+                'outtmpl': output_path,
+                'concurrent_fragment_downloads': self.concurrent_fragments,
+                'quiet': False,
+                'no_warnings': False,
+            }
             
-            if result.returncode != 0:
-                raise Exception(f"Whisper subprocess failed: {result.stderr}")
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
             
-            # Parse JSON output
-            output_data = json.loads(result.stdout)
+            return output_path
+    
+    def fetch_captions(self, url: str):
+        """(segments, track) from the source's own caption track, or None (see platform_captions)
+
+        Never fails the job: any error means the audio is transcribed as usual.
+        """
+        if self.platform_captions not in ('manual', 'auto'):
+            return None
+        with span('platform_captions', mode=self.platform_captions) as attrs:
+            try:
+                captions = platform_captions.fetch_captions(url, self.platform_captions)
+            except Exception as e:
+                log.warning('Platform captions lookup failed', error=str(e))
+                captions = None
+            attrs['found'] = bool(captions)
+            if captions:
+                attrs.update(language=captions[1]['language'], automatic=captions[1]['automatic'],
+                             segments=len(captions[0]))
+        return captions
+    
+    def download_video_and_captions(self, url: str, output_path: str):
+        """Download the video while its caption tracks are looked up alongside
+
+        Returns fetch_captions' result.
+        """
+        if self.platform_captions not in ('manual', 'auto'):
+            self.download_video(url, output_path)
+            return None
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='captions') as pool:
+            captions = pool.submit(contextvars.copy_context().run, self.fetch_captions, url)
+            self.download_video(url, output_path)
+            return captions.result()
+    
+    def download_audio(self, url: str, output_path: str) -> str:
+        """Download only the audio stream using yt-dlp (no video bandwidth)"""
+        format_selector = 'bestaudio[ext=m4a]/bestaudio/best'
+        return self._download(url, output_path, format_selector, 'audio')
+    
+    def extract_audio(self, video_path: str, audio_path: str) -> str:
+        """Decode the audio track once with FFmpeg to 16 kHz mono float32 PCM (see pcm_audio)"""
+        cmd = ['ffmpeg', '-i', video_path] + pcm_audio.ffmpeg_output_args(audio_path)
+        
+        with span('extract_audio', source=os.path.basename(video_path)) as attrs:
+            resource_usage.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            attrs['audio_bytes'] = os.path.getsize(audio_path)
+        return audio_path
+    
+    def transcribe_audio(self, audio_path: str, language: str = None) -> Tuple[List[Dict], str]:
+        """Transcribe audio using Whisper (local, FREE!) - runs in subprocess to avoid fork issues
+
+        Uses the resident Whisper process when warm_up() started one, otherwise a one-shot
+        subprocess that loads the model for this file only.
+        language (a Whisper code such as 'en') skips Whisper's own language detection. Without
+        it, the resident process first identifies the language from the first 30 s with
+        language_detect_model and transcribes with it when the probability is high enough.
+        """
+        with span('asr', model='base', audio_bytes=os.path.getsize(audio_path), language_hint=language,
+                  resident=bool(self.whisper_worker)) as attrs:
+            try:
+                if self.whisper_worker:
+                    request = {'audio': audio_path, 'model': 'base', 'language': language}
+                    if not language and self.language_detect_model:
+                        request.update(detect_model=self.language_detect_model,
+                                       detect_min_probability=self.language_detect_min_probability)
+                    output_data = self.whisper_worker.request(timeout=300, **request)
+                else:
+                    output_data = self._transcribe_one_shot(audio_path, language)
+            except subprocess.TimeoutExpired:
+                log.error('Whisper transcription timed out', timeout_seconds=300)
+                raise Exception("Transcription timed out")
             
             if not output_data.get('success'):
                 raise Exception(f"Whisper error: {output_data.get('error')}")
             
+            self._log_language_id(output_data.get('language_id'), attrs)
             transcription_segments = output_data['segments']
             detected_language = output_data['detected_language']
-            
-            print(f"Transcription complete! Detected language: {detected_language}")
-            print(f"Segments: {len(transcription_segments)}")
-            
-            return transcription_segments, detected_language
-            
-        except subprocess.TimeoutExpired:
-            print("ERROR: Whisper transcription timed out after 5 minutes")
-            raise Exception("Transcription timed out")
+            attrs.update(language=detected_language, segments=len(transcription_segments))
+        
+        log.info('Transcription complete', language=detected_language, segments=len(transcription_segments))
+        return transcription_segments, detected_language
+    
+    def _log_language_id(self, language_id: Optional[dict], attrs: dict):
+        """Record the first-window language ID that ran before transcription"""
+        if not language_id:
+            return
+        if 'error' in language_id:
+            log.warning('Language detection failed', error=language_id['error'])
+            return
+        language, probability = language_id['language'], round(language_id['probability'], 3)
+        attrs.update(language_id=language, language_id_probability=probability)
+        if probability < self.language_detect_min_probability:
+            log.info('Language detection inconclusive', language=language, probability=probability)
+        else:
+            log.info('Language detected', language=language, probability=probability)
+    
+    def _transcribe_one_shot(self, audio_path: str, language: str = None) -> dict:
+        """Run whisper_subprocess.py for one file (loads the model every time)"""
+        import json
+        import sys
+        
+        script_path = os.path.join(os.path.dirname(__file__), 'whisper_subprocess.py')
+        cmd = [sys.executable, script_path, audio_path, 'base'] + ([language] if language else [])
+        
+        # Run Whisper in a subprocess to avoid PyTorch/fork issues
+        result = resource_usage.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,  # Ignore Whisper's progress bars
+            text=True,
+            timeout=300  # 5 minutes max
+        )
+        
+        if result.returncode != 0:
+            log.error('Whisper subprocess failed', returncode=result.returncode,
+                      stdout_preview=(result.stdout or '')[:200])
+            raise Exception(f"Whisper subprocess failed with exit code {result.returncode}")
+        
+        # Parse JSON output
+        return json.loads(result.stdout)
+    
+    def transcribe_cached(self, audio_path: str) -> Tuple[List[Dict], str, bool]:
+        """Transcribe, reusing the result of a near-identical audio track when cached
+
+        Returns (segments, detected_language, cache_hit). On a cache miss the language is
+        identified from the first 30 s first, by the process that then transcribes.
+        """
+        if not self.transcript_cache:
+            return (*self.transcribe_audio(audio_path), False)
+        
+        # A broken cache must never fail the job; fall back to Whisper
+        fingerprint = None
+        try:
+            with span('transcript_cache_lookup') as attrs:
+                fingerprint = compute_fingerprint(audio_path)
+                cached = self.transcript_cache.lookup(fingerprint)
+                attrs['cache_hit'] = bool(cached)
+            if cached:
+                return (*cached, True)
         except Exception as e:
-            print(f"ERROR in transcribe_audio: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise
+            log.warning('Transcript cache lookup failed', error=str(e))
+        
+        segments, detected_language = self.transcribe_audio(audio_path)
+        
+        if fingerprint is not None:
+            try:
+                self.transcript_cache.store(fingerprint, segments, detected_language)
+            except Exception as e:
+                log.warning('Transcript cache store failed', error=str(e))
+        
+        return segments, detected_language, False
     
     def translate_text(self, text: str, target_language: str = 'Persian') -> str:
         """Translate text using Gemini"""
+        if target_language != 'Persian':
+            prompt = f"""You are a professional subtitle translator. Translate the following text to natural, conversational {target_language}.
+
+RULES:
+1. Use the everyday spoken register, not formal or literary language
+2. Keep sentences short so they read well as subtitles
+3. Avoid overly literal translations; keep the tone of the original
+4. Keep names, acronyms and technical terms that must stay as they are unchanged
+5. Keep every "---" separator line exactly where it is
+6. NO explanations or notes - ONLY return the {target_language} translation
+
+Original text:
+"{text}"
+
+{target_language} translation:"""
+            return self._clean_translation(self._generate_content(prompt), text)
+        
         prompt = f"""You are a professional Persian translator for video subtitles. Translate the following English text to natural, conversational Persian (Farsi).
 
 CRITICAL TRANSLATION RULES:
@@ -175,26 +425,31 @@ Original text:
 
 Natural Persian translation:"""
         
+        return self._clean_translation(self._generate_content(prompt), text)
+    
+    def _clean_translation(self, response, text: str) -> str:
+        """Response text without markdown; the original text if Gemini blocked it"""
         try:
-            response = self.gemini_model.generate_content(prompt)
             translation = response.text.strip()
-            
-            # Clean up any markdown formatting
-            translation = translation.replace('**', '').replace('*', '')
-            
-            return translation
-        except Exception as e:
-            print(f"Translation error: {type(e).__name__}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return text  # Fallback to original text
+        except ValueError as e:
+            # response.text raises ValueError when Gemini blocked the content;
+            # keep the original line rather than failing the whole job
+            log.warning('Translation blocked, keeping original text', error=str(e))
+            self._count('fallbacks')
+            return text
+        
+        # Clean up any markdown formatting
+        translation = translation.replace('**', '').replace('*', '')
+        
+        return translation
     
-    def translate_segments(self, segments: List[Dict], target_language: str = 'Persian') -> List[Dict]:
+    def translate_segments(self, segments: List[Dict], target_language: str = 'Persian',
+                           status_callback=None) -> List[Dict]:
         """Translate all transcription segments using Gemini"""
         translated_segments = []
         
         total_segments = len(segments)
-        print(f"Translating {total_segments} segments to {target_language}...")
+        log.info('Translating segments', language=target_language, segments=total_segments)
         
         # Batch segments for more efficient translation
         batch_size = 20
@@ -203,23 +458,22 @@ Natural Persian translation:"""
         for batch_num, i in enumerate(range(0, len(segments), batch_size), 1):
             batch = segments[i:i+batch_size]
             
-            print(f"Processing batch {batch_num}/{total_batches} (segments {i+1}-{min(i+batch_size, total_segments)})...")
-            
-            # Combine batch for context-aware translation
-            batch_text = "\n---\n".join([seg['text'] for seg in batch])
-            
-            # Translate the batch
-            print(f"Sending batch {batch_num} to Gemini API...")
-            translated_batch = self.translate_text(batch_text, target_language)
-            print(f"Batch {batch_num} translation received!")
-            
-            # Split back into segments
-            translated_texts = translated_batch.split("\n---\n")
-            
-            # Ensure we have the right number of translations
-            if len(translated_texts) != len(batch):
-                # Fallback: translate individually
-                translated_texts = [self.translate_text(seg['text'], target_language) for seg in batch]
+            with span('translate_batch', language=target_language, batch=batch_num,
+                      total_batches=total_batches, segments=len(batch)) as attrs:
+                # Combine batch for context-aware translation
+                batch_text = "\n---\n".join([seg['text'] for seg in batch])
+                
+                # Translate the batch
+                translated_batch = self.translate_text(batch_text, target_language)
+                
+                # Split back into segments
+                translated_texts = translated_batch.split("\n---\n")
+                
+                # Ensure we have the right number of translations
+                if len(translated_texts) != len(batch):
+                    # Fallback: translate individually
+                    attrs['fallback_per_segment'] = True
+                    translated_texts = [self.translate_text(seg['text'], target_language) for seg in batch]
             
             # Add to results
             for seg, trans_text in zip(batch, translated_texts):
@@ -228,154 +482,426 @@ Natural Persian translation:"""
                     'end': seg['end'],
                     'text': trans_text.strip()
                 })
+            
+            # Report progress together with throttling / retry counters
+            if status_callback:
+                if target_language == 'Persian':
+                    message = f'در حال ترجمه به فارسی... ({batch_num}/{total_batches})'
+                else:
+                    message = f'در حال ترجمه به {target_language}... ({batch_num}/{total_batches})'
+                status_callback('translating', message, translation_stats=dict(self.translation_stats))
         
-        print("Translation complete!")
+        log.info('Translation complete', language=target_language, batches=total_batches)
         return translated_segments
     
+    def translate_languages(self, segments: List[Dict], languages: List[str],
+                            status_callback=None, source_language: str = None) -> Dict[str, List[Dict]]:
+        """Translate one transcription into several languages concurrently
+
+        Returns {language code: translated segments}. A target equal to source_language
+        gets the transcription itself (no Gemini calls). All threads share the
+        Redis rate limiter, so concurrency never exceeds the Gemini quota.
+        """
+        translations = {
+            code: [dict(seg) for seg in segments] for code in languages if code == source_language
+        }
+        if translations:
+            log.info('Skipping translation, source already in target language', language=source_language)
+        pending = [code for code in languages if code not in translations]
+        
+        if len(pending) == 1:
+            code = pending[0]
+            translations[code] = self.translate_segments(segments, language_name(code), status_callback)
+        elif pending:
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='translate') as pool:
+                # copy_context() keeps the task_id (log / trace correlation) in the worker threads
+                futures = {
+                    code: pool.submit(contextvars.copy_context().run, self.translate_segments,
+                                      segments, language_name(code), status_callback)
+                    for code in pending
+                }
+                translations.update({code: future.result() for code, future in futures.items()})
+        
+        return {code: translations[code] for code in languages}
+    
     def format_timestamp_srt(self, seconds: float) -> str:
         """Format seconds to SRT timestamp format (HH:MM:SS,mmm)"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        millis = int((seconds % 1) * 1000)
-        
-        return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+        return subtitle_writer.format_timestamp_srt(seconds)
     
     def format_timestamp_ass(self, seconds: float) -> str:
         """Format seconds to ASS timestamp format (H:MM:SS.cc)"""
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        centisecs = int((seconds % 1) * 100)
-        
-        return f"{hours}:{minutes:02d}:{secs:02d}.{centisecs:02d}"
+        return subtitle_writer.format_timestamp_ass(seconds)
     
     def generate_srt(self, segments: List[Dict], output_path: str) -> str:
-        """Generate SRT subtitle file"""
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for i, segment in enumerate(segments, 1):
-                f.write(f"{i}\n")
-                f.write(f"{self.format_timestamp_srt(segment['start'])} --> {self.format_timestamp_srt(segment['end'])}\n")
-                # Apply bidi fix to text before writing
-                fixed_text = fix_bidi_text(segment['text'])
-                f.write(f"{fixed_text}\n\n")
-        
-        return output_path
+        """Generate SRT subtitle file (bidi-fixed)"""
+        return subtitle_writer.write_subtitles(segments, output_path, 'srt')
     
     def generate_ass(self, segments: List[Dict], output_path: str) -> str:
-        """Generate ASS subtitle file with Persian-friendly styling"""
-        # ASS header with Persian font settings
-        # BackColour: &H66000000 = 40% transparent black background (66 hex = 102 decimal)
-        # BorderStyle=4 for background box (valid values: 1, 3, 4)
-        # Outline=4 for thicker outline
-        # Using Vazirmatn font for better Persian text rendering
-        # Font size: 70 (35% increase from 52)
-        ass_header = """[Script Info]
-Title: Auto-generated Persian Subtitles (Gemini AI)
-ScriptType: v4.00+
-WrapStyle: 0
-PlayResX: 1920
-PlayResY: 1080
-ScaledBorderAndShadow: yes
-
-[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,Vazirmatn,70,&H00FFFFFF,&H000088EF,&H00000000,&H66000000,-1,0,0,0,100,100,0,0,4,4,0,2,10,10,10,178
-
-[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-"""
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(ass_header)
-            
-            for segment in segments:
-                start = self.format_timestamp_ass(segment['start'])
-                end = self.format_timestamp_ass(segment['end'])
-                # Apply bidi fix before replacing newlines
-                fixed_text = fix_bidi_text(segment['text'])
-                text = fixed_text.replace('\n', '\\N')
-                
-                f.write(f"Dialogue: 0,{start},{end},Default,,0,0,0,,{text}\n")
-        
-        return output_path
+        """Generate ASS subtitle file with Persian-friendly styling (bidi-fixed)"""
+        return subtitle_writer.write_subtitles(segments, output_path, 'ass')
     
-    def burn_subtitles(self, video_path: str, subtitle_path: str, output_path: str) -> str:
-        """Burn subtitles into video using FFmpeg"""
+    def generate_vtt(self, segments: List[Dict], output_path: str) -> str:
+        """Generate WebVTT subtitle file (bidi-fixed)"""
+        return subtitle_writer.write_subtitles(segments, output_path, 'vtt')
+    
+    def burn_subtitles(self, video_path: str, subtitle_path: str, output_path: str,
+                       hls_dir: str = None) -> str:
+        """Burn subtitles into video using FFmpeg
+        
+        With hls_dir, the encode is written as an HLS event playlist (HLS_PLAYLIST) and
+        segments that grow while ffmpeg runs, then remuxed (no re-encode) into output_path.
+        With smart_render (MP4 output, ASS subtitles), only the GOPs that show a subtitle
+        are re-encoded; see smart_render.py.
+        """
         # Determine subtitle format
         subtitle_ext = os.path.splitext(subtitle_path)[1].lower()
         
         if subtitle_ext == '.ass':
             # For ASS subtitles
-            cmd = [
-                'ffmpeg',
-                '-i', video_path,
-                '-vf', f"ass={subtitle_path}",
-                '-c:a', 'copy',
-                '-y',
-                output_path
-            ]
+            video_filter = f"ass={subtitle_path}"
         else:
             # For SRT subtitles
+            video_filter = f"subtitles={subtitle_path}:force_style='FontName=Arial,FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,Outline=2'"
+        
+        if not hls_dir and self.smart_render and subtitle_ext == '.ass':
+            work_dir = tempfile.mkdtemp(prefix='smart_render_', dir=os.path.dirname(subtitle_path))
+            try:
+                with span('burn', subtitles=os.path.basename(subtitle_path), mode='smart') as attrs:
+                    stats = smart_render.smart_burn(video_path, subtitle_path, output_path, work_dir)
+                    attrs.update(stats or {'applicable': False})
+                if stats:
+                    return output_path
+            except Exception as e:
+                # Anything unexpected in the source: burn the whole video instead
+                log.warning('Smart render failed, burning the whole video', error=str(e))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        
+        if not hls_dir:
             cmd = [
                 'ffmpeg',
                 '-i', video_path,
-                '-vf', f"subtitles={subtitle_path}:force_style='FontName=Arial,FontSize=24,PrimaryColour=&H00FFFFFF,OutlineColour=&H00000000,Outline=2'",
+                '-vf', video_filter,
                 '-c:a', 'copy',
                 '-y',
                 output_path
             ]
+            with span('burn', subtitles=os.path.basename(subtitle_path)):
+                resource_usage.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return output_path
+        
+        os.makedirs(hls_dir, exist_ok=True)
+        playlist_path = os.path.join(hls_dir, self.HLS_PLAYLIST)
+        segment_seconds = self.hls_segment_seconds
+        cmd = [
+            'ffmpeg',
+            '-i', video_path,
+            '-vf', video_filter,
+            # A keyframe at every segment boundary keeps segments the same length
+            '-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})',
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            '-f', 'hls',
+            '-hls_time', str(segment_seconds),
+            '-hls_playlist_type', 'event',  # Segments are only appended; ENDLIST when done
+            '-hls_flags', 'independent_segments+temp_file',  # Never serve a half-written segment
+            '-hls_segment_filename', os.path.join(hls_dir, 'segment_%05d.ts'),
+            '-y',
+            playlist_path
+        ]
+        remux_cmd = [
+            'ffmpeg',
+            '-i', playlist_path,
+            '-c', 'copy',
+            '-bsf:a', 'aac_adtstoasc',
+            '-movflags', '+faststart',
+            '-y',
+            output_path
+        ]
+        
+        try:
+            with span('burn', subtitles=os.path.basename(subtitle_path), hls=True):
+                resource_usage.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with span('remux'):
+                resource_usage.run(remux_cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception:
+            shutil.rmtree(hls_dir, ignore_errors=True)
+            raise
+        return output_path
+    
+    def render_preview(self, video_path: str, subtitle_path: str, output_path: str) -> str:
+        """Quick low-resolution proxy with the ASS subtitles burned in (ultrafast preset)"""
+        cmd = [
+            'ffmpeg',
+            '-i', video_path,
+            # Scale down first so the encode and subtitle rendering work on small frames
+            '-vf', f"scale=-2:min(ih\\,{self.preview_height}),ass={subtitle_path}",
+            '-c:v', 'libx264',
+            '-preset', 'ultrafast',
+            '-crf', '30',
+            '-c:a', 'aac',
+            '-b:a', '96k',
+            '-movflags', '+faststart',  # Playable while the browser is still fetching it
+            '-y',
+            output_path
+        ]
+        
+        with span('preview', height=self.preview_height):
+            resource_usage.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return output_path
+    
+    def burn_with_preview(self, video_path: str, subtitle_path: str, output_path: str,
+                          preview_path: str, status_callback=None, hls_dir: str = None) -> str:
+        """Burn the full-resolution video while a preview proxy is rendered alongside
+        
+        The proxy finishes well before the full burn; status_callback is called with
+        preview_file as soon as it is ready. A failed preview never fails the job.
+        With hls_dir the burn is written as HLS, and status_callback gets hls_playlist
+        once the first segment is playable.
+        """
+        helpers = []
+        burn_done = threading.Event()
+        
+        if self.preview_height:
+            def render():
+                try:
+                    self.render_preview(video_path, subtitle_path, preview_path)
+                except Exception as e:
+                    log.warning('Preview proxy failed', error=str(e))
+                    return
+                if status_callback:
+                    status_callback('burning_subtitles', 'مرحله ۵/۵: پیش‌نمایش آماده است، در حال چسباندن زیرنویس...',
+                                    preview_file=preview_path)
+            helpers.append(render)
+        
+        if hls_dir and status_callback:
+            def watch_playlist():
+                # ffmpeg writes the playlist after the first complete segment
+                playlist_path = os.path.join(hls_dir, self.HLS_PLAYLIST)
+                while not burn_done.wait(0.5):
+                    if os.path.exists(playlist_path):
+                        status_callback('burning_subtitles', 'مرحله ۵/۵: پخش آنلاین آغاز شد، در حال چسباندن زیرنویس...',
+                                        hls_playlist=playlist_path)
+                        return
+            helpers.append(watch_playlist)
+        
+        threads = []
+        for helper in helpers:
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(helper,),
+                                      name=helper.__name__, daemon=True)
+            thread.start()
+            threads.append(thread)
+        
+        try:
+            return self.burn_subtitles(video_path, subtitle_path, output_path, hls_dir=hls_dir)
+        finally:
+            # Their status updates must land before the job is marked completed
+            burn_done.set()
+            for thread in threads:
+                thread.join()
+    
+    def mux_subtitles(self, video_path: str, subtitle_paths: Dict[str, str], output_path: str) -> str:
+        """Add one soft subtitle track per language to an MKV (streams copied, no re-encode)
+
+        subtitle_paths maps language code -> ASS file; the first one is the default track.
+        """
+        cmd = ['ffmpeg', '-i', video_path]
+        for path in subtitle_paths.values():
+            cmd += ['-i', path]
+        
+        cmd += ['-map', '0:v', '-map', '0:a?']
+        for index in range(len(subtitle_paths)):
+            cmd += ['-map', f'{index + 1}:0']
+        cmd += ['-c', 'copy']
+        
+        for index, code in enumerate(subtitle_paths):
+            iso_code = LANGUAGES.get(code, {}).get('iso639_2', 'und')
+            cmd += [
+                f'-metadata:s:s:{index}', f'language={iso_code}',
+                f'-metadata:s:s:{index}', f'title={language_name(code)}',
+                f'-disposition:s:{index}', 'default' if index == 0 else '0',
+            ]
+        cmd += ['-y', output_path]
         
-        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with span('mux', tracks=list(subtitle_paths)):
+            resource_usage.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         return output_path
     
+    def _translation_message(self, step: str, languages: List[str], source_language: str = None) -> str:
+        if languages == [source_language]:
+            return f'{step}: زبان ویدئو با زبان مقصد یکسان است، ترجمه لازم نیست'
+        if languages == [DEFAULT_LANGUAGE]:
+            return f'{step}: در حال ترجمه به فارسی...'
+        return f'{step}: در حال ترجمه به {len(languages)} زبان ({", ".join(languages)})...'
+    
     def process_video(self, url: str, temp_dir: str, output_dir: str, 
-                     status_callback=None) -> Dict:
-        """Complete video processing pipeline using Whisper + Gemini"""
+                     status_callback=None, source_path: str = None, languages: List[str] = None) -> Dict:
+        """Complete video processing pipeline using Whisper + Gemini
+
+        If source_path is given (an uploaded file) the download step is skipped.
+        One language is burned in, with a low-resolution preview proxy rendered alongside
+        (reported through status_callback as preview_file); several languages are translated concurrently
+        from the same transcription and muxed as soft subtitle tracks into an MKV.
+        """
         try:
             video_id = os.path.basename(temp_dir)
+            self.reset_translation_stats()
+            languages = list(languages or [DEFAULT_LANGUAGE])
+            multi_track = len(languages) > 1
             
             # Paths
-            video_path = os.path.join(temp_dir, f"{video_id}.mp4")
-            audio_path = os.path.join(temp_dir, f"{video_id}.wav")
+            video_path = source_path or os.path.join(temp_dir, f"{video_id}.mp4")
+            audio_path = os.path.join(temp_dir, f"{video_id}{pcm_audio.EXTENSION}")
             subtitle_path = os.path.join(temp_dir, f"{video_id}.ass")
-            output_path = os.path.join(output_dir, f"{video_id}_subtitled.mp4")
+            output_path = os.path.join(output_dir, f"{video_id}_subtitled.{'mkv' if multi_track else 'mp4'}")
+            preview_path = os.path.join(output_dir, f"{video_id}_preview.mp4")
             
-            # Step 1: Download video
-            if status_callback:
-                status_callback('downloading', 'مرحله ۱/۵: در حال دانلود ویدئو...')
-            self.download_video(url, video_path)
+            # Step 1: Download video and look up its captions (uploaded files are already local)
+            captions = None
+            if not source_path:
+                if status_callback:
+                    status_callback('downloading', 'مرحله ۱/۵: در حال دانلود ویدئو...')
+                captions = self.download_video_and_captions(url, video_path)
             
-            # Step 2: Extract audio and transcribe (Whisper)
-            if status_callback:
-                status_callback('transcribing', 'مرحله ۲/۵: در حال رونویسی صوتی...')
-            self.extract_audio(video_path, audio_path)
-            segments, detected_language = self.transcribe_audio(audio_path)
+            # Step 2: Use the source's captions, or extract audio and transcribe (Whisper)
+            if captions:
+                if status_callback:
+                    status_callback('transcribing', 'مرحله ۲/۵: استفاده از زیرنویس خود ویدئو (بدون رونویسی)...')
+                segments, caption_track = captions
+                detected_language, transcript_cache_hit = caption_track['language'], False
+            else:
+                if status_callback:
+                    status_callback('transcribing', 'مرحله ۲/۵: در حال رونویسی صوتی...')
+                caption_track = None
+                self.extract_audio(video_path, audio_path)
+                segments, detected_language, transcript_cache_hit = self.transcribe_cached(audio_path)
             
-            # Step 3: Translate to Persian (Gemini)
+            # Step 3: Translate (Gemini), every target language from the same transcription
             if status_callback:
-                status_callback('translating', 'مرحله ۳/۵: در حال ترجمه به فارسی...')
-            translated_segments = self.translate_segments(segments, 'Persian')
+                status_callback('translating', self._translation_message('مرحله ۳/۵', languages, detected_language))
+            translations = self.translate_languages(segments, languages, status_callback, detected_language)
             
-            # Step 4: Generate subtitle file
+            # Step 4: Generate subtitle files
             if status_callback:
                 status_callback('generating_subtitles', 'مرحله ۴/۵: در حال ساخت فایل زیرنویس...')
-            self.generate_ass(translated_segments, subtitle_path)
+            with span('generate_subtitles', languages=languages, formats=['ass']):
+                if multi_track:
+                    subtitle_paths = {}
+                    for code in languages:
+                        subtitle_paths[code] = os.path.join(temp_dir, f"{video_id}.{code}.ass")
+                        subtitle_writer.write_subtitles(translations[code], subtitle_paths[code], 'ass',
+                                                        bidi=is_rtl(code))
+                else:
+                    subtitle_writer.write_subtitles(translations[languages[0]], subtitle_path, 'ass',
+                                                    bidi=is_rtl(languages[0]))
             
-            # Step 5: Burn subtitles
-            if status_callback:
-                status_callback('burning_subtitles', 'مرحله ۵/۵: در حال چسباندن زیرنویس...')
-            self.burn_subtitles(video_path, subtitle_path, output_path)
+            # Step 5: Burn one language, or mux all languages as soft tracks (no re-encode)
+            if multi_track:
+                if status_callback:
+                    status_callback('burning_subtitles', 'مرحله ۵/۵: در حال افزودن زیرنویس‌ها به ویدئو...')
+                self.mux_subtitles(video_path, subtitle_paths, output_path)
+            else:
+                if status_callback:
+                    status_callback('burning_subtitles', 'مرحله ۵/۵: در حال چسباندن زیرنویس...')
+                hls_dir = os.path.join(output_dir, f"{video_id}_hls") if self.hls_segment_seconds else None
+                self.burn_with_preview(video_path, subtitle_path, output_path, preview_path, status_callback,
+                                       hls_dir=hls_dir)
             
             return {
                 'success': True,
                 'output_file': output_path,
+                'languages': languages,
+                'detected_language': detected_language,
+                'segments_count': len(segments),
+                'transcript_cache_hit': transcript_cache_hit,
+                'asr_skipped': caption_track is not None,
+                'caption_track': caption_track,
+                'translation_skipped': [code for code in languages if code == detected_language],
+                'translation_stats': dict(self.translation_stats)
+            }
+        
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'translation_stats': dict(self.translation_stats)
+            }
+    
+    def process_subtitles(self, url: str, temp_dir: str, output_dir: str,
+                          status_callback=None, formats=('srt', 'ass', 'vtt'),
+                          source_path: str = None, languages: List[str] = None) -> Dict:
+        """Subtitles-only pipeline: audio download, Whisper, Gemini, subtitle files (no video, no burn)
+
+        If source_path is given (an uploaded file) the download step is skipped.
+        With several languages, files are named {video_id}.{lang}.{fmt}; subtitle_files
+        holds the first language and subtitle_tracks all of them.
+        """
+        try:
+            video_id = os.path.basename(temp_dir)
+            self.reset_translation_stats()
+            languages = list(languages or [DEFAULT_LANGUAGE])
+            
+            # Paths
+            source_audio_path = source_path or os.path.join(temp_dir, f"{video_id}.audio")
+            audio_path = os.path.join(temp_dir, f"{video_id}{pcm_audio.EXTENSION}")
+            
+            # Step 1: The source's own captions make the audio unnecessary; otherwise download
+            # audio only (uploaded files are already local)
+            captions = None if source_path else self.fetch_captions(url)
+            if not source_path and not captions:
+                if status_callback:
+                    status_callback('downloading', 'مرحله ۱/۴: در حال دانلود صدا...')
+                self.download_audio(url, source_audio_path)
+            
+            # Step 2: Use the source's captions, or extract audio and transcribe (Whisper)
+            if captions:
+                if status_callback:
+                    status_callback('transcribing', 'مرحله ۲/۴: استفاده از زیرنویس خود ویدئو (بدون رونویسی)...')
+                segments, caption_track = captions
+                detected_language, transcript_cache_hit = caption_track['language'], False
+            else:
+                if status_callback:
+                    status_callback('transcribing', 'مرحله ۲/۴: در حال رونویسی صوتی...')
+                caption_track = None
+                self.extract_audio(source_audio_path, audio_path)
+                segments, detected_language, transcript_cache_hit = self.transcribe_cached(audio_path)
+            
+            # Step 3: Translate (Gemini), every target language from the same transcription
+            if status_callback:
+                status_callback('translating', self._translation_message('مرحله ۳/۴', languages, detected_language))
+            translations = self.translate_languages(segments, languages, status_callback, detected_language)
+            
+            # Step 4: Write subtitle files straight to the output folder
+            if status_callback:
+                status_callback('generating_subtitles', 'مرحله ۴/۴: در حال ساخت فایل زیرنویس...')
+            subtitle_tracks = {}
+            with span('generate_subtitles', languages=languages, formats=list(formats)):
+                for code in languages:
+                    # Single-language jobs keep the original {video_id}.{fmt} names
+                    stem = f"{video_id}.{code}" if len(languages) > 1 else video_id
+                    subtitle_tracks[code] = {}
+                    for fmt in formats:
+                        subtitle_path = os.path.join(output_dir, f"{stem}.{fmt}")
+                        subtitle_writer.write_subtitles(translations[code], subtitle_path, fmt, bidi=is_rtl(code))
+                        subtitle_tracks[code][fmt] = subtitle_path
+            
+            return {
+                'success': True,
+                'subtitle_files': subtitle_tracks[languages[0]],
+                'subtitle_tracks': subtitle_tracks,
+                'languages': languages,
                 'detected_language': detected_language,
-                'segments_count': len(segments)
+                'segments_count': len(segments),
+                'transcript_cache_hit': transcript_cache_hit,
+                'asr_skipped': caption_track is not None,
+                'caption_track': caption_track,
+                'translation_skipped': [code for code in languages if code == detected_language],
+                'translation_stats': dict(self.translation_stats)
             }
         
         except Exception as e:
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'translation_stats': dict(self.translation_stats)
             }
@@ -1,18 +1,58 @@
 """
 Standalone Whisper transcriber that runs in a separate process
 This avoids PyTorch/fork issues with Celery
+
+Usage: whisper_subprocess.py <audio_file> [model_name] [language]
+       whisper_subprocess.py --serve [model_name ...]
+
+--serve keeps the models loaded and answers one JSON request per stdin line
+(see whisper_worker.py) with one JSON reply per stdout line. It can identify the
+language from the first 30 s window before transcribing, in the same process.
 """
 import whisper
 import sys
 import json
 import warnings
 import os
+import numpy as np
+import pcm_audio
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
 
-def transcribe_file(audio_path, model_name="base"):
-    """Transcribe audio file and return JSON result"""
+def load_audio(audio_path):
+    """Decoded PCM from extract_audio is memory-mapped and handed over as an array,
+    so Whisper does not run ffmpeg on it again; other files are decoded by Whisper"""
+    return pcm_audio.load(audio_path) if audio_path.endswith(pcm_audio.EXTENSION) else audio_path
+
+def transcribe(model, audio_path, language=None):
+    """Run a loaded model over the file; returns the JSON-ready result"""
+    # Transcribe with verbose=False to avoid progress bars
+    result = model.transcribe(
+        load_audio(audio_path),
+        language=language,
+        task='transcribe',
+        verbose=False,
+        fp16=False  # Explicitly disable FP16 to avoid warnings
+    )
+    
+    # Extract segments
+    segments = []
+    for segment in result.get('segments', []):
+        segments.append({
+            'start': segment['start'],
+            'end': segment['end'],
+            'text': segment['text'].strip()
+        })
+    
+    return {
+        'success': True,
+        'segments': segments,
+        'detected_language': result.get('language', 'unknown')
+    }
+
+def transcribe_file(audio_path, model_name="base", language=None):
+    """Transcribe audio file and return JSON result (language=None: Whisper detects it)"""
     try:
         # Save original stdout/stderr
         original_stdout = sys.stdout
@@ -26,35 +66,13 @@ def transcribe_file(audio_path, model_name="base"):
         # Load model silently
         model = whisper.load_model(model_name)
         
-        # Transcribe with verbose=False to avoid progress bars
-        result = model.transcribe(
-            audio_path,
-            language=None,
-            task='transcribe',
-            verbose=False,
-            fp16=False  # Explicitly disable FP16 to avoid warnings
-        )
+        output = transcribe(model, audio_path, language)
         
         # Restore stdout
         sys.stdout = original_stdout
         sys.stderr = original_stderr
         devnull.close()
         
-        # Extract segments
-        segments = []
-        for segment in result.get('segments', []):
-            segments.append({
-                'start': segment['start'],
-                'end': segment['end'],
-                'text': segment['text'].strip()
-            })
-        
-        output = {
-            'success': True,
-            'segments': segments,
-            'detected_language': result.get('language', 'unknown')
-        }
-        
         # Print JSON to stdout
         print(json.dumps(output), flush=True)
         return 0
@@ -75,12 +93,86 @@ def transcribe_file(audio_path, model_name="base"):
         print(json.dumps(error_output), flush=True)
         return 1
 
+def detect_language(model, audio_path):
+    """(language, probability) from the first 30 s window only (no decoding pass)"""
+    # Only the pages of the first window are read from the memory-mapped PCM
+    audio = load_audio(audio_path)
+    if isinstance(audio, str):
+        audio = whisper.load_audio(audio)
+    audio = whisper.pad_or_trim(np.asarray(audio[:whisper.audio.N_SAMPLES], dtype=np.float32))
+    mel = whisper.log_mel_spectrogram(audio, n_mels=model.dims.n_mels).to(model.device)
+    
+    _, probs = model.detect_language(mel)
+    language = max(probs, key=probs.get)
+    return language, float(probs[language])
+
+def serve(model_names):
+    """Load the models once, then transcribe one request per stdin line until EOF
+
+    Request: {"audio": path, "model": name (default: the first), "language": code or null,
+              "detect_model": name, "detect_min_probability": p}
+    With detect_model and no language, the language is identified from the first window
+    and used for the transcription when its probability is at least detect_min_probability;
+    the reply then also carries {"language_id": {"language", "probability"}}.
+    """
+    # Replies keep the real stdout; anything Whisper or PyTorch prints goes to stderr
+    replies = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    
+    def reply(output):
+        replies.write(json.dumps(output) + '\n')
+        replies.flush()
+    
+    models = {}
+    
+    def get_model(name):
+        if name not in models:
+            models[name] = whisper.load_model(name)
+        return models[name]
+    
+    try:
+        for name in model_names:
+            get_model(name)
+    except Exception as e:
+        reply({'success': False, 'error': str(e)})
+        return 1
+    reply({'success': True, 'models': list(models)})
+    
+    # The worker closes stdin (or dies) to stop the loop
+    for line in sys.stdin:
+        try:
+            request = json.loads(line)
+            language = request.get('language')
+            language_id = None
+            if not language and request.get('detect_model'):
+                # A failed detection is not an error: Whisper then detects the language itself
+                try:
+                    detected, probability = detect_language(get_model(request['detect_model']), request['audio'])
+                    language_id = {'language': detected, 'probability': probability}
+                    if probability >= request.get('detect_min_probability', 0):
+                        language = detected
+                except Exception as e:
+                    language_id = {'error': str(e)}
+            
+            output = transcribe(get_model(request.get('model') or model_names[0]), request['audio'], language)
+            if language_id:
+                output['language_id'] = language_id
+        except Exception as e:
+            output = {'success': False, 'error': str(e)}
+        reply(output)
+    return 0
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        sys.exit(serve(sys.argv[2:] or ["base"]))
+    
     if len(sys.argv) < 2:
-        print(json.dumps({'success': False, 'error': 'Usage: python whisper_subprocess.py <audio_file> [model_name]'}))
+        print(json.dumps({'success': False, 'error': 'Usage: python whisper_subprocess.py <audio_file> [model_name] [language]'}))
         sys.exit(1)
     
     audio_path = sys.argv[1]
     model_name = sys.argv[2] if len(sys.argv) > 2 else "base"
+    language = sys.argv[3] if len(sys.argv) > 3 else None
     
-    sys.exit(transcribe_file(audio_path, model_name))
+    sys.exit(transcribe_file(audio_path, model_name, language))
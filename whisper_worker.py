@@ -0,0 +1,128 @@
+"""
+Resident Whisper process for one Celery worker process
+`whisper_subprocess.py --serve` loads the models once and then answers requests sent
+as JSON lines on stdin, one JSON line per reply on stdout, so jobs in this worker
+process do not reload the model. Whisper still runs in its own process (PyTorch must
+not be forked by Celery); a process that crashes or times out is replaced on the
+next request.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import resource_usage
+from tracing import get_logger
+
+log = get_logger('whisper_worker')
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'whisper_subprocess.py')
+
+
+class WhisperProcessError(Exception):
+    """The resident Whisper process failed to start or died during a request"""
+
+
+class ResidentWhisper:
+    """One long-lived whisper_subprocess.py --serve; requests are handled one at a time"""
+
+    def __init__(self, models: list, start_timeout: float = 600):
+        # The first model is the default; weights may need downloading on first start
+        self.models = [name for name in dict.fromkeys(models) if name]
+        self.start_timeout = start_timeout
+        self._proc = None
+        self._lock = threading.Lock()
+
+    @property
+    def pid(self) -> int:
+        return self._proc.pid if self._proc else None
+
+    def start(self):
+        """Start the process and wait until its models are loaded"""
+        with self._lock:
+            self._ensure_started()
+
+    def request(self, timeout: float, **payload) -> dict:
+        """Send one request and return its reply; raises subprocess.TimeoutExpired"""
+        with self._lock:
+            self._ensure_started()
+            try:
+                self._proc.stdin.write(json.dumps(payload) + '\n')
+                self._proc.stdin.flush()
+            except OSError as e:
+                self._stop()
+                raise WhisperProcessError(f'Whisper process is gone: {e}')
+            return self._read_reply(timeout)
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _ensure_started(self):
+        if self._proc and self._proc.poll() is None:
+            return
+        self._stop()
+
+        self._proc = subprocess.Popen(
+            [sys.executable, SCRIPT_PATH, '--serve'] + self.models,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,  # Ignore Whisper's progress bars
+            text=True
+        )
+        resource_usage.add_resident(self._proc.pid)
+
+        reply = self._read_reply(self.start_timeout)
+        if not reply.get('success'):
+            self._stop()
+            raise WhisperProcessError(f"Whisper models failed to load: {reply.get('error')}")
+        log.info('Resident Whisper process started', pid=self._proc.pid, models=self.models)
+
+    def _read_reply(self, timeout: float) -> dict:
+        proc = self._proc
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, _kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            line = proc.stdout.readline()
+        finally:
+            if timer:
+                timer.cancel()
+
+        if timed_out.is_set():
+            self._stop()
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        if not line:
+            self._stop()
+            raise WhisperProcessError(f'Whisper process exited with code {proc.returncode}')
+        try:
+            return json.loads(line)
+        except ValueError:
+            # Stray output on the reply channel: the protocol is out of sync
+            self._stop()
+            raise WhisperProcessError(f'Unexpected Whisper output: {line[:200]!r}')
+
+    def _stop(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        # Closing stdin ends the serve loop
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        resource_usage.remove_resident(proc.pid)
+        proc.stdout.close()